@@ -0,0 +1,35 @@
+"""
+The public names of the package are imported from their modules on first
+use (PEP 562), so that importing LISP, or a light module of it such as the
+parser, does not import NumPy and xDSL up front.
+"""
+import importlib
+
+# Name -> module it lives in
+_LAZY = {
+    "CompileCache": "compiler",
+    "CompileOptions": "compiler",
+    "CompileResult": "compiler",
+    "compile_files": "compiler",
+    "compile_source": "compiler",
+    "LispInterpreter": "interpreter",
+    "compile_program": "interpreter",
+    "evaluate_batch": "interpreter",
+    "Instrumentation": "instrumentation",
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # Later lookups find it without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,5 @@
+import sys
+
+from LISP.benchmarks.suite import main
+
+sys.exit(main())
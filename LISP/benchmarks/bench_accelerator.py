@@ -0,0 +1,57 @@
+"""
+bench_accelerator.py: accelerator speedup on matmul chains
+
+Compiles a two-layer matmul program to RISC-V twice, once to scalar loops
+and once with the tensor ops lowered to the lisp accelerator, runs both in
+the emulator and prints the instructions retired, the host time and the
+estimated cycles: the Profile's for the scalar code, plus the
+accelerator's own for the accelerated program.
+
+Run with: python -m LISP.benchmarks.bench_accelerator [n]
+"""
+import sys
+import time
+
+import numpy as np
+
+from LISP.compiler import CompileOptions
+from LISP.emulator.profile import Profile
+from LISP.emulator.runner import build_program, new_emulator, run_program
+
+CODE = "(set H (add (matmul X W1) b)) (return (multiply (matmul H W2) H))"
+
+
+def main(n=32):
+    rng = np.random.default_rng(0)
+    values = {
+        "X": rng.standard_normal((n, n)),
+        "W1": rng.standard_normal((n, n)),
+        "b": rng.standard_normal((n, n)),
+        "W2": rng.standard_normal((n, n)),
+    }
+    shapes = {name: value.shape for name, value in values.items()}
+    expected = None
+    cycles = {}
+    for accelerate in (False, True):
+        machine = build_program(CODE, CompileOptions.create(shapes, accelerate=accelerate, fuse=not accelerate))
+        emulator = new_emulator(machine)
+        emulator.profile = Profile()
+
+        start = time.perf_counter()
+        result = run_program(machine, values, emulator).copy()
+        elapsed = time.perf_counter() - start
+        if expected is None:
+            expected = result
+        assert np.allclose(result, expected)
+
+        core = emulator.profile.counters()["cycles"]
+        cycles[accelerate] = core + emulator.accelerator.cycles
+        print(
+            f"{'accelerated' if accelerate else 'scalar'}: {emulator.instret} instructions in {elapsed * 1e3:.1f} ms, "
+            f"{core} core + {emulator.accelerator.cycles} accelerator cycles (estimated)"
+        )
+    print(f"estimated speedup: {cycles[False] / cycles[True]:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
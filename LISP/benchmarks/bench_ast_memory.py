@@ -0,0 +1,47 @@
+"""
+bench_ast_memory.py: memory held by a parsed program
+
+Compares the lisp_ast node objects against the packed ASTTable for the
+same generated program, measured with tracemalloc.
+
+Run with: python -m LISP.benchmarks.bench_ast_memory [num_forms]
+"""
+import gc
+import sys
+import tracemalloc
+
+from LISP.frontend.ast_table import ASTTable
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+
+
+def generate(num_forms: int) -> str:
+    return "\n".join(f"(set x{i} (+ (* {i} y) (- z {i})))" for i in range(num_forms))
+
+
+def retained(build):
+    # Bytes still allocated once build() has returned
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, peak
+
+
+def main(num_forms: int = 20_000):
+    text = generate(num_forms)
+
+    forms, objects_size, objects_peak = retained(lambda: list(LispParser(LispLexer(text)).parse_program()))
+    del forms
+    table, table_size, table_peak = retained(lambda: ASTTable.parse(text))
+
+    nodes = len(table)
+    print(f"source:       {len(text) / 1e6:8.2f} MB, {nodes} nodes")
+    print(f"node objects: {objects_size / 1e6:8.2f} MB  ({objects_size / nodes:6.1f} B/node, peak {objects_peak / 1e6:.2f} MB)")
+    print(f"ASTTable:     {table_size / 1e6:8.2f} MB  ({table_size / nodes:6.1f} B/node, peak {table_peak / 1e6:.2f} MB)")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,45 @@
+"""
+bench_batch.py: one batched evaluation vs a loop over records
+
+Run with: python -m LISP.benchmarks.bench_batch [records]
+"""
+import sys
+import time
+
+import numpy as np
+
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import compile_program, evaluate_batch
+
+PROGRAM = """
+(set W ([[0.5 -1] [2 0.25]]))
+(set y (* (+ x 1) z))
+(set h (add (multiply W y) ([[1 2] [3 4]])))
+(return (subtract (matmul h W) x))
+"""
+
+
+def main(records: int = 100_000):
+    program = list(LispParser(LispLexer(PROGRAM)).parse_program())
+    rng = np.random.default_rng(0)
+    columns = {"x": rng.standard_normal(records), "z": rng.standard_normal(records)}
+
+    compiled = compile_program(program)
+    start = time.perf_counter()
+    looped = [compiled({"x": x, "z": z}) for x, z in zip(columns["x"].tolist(), columns["z"].tolist())]
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = evaluate_batch(program, columns)
+    batch_time = time.perf_counter() - start
+
+    np.testing.assert_allclose(batched, np.stack(looped))
+    print(f"{records} records")
+    print(f"per-record loop (compiled): {loop_time * 1e3:9.1f} ms")
+    print(f"evaluate_batch:             {batch_time * 1e3:9.1f} ms")
+    print(f"speedup:                    {loop_time / batch_time:9.0f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
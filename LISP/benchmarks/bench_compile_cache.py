@@ -0,0 +1,40 @@
+"""
+bench_compile_cache.py: compiling against loading from CompileCache
+
+Compiles generated programs of growing size once (a miss, which runs the
+whole pipeline and stores the result) and then again (a hit, which only
+reads the entry back).
+
+Run with: python -m LISP.benchmarks.bench_compile_cache
+"""
+import sys
+import tempfile
+import time
+
+from LISP.benchmarks.bench_optimization import generate
+from LISP.compiler import CompileCache, CompileOptions
+
+
+def main(*sizes: int):
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CompileCache(directory)
+        for num_forms in sizes or (100, 1_000, 2_000):
+            text = generate(num_forms)
+
+            start = time.perf_counter()
+            cache.compile(text, CompileOptions())
+            miss = time.perf_counter() - start
+
+            start = time.perf_counter()
+            cache.compile(text, CompileOptions())
+            hit = time.perf_counter() - start
+
+            print(
+                f"{num_forms:6d} forms: miss {miss * 1e3:9.1f} ms, hit {hit * 1e3:7.1f} ms "
+                f"({miss / hit:.0f}x), cache {cache.size() / 1e6:.1f} MB"
+            )
+        print(cache.stats())
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,43 @@
+"""
+bench_compile_files.py: batch compilation of many files on growing pools
+
+Writes generated programs to a temporary directory and compiles all of them
+with compile_files on 1, 2, 4, ... worker processes, up to the CPU count.
+
+Run with: python -m LISP.benchmarks.bench_compile_files [num_files] [num_forms]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from LISP.benchmarks.bench_optimization import generate
+from LISP.compiler import CompileOptions, collect_sources, compile_files
+
+
+def main(num_files: int = 64, num_forms: int = 100):
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(num_files):
+            with open(os.path.join(directory, f"program{i}.lisp"), "w") as file:
+                file.write(generate(num_forms))
+        paths = collect_sources([directory])
+        print(f"{num_files} files of {num_forms} forms, {os.cpu_count()} CPUs")
+
+        serial_time = None
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            results = list(compile_files(paths, CompileOptions(), max_workers=workers))
+            elapsed = time.perf_counter() - start
+            assert all(result.ok for result in results)
+            serial_time = serial_time or elapsed
+            per_file = sum(result.seconds for result in results) / len(results)
+            print(
+                f"{workers:2d} workers: {elapsed:7.2f} s  ({serial_time / elapsed:.1f}x), "
+                f"{per_file * 1e3:.1f} ms per file"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
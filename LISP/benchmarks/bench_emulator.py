@@ -0,0 +1,74 @@
+"""
+bench_emulator.py: emulated instructions per second, block cache reuse
+and host-guest transfers
+
+Compiles an n x n matmul with a bias to RISC-V and runs it in the
+emulator, first cold (every basic block is decoded on first use) and then
+warm in the same emulator, where every block comes from the cache, and
+once more with a Profile attached, whose report it prints. Then times moving a large tensor into guest memory as bytes, against mapping it
+with NumPy and writing it in place.
+
+Run with: python -m LISP.benchmarks.bench_emulator [n] [runs]
+"""
+import sys
+import time
+
+import numpy as np
+
+from LISP.compiler import CompileOptions
+from LISP.emulator.emulator import Emulator
+from LISP.emulator.profile import Profile
+from LISP.emulator.runner import build_program, new_emulator, run_program
+
+CODE = "(return (add (matmul A B) C))"
+
+
+def main(n=64, runs=3):
+    rng = np.random.default_rng(0)
+    values = {"A": rng.standard_normal((n, n)), "B": rng.standard_normal((n, n)), "C": rng.standard_normal(n)}
+    options = CompileOptions.create({name: value.shape for name, value in values.items()})
+    machine = build_program(CODE, options, "bench.lisp")
+    emulator = new_emulator(machine)
+    expected = values["A"] @ values["B"] + values["C"]
+
+    for run in range(runs):
+        retired, translations = emulator.instret, emulator.translations
+        start = time.perf_counter()
+        result = run_program(machine, values, emulator)
+        elapsed = time.perf_counter() - start
+        assert np.allclose(result, expected)
+
+        retired = emulator.instret - retired
+        print(
+            f"{'cold' if run == 0 else 'warm'}: {retired} instructions in {elapsed:.2f} s, "
+            f"{retired / elapsed / 1e6:.2f} MIPS, {emulator.translations - translations} blocks decoded"
+        )
+
+    emulator.profile = Profile()
+    start = time.perf_counter()
+    run_program(machine, values, emulator)
+    elapsed = time.perf_counter() - start
+    print(f"profiled: {emulator.profile.counters()['instructions'] / elapsed / 1e6:.2f} MIPS")
+    print(emulator.profile.report(machine, hot_blocks=3))
+    emulator.profile = None
+
+    transfer_size = 1024
+    tensor = rng.standard_normal((transfer_size, transfer_size))
+    emulator = Emulator(2 * tensor.nbytes)
+    start = time.perf_counter()
+    emulator.write(0, tensor.tobytes())
+    copied = np.frombuffer(emulator.read(0, tensor.nbytes), dtype="<f8")
+    elapsed_copy = time.perf_counter() - start
+    start = time.perf_counter()
+    mapped = emulator.array(0, tensor.shape)
+    mapped[...] = tensor
+    elapsed_mapped = time.perf_counter() - start
+    assert np.array_equal(copied.reshape(tensor.shape), mapped)
+    print(
+        f"{tensor.nbytes / 1e6:.0f} MB in and out: {elapsed_copy * 1e3:.1f} ms as bytes, "
+        f"{elapsed_mapped * 1e3:.1f} ms mapped"
+    )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,69 @@
+"""
+bench_fusion.py: fused against unfused elementwise evaluation
+
+Evaluates (subtract (add (multiply A B) C) (multiply A 0.5)) and
+(add (multiply (matmul A W) 0.5) C) on large tensors, once op by op as the
+interpreter does (a full-size temporary per op) and once as the single
+fused op LispFusionPass produces for them.
+
+Run with: python -m LISP.benchmarks.bench_fusion
+"""
+import timeit
+import tracemalloc
+
+import numpy as np
+from xdsl.dialects.builtin import TensorType, f64
+
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import compile_program
+from LISP.passes.fusion import FusedKernel, fuse
+
+CHAIN = "(return (subtract (add (multiply A B) C) (multiply A 0.5)))"
+EPILOGUE = "(return (add (multiply (matmul A W) 0.5) C))"
+
+
+def fused_op(code: str, shapes):
+    input_types = {name: TensorType(f64, list(shape)) for name, shape in shapes.items()}
+    module = fuse(IRGen(input_types).ir_gen_module(LispParser(LispLexer(code)).parse_program()))
+    return list(module.body.block.ops)[-1].value.owner
+
+
+def measure(func, number: int = 5):
+    # Best time in ms, and peak memory allocated during one call in MB
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds * 1e3, peak / 1e6
+
+
+def report(name: str, code: str, values, fused_call):
+    unfused = compile_program(LispParser(LispLexer(code)).parse_program())
+    unfused_ms, unfused_mb = measure(lambda: unfused(values))
+    fused_ms, fused_mb = measure(fused_call)
+    print(f"{name}:")
+    print(f"  op by op: {unfused_ms:8.1f} ms, peak {unfused_mb:7.1f} MB")
+    print(f"  fused:    {fused_ms:8.1f} ms, peak {fused_mb:7.1f} MB ({unfused_ms / fused_ms:.1f}x)")
+
+
+def main(size: int = 2000):
+    rng = np.random.default_rng(0)
+    A, B, W = (rng.standard_normal((size, size)) for _ in range(3))
+    C = rng.standard_normal(size)
+    values = {"A": A, "B": B, "C": C, "W": W}
+
+    op = fused_op(CHAIN, {"A": A.shape, "B": B.shape, "C": C.shape})
+    kernel = FusedKernel.for_op(op)
+    # Operand order of the fused op: A, B, C, then the 0.5 constant
+    report(f"elementwise chain {size}x{size}", CHAIN, values, lambda: kernel(A, B, C, 0.5))
+
+    op = fused_op(EPILOGUE, {"A": A.shape, "W": W.shape, "C": C.shape})
+    kernel = FusedKernel.for_op(op)
+    report(f"matmul epilogue {size}x{size}", EPILOGUE, values, lambda: kernel.matmul(A, W, 0.5, C))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+bench_incremental.py: full reparse vs incremental reparse after a one-form edit
+
+Run with: python -m LISP.benchmarks.bench_incremental [num_forms] [num_edits]
+"""
+import random
+import sys
+import time
+
+from LISP.frontend.incremental import IncrementalParse
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+
+
+def generate(num_forms: int) -> str:
+    return "\n".join(f"(set x{i} (+ (* {i} y) ([[{i} 2] [3 4]])))" for i in range(num_forms))
+
+
+def main(num_forms: int = 100_000, num_edits: int = 100):
+    text = generate(num_forms)
+    print(f"{len(text) / 1e6:.1f} MB, {num_forms} forms")
+
+    start = time.perf_counter()
+    list(LispParser(LispLexer(text)).parse_program())
+    full_time = time.perf_counter() - start
+    print(f"full parse:       {full_time * 1e3:9.2f} ms")
+
+    parse = IncrementalParse(text)
+    rng = random.Random(0)
+    times = []
+    for _ in range(num_edits):
+        # Rewrite the constant of one form, sometimes adding a line
+        index = rng.randrange(len(parse))
+        form_start, _ = parse.span(index)
+        number = parse.text.index("(*", form_start) + 3
+        number_end = parse.text.index(" ", number)
+        new_text = rng.choice(["7", "42", "1\n"])
+
+        start = time.perf_counter()
+        parse.edit(number, number_end, new_text)
+        times.append(time.perf_counter() - start)
+
+    times.sort()
+    median, worst = times[len(times) // 2], times[-1]
+    print(f"one-form edit:    {median * 1e3:9.2f} ms median, {worst * 1e3:.2f} ms max  ({full_time / median:.0f}x)")
+
+    # Reading every form applies the pending location shifts
+    start = time.perf_counter()
+    forms = parse.forms
+    print(f"read all forms:   {(time.perf_counter() - start) * 1e3:9.2f} ms")
+    assert forms == list(LispParser(LispLexer(parse.text)).parse_program())
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,58 @@
+"""
+bench_interpreter.py: tree walking vs closure compilation
+
+Runs a deep BinaryExprAST chain many times with different inputs, once
+through LispInterpreter and once through a program compiled with
+compile_program.
+
+Run with: python -m LISP.benchmarks.bench_interpreter [depth] [runs]
+"""
+import sys
+import time
+
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import LispInterpreter, compile_program
+
+OPS = "+-*/"
+
+
+def deep_chain(depth: int) -> str:
+    # (+ (- (* ... x 1.5) ...) ...), nested depth levels deep
+    text = "x"
+    for i in range(depth):
+        text = f"({OPS[i % 4]} {text} {1.0 + (i % 7) / 8})"
+    return f"(return {text})"
+
+
+def main(depth: int = 200, runs: int = 2000):
+    program = list(LispParser(LispLexer(deep_chain(depth))).parse_program())
+    inputs = [{"x": float(i)} for i in range(runs)]
+
+    interpreter = LispInterpreter()
+    walked = []
+    start = time.perf_counter()
+    for bindings in inputs:
+        interpreter.env = dict(bindings)
+        walked.append(interpreter.run(program))
+    walk_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = compile_program(program)
+    compile_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [compiled(bindings) for bindings in inputs]
+    run_time = time.perf_counter() - start
+
+    assert results == walked
+    nodes = runs * (2 * depth + 1)
+    print(f"depth {depth}, {runs} runs")
+    print(f"tree walking:       {walk_time * 1e3:8.1f} ms  ({nodes / walk_time / 1e6:.2f} M nodes/s)")
+    print(f"closures (compile): {compile_time * 1e3:8.1f} ms")
+    print(f"closures (run):     {run_time * 1e3:8.1f} ms  ({nodes / run_time / 1e6:.2f} M nodes/s)")
+    print(f"speedup:            {walk_time / run_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""
+bench_ir_gen.py: IR generation throughput on large programs
+
+Times parsing and IRGen.ir_gen_module separately for growing programs, so
+a super-linear slowdown in either shows up as falling throughput.
+
+Run with: python -m LISP.benchmarks.bench_ir_gen
+"""
+import sys
+import time
+
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+
+
+def generate(num_forms: int) -> str:
+    forms = ["(set A ([[1 2] [3 4]]))"]
+    for i in range(num_forms):
+        forms.append(f"(set x{i} (+ (* x{max(i - 1, 0)} 2) (- y {i})))")
+        if i % 10 == 0:
+            forms.append(f"(set A (add (matmul A A) x{i}))")
+    forms.append(f"(return (multiply A x{num_forms - 1}))")
+    return "\n".join(forms)
+
+
+def main(*sizes: int):
+    for num_forms in sizes or (1_000, 10_000, 50_000):
+        text = generate(num_forms)
+
+        start = time.perf_counter()
+        program = list(LispParser(LispLexer(text)).parse_program())
+        parse_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        module = IRGen().ir_gen_module(program)
+        gen_time = time.perf_counter() - start
+
+        num_ops = len(module.body.block.ops)
+        print(
+            f"{num_forms:7d} forms: parse {parse_time * 1e3:8.1f} ms, "
+            f"ir_gen {gen_time * 1e3:8.1f} ms, {num_ops} ops "
+            f"({num_ops / gen_time / 1e3:.0f} k ops/s)"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,76 @@
+"""
+bench_lexer.py: cost of constructing a LispLexer, and numeric throughput
+
+Compares rebuilding the PLY tables for every instance (the old behaviour)
+against cloning the shared prototype lexer, then lexes a large tensor
+literal with and without the bulk TENSOR_DATA path.
+
+Run with: python -m LISP.benchmarks.bench_lexer
+"""
+import time
+import timeit
+
+import numpy as np
+from ply import lex
+
+from LISP.frontend.lexer import LispLexer
+
+SNIPPET = "(set x (+ 1 2))"
+
+
+def construct_rebuild():
+    # What LispLexer.__init__ used to do: reflect the rules and compile the master regex
+    lexer = object.__new__(LispLexer)
+    lexer.input = SNIPPET
+    lexer.lexer = lex.lex(module=lexer)
+    lexer.lexer.input(SNIPPET)
+    return lexer
+
+
+def construct_clone():
+    return LispLexer(SNIPPET)
+
+
+def time_per_call(func, number):
+    # Best of a few repeats, in microseconds per call
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def tensor_source(rows: int, cols: int) -> str:
+    data = np.random.default_rng(0).standard_normal((rows, cols))
+    body = " ".join("[" + " ".join(f"{x:.6f}" for x in row) + "]" for row in data)
+    return f"(set W ([{body}]))"
+
+
+def lex_throughput(text: str, bulk: bool) -> float:
+    # MB of source per second
+    lexer = LispLexer(text)
+    if not bulk:
+        lexer.bulk_tensor_min_size = len(text) + 1
+    start = time.perf_counter()
+    for _ in lexer:
+        pass
+    return len(text) / (time.perf_counter() - start) / 1e6
+
+
+def main(number: int = 2000):
+    # Build the prototype outside the timed region
+    LispLexer(SNIPPET)
+
+    rebuild = time_per_call(construct_rebuild, number)
+    clone = time_per_call(construct_clone, number)
+    lex_only = time_per_call(lambda: list(LispLexer(SNIPPET)), number)
+
+    print(f"rebuild tables per instance: {rebuild:8.2f} us")
+    print(f"clone shared lexer:          {clone:8.2f} us")
+    print(f"clone + lex '{SNIPPET}':  {lex_only:8.2f} us")
+    print(f"construction speedup:        {rebuild / clone:8.1f}x")
+
+    text = tensor_source(1000, 1000)
+    print(f"tensor literal ({len(text) / 1e6:.1f} MB):")
+    print(f"  per-token NUMBER rules:    {lex_throughput(text, bulk=False):8.2f} MB/s")
+    print(f"  bulk TENSOR_DATA:          {lex_throughput(text, bulk=True):8.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
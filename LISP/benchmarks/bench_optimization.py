@@ -0,0 +1,51 @@
+"""
+bench_optimization.py: effect and cost of LispOptimizationPass
+
+Generates programs that repeat work the way generated code does (the same
+subexpression computed in several forms, constant tensors multiplied at
+run time, bindings that are never read) and reports how many ops the pass
+removes and how long it takes.
+
+Run with: python -m LISP.benchmarks.bench_optimization
+"""
+import sys
+import time
+
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.passes.optimization import optimize
+
+
+def generate(num_forms: int) -> str:
+    forms = ["(set W ([[1 2 3] [4 5 6] [7 8 9]]))", "(set acc 0)"]
+    for i in range(num_forms):
+        forms.append(f"(set t{i} (* (+ x {i % 7}) (+ x {i % 7})))")
+        forms.append(f"(set scratch{i} (- t{i} (+ x {i % 7})))")
+        forms.append(f"(set acc (+ acc (* t{i} (/ {i} 4))))")
+        if i % 10 == 0:
+            forms.append(f"(set M{i} (matmul W (add W {i % 5})))")
+            forms.append(f"(set acc (add acc M{i}))")
+    forms.append("(return acc)")
+    return "\n".join(forms)
+
+
+def main(*sizes: int):
+    for num_forms in sizes or (1_000, 10_000):
+        text = generate(num_forms)
+        module = IRGen().ir_gen_module(LispParser(LispLexer(text)).parse_program())
+        before = len(module.body.block.ops)
+
+        start = time.perf_counter()
+        optimize(module)
+        elapsed = time.perf_counter() - start
+
+        after = len(module.body.block.ops)
+        print(
+            f"{num_forms:7d} forms: {before} -> {after} ops "
+            f"({1 - after / before:.0%} removed) in {elapsed * 1e3:.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
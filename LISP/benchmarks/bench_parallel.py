@@ -0,0 +1,39 @@
+"""
+bench_parallel.py: serial vs process-pool parsing of a large generated file
+
+Run with: python -m LISP.benchmarks.bench_parallel [num_forms]
+"""
+import os
+import sys
+import time
+
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parallel import parse_parallel
+from LISP.frontend.parser import LispParser
+
+
+def generate(num_forms: int) -> str:
+    return "\n".join(f"(set x{i} (+ (* {i} y) ([[{i} 2] [3 4]])))" for i in range(num_forms))
+
+
+def main(num_forms: int = 200_000):
+    text = generate(num_forms)
+    print(f"{len(text) / 1e6:.1f} MB, {num_forms} forms, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    serial = list(LispParser(LispLexer(text)).parse_program())
+    serial_time = time.perf_counter() - start
+    print(f"serial:        {serial_time:7.2f} s")
+
+    workers = 2
+    while workers <= (os.cpu_count() or 1):
+        start = time.perf_counter()
+        forms = parse_parallel(text, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        assert len(forms) == len(serial)
+        print(f"{workers:2d} workers:    {elapsed:7.2f} s  ({serial_time / elapsed:.1f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,54 @@
+"""
+bench_startup.py: import and first-parse time of a fresh interpreter
+
+Every case runs in a new Python process, which times its own imports and
+work, so interpreter start-up is left out and nothing is cached from an
+earlier case. The median of the runs of each case is held to a budget; the
+exit status is 1 if any case is over it, so the benchmark can gate a build.
+
+Run with: python -m LISP.benchmarks.bench_startup [runs]
+"""
+import statistics
+import subprocess
+import sys
+
+# Case -> (code timed in a fresh process, budget in ms)
+CASES = {
+    "import LISP.frontend": ("import LISP.frontend", 15),
+    "trivial parse": (
+        "from LISP.frontend.lexer import LispLexer\n"
+        "from LISP.frontend.parser import LispParser\n"
+        "list(LispParser(LispLexer('(set x (+ 1 2)) (return x)')).parse_program())",
+        80,
+    ),
+    "import LISP.compiler": ("import LISP.compiler", 250),
+}
+
+_TIMER = """
+import time
+start = time.perf_counter()
+exec(compile({code!r}, "<startup>", "exec"))
+print((time.perf_counter() - start) * 1e3)
+"""
+
+
+def time_case(code: str) -> float:
+    # Milliseconds the code took in a new interpreter
+    output = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(code=code)], check=True, capture_output=True, text=True
+    ).stdout
+    return float(output)
+
+
+def main(runs: int = 10) -> int:
+    over = 0
+    for name, (code, budget) in CASES.items():
+        median = statistics.median(time_case(code) for _ in range(runs))
+        status = "ok" if median <= budget else "OVER BUDGET"
+        over += median > budget
+        print(f"{name:22s} {median:8.1f} ms  (budget {budget} ms)  {status}")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:])))
@@ -0,0 +1,75 @@
+"""
+generators.py: seeded synthetic programs for the benchmark suite
+
+Every generator draws from its own random.Random(seed), so the same
+arguments always give the same text on every machine and Python version,
+and results stored by one run stay comparable with the next. All programs
+read one scalar input x, and evaluate without errors.
+"""
+import random
+
+OPERATORS = "+-*/"
+TENSOR_OPS = ("add", "subtract", "multiply")
+
+
+def _constant(rng: random.Random) -> str:
+    # In [1, 2), so divisions stay finite however deep the nesting
+    return f"{1 + rng.random():.4f}"
+
+
+def deep_nesting(depth: int, seed: int = 0) -> str:
+    """
+    One return of a binary expression nested depth levels deep, taking x
+    and a constant at every level in random order.
+    """
+    rng = random.Random(seed)
+    text = "x"
+    for _ in range(depth):
+        operands = [text, _constant(rng)]
+        rng.shuffle(operands)
+        text = f"({rng.choice(OPERATORS)} {operands[0]} {operands[1]})"
+    return f"(return {text})"
+
+
+def many_forms(num_forms: int, seed: int = 0) -> str:
+    """
+    num_forms shallow bindings, one per line: scalar arithmetic on x or an
+    earlier binding, with every tenth form a small tensor literal or a
+    tensor op of an earlier tensor and a literal. Returns the last binding.
+    """
+    rng = random.Random(seed)
+    scalars = ["x"]
+    literals = []
+    tensors = []
+    lines = []
+    for i in range(num_forms):
+        name = f"v{i}"
+        if i % 10 == 9 and literals and rng.random() < 0.5:
+            lines.append(f"(set {name} ({rng.choice(TENSOR_OPS)} {rng.choice(tensors)} {rng.choice(literals)}))")
+            tensors.append(name)
+        elif i % 10 == 9:
+            rows = " ".join("[" + " ".join(_constant(rng) for _ in range(3)) + "]" for _ in range(3))
+            lines.append(f"(set {name} ([{rows}]))")
+            literals.append(name)
+            tensors.append(name)
+        else:
+            # Only constants in [1, 2) are divisors, and multiplying and
+            # dividing by them is equally likely, so values neither overflow
+            # nor divide by zero however long a chain of bindings gets
+            inner = f"({rng.choice(OPERATORS)} {rng.choice(scalars[-8:])} {_constant(rng)})"
+            lines.append(f"(set {name} ({rng.choice(OPERATORS)} {inner} {_constant(rng)}))")
+            scalars.append(name)
+    lines.append(f"(return v{num_forms - 1})" if num_forms else "(return x)")
+    return "\n".join(lines)
+
+
+def tensor_literal(rows: int, cols: int, seed: int = 0) -> str:
+    """
+    One rows x cols tensor literal of signed decimals, then its sum with x.
+    """
+    rng = random.Random(seed)
+    body = " ".join(
+        "[" + " ".join(f"{rng.uniform(-100, 100):.6f}" for _ in range(cols)) + "]"
+        for _ in range(rows)
+    )
+    return f"(set W ([{body}]))\n(return (add W x))"
@@ -0,0 +1,217 @@
+"""
+suite.py: front-end performance suite with stored results and regression checks
+
+Runs LispLexer, LispParser and the interpreter over the programs of
+generators.py and measures:
+
+- lexer tokens/s and MB/s
+- parser AST nodes/s, lexing included, as that is what parsing costs
+- interpreter AST nodes evaluated/s, walking the tree with LispInterpreter
+  and running the closures of compile_program
+- peak memory of every stage, with tracemalloc
+
+Throughputs are the best of a few repeats; peaks come from one more run
+with tracemalloc on, as tracing slows everything down. Results are a flat
+mapping from metric name to {"value", "unit", "higher_is_better"}, saved as
+JSON with the seed and the machine they were taken on, and compare flags
+every metric that got worse by more than a threshold.
+
+Run with: python -m LISP.benchmarks run [-o results.json]
+     and: python -m LISP.benchmarks compare baseline.json results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from LISP.benchmarks.generators import deep_nesting, many_forms, tensor_literal
+from LISP.frontend.ast_table import ASTTable
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import LispInterpreter, compile_program
+
+# Version of the results format
+SCHEMA_VERSION = 1
+
+# Relative change past which compare reports a regression
+DEFAULT_THRESHOLD = 0.10
+
+# Shortest timed sample: faster functions are called in a loop until one
+# takes this long, as timer resolution and scheduling noise swamp anything
+# shorter
+MIN_SAMPLE_TIME = 0.05
+
+INPUTS = {"x": 1.25}
+
+
+def programs(scale: float = 1.0, seed: int = 0) -> Dict[str, str]:
+    """
+    The suite's programs, their sizes multiplied by scale.
+    """
+    def size(base: int) -> int:
+        return max(int(base * scale), 1)
+
+    # Deep nesting recurses in the parser and interpreter, so it stays well
+    # under the recursion limit at any scale
+    return {
+        "deep_nesting": deep_nesting(min(size(200), 250), seed),
+        "many_forms": many_forms(size(5_000), seed),
+        "tensor_literal": tensor_literal(size(300), size(300), seed),
+    }
+
+
+def best_time(func: Callable[[], Any], repeat: int) -> float:
+    """
+    Returns the seconds per call of func, the best of repeat samples.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < MIN_SAMPLE_TIME:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number
+
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    # Bytes allocated at the peak of func, above what was live before it
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def _lex(text: str) -> int:
+    return sum(1 for _ in LispLexer(text))
+
+
+def _parse(text: str) -> list:
+    return list(LispParser(LispLexer(text)).parse_program())
+
+
+def run_suite(scale: float = 1.0, seed: int = 0, repeat: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    Runs every benchmark and returns the metrics.
+    """
+    metrics: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, value: float, unit: str, higher_is_better: bool = True) -> None:
+        metrics[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+    for program, text in programs(scale, seed).items():
+        tokens = _lex(text)
+        forms = _parse(text)
+        nodes = len(ASTTable.from_forms(forms))
+
+        elapsed = best_time(lambda: _lex(text), repeat)
+        record(f"lexer.{program}.tokens_per_second", tokens / elapsed, "tokens/s")
+        record(f"lexer.{program}.megabytes_per_second", len(text) / elapsed / 1e6, "MB/s")
+        record(f"lexer.{program}.peak_memory", peak_memory(lambda: _lex(text)), "bytes", False)
+
+        elapsed = best_time(lambda: _parse(text), repeat)
+        record(f"parser.{program}.nodes_per_second", nodes / elapsed, "nodes/s")
+        record(f"parser.{program}.peak_memory", peak_memory(lambda: _parse(text)), "bytes", False)
+
+        # Every program runs to its final return, so each node is evaluated once
+        walk = lambda: LispInterpreter(INPUTS).run(forms)
+        elapsed = best_time(walk, repeat)
+        record(f"interpreter.{program}.nodes_per_second", nodes / elapsed, "nodes/s")
+        record(f"interpreter.{program}.peak_memory", peak_memory(walk), "bytes", False)
+
+        compiled = compile_program(forms)
+        elapsed = best_time(lambda: compiled(INPUTS), repeat)
+        record(f"compiled.{program}.nodes_per_second", nodes / elapsed, "nodes/s")
+    return metrics
+
+
+def results(metrics: Dict[str, Dict[str, Any]], scale: float, seed: int) -> Dict[str, Any]:
+    return {
+        "schema": SCHEMA_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "seed": seed,
+        "scale": scale,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "metrics": metrics,
+    }
+
+
+class Regression(NamedTuple):
+    name: str
+    baseline: float
+    current: float
+    # How much worse, relative to the baseline: 0.25 is 25% worse
+    change: float
+    unit: str
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> List[Regression]:
+    """
+    Returns every metric of both results that is worse in current by more
+    than threshold, worst first. Metrics in only one of them are skipped.
+    """
+    regressions = []
+    for name, entry in current["metrics"].items():
+        before = baseline["metrics"].get(name)
+        if before is None or not before["value"]:
+            continue
+        change = (entry["value"] - before["value"]) / before["value"]
+        if entry["higher_is_better"]:
+            change = -change
+        if change > threshold:
+            regressions.append(Regression(name, before["value"], entry["value"], change, entry["unit"]))
+    return sorted(regressions, key=lambda regression: regression.change, reverse=True)
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    if data.get("schema") != SCHEMA_VERSION:
+        raise SystemExit(f"{path}: unsupported results schema {data.get('schema')!r}")
+    return data
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m LISP.benchmarks", description="Front-end performance suite.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite and print or save the results")
+    run.add_argument("-o", "--output", help="JSON file to write the results to")
+    run.add_argument("--scale", type=float, default=1.0, help="multiplier of the program sizes")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--repeat", type=int, default=5, help="runs per measurement, the best of which counts")
+
+    check = commands.add_parser("compare", help="flag metrics that regressed from a baseline")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                       help=f"relative change that counts as a regression (default {DEFAULT_THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        data = results(run_suite(args.scale, args.seed, args.repeat), args.scale, args.seed)
+        for name, entry in data["metrics"].items():
+            print(f"{name:50s} {entry['value']:16,.1f} {entry['unit']}")
+        if args.output is not None:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(data, file, indent=2)
+        return 0
+
+    baseline, current = _load(args.baseline), _load(args.current)
+    if (baseline["seed"], baseline["scale"]) != (current["seed"], current["scale"]):
+        print("warning: results were taken with different seeds or scales", file=sys.stderr)
+    regressions = compare(baseline, current, args.threshold)
+    for regression in regressions:
+        print(
+            f"REGRESSION {regression.name}: {regression.baseline:,.0f} -> {regression.current:,.0f} "
+            f"{regression.unit} ({regression.change:.1%} worse)"
+        )
+    print(f"{len(regressions)} of {len(current['metrics'])} metrics regressed by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
@@ -1,3 +1,548 @@
 """
-compiler.py
-"""
\ No newline at end of file
+compiler.py: the compilation pipeline and its on-disk cache
+
+compile_source runs the whole pipeline on a program: parse, IR generation,
+LispOptimizationPass and LispFusionPass, then LispLoweringPass. The result
+keeps the artifact of every stage, the IR as text in xDSL's generic format.
+
+CompileCache stores those results on disk, content-addressed: the key is a
+hash of the source, the file name, the compiler version and the options,
+so any change to one of them is a different entry and nothing has to be
+invalidated. Entries are written to a temporary file and renamed into
+place, so concurrent workers sharing a directory only ever see complete
+entries, and the least recently used ones are evicted once the directory
+grows past its size limit. Each CompileCache keeps a running total of the
+directory's size, from its last scan plus its own writes, so the directory
+is only listed again when that total goes over the limit or, with several
+writing processes, once the instance has written its share of it.
+
+compile_files is the batch driver: it compiles many files on a process
+pool, keeping a bounded number of them in flight, and yields a FileResult
+with the time it took for each, in input order whatever order the workers
+finish in. main is its command line, python -m LISP.compiler.
+
+xDSL and the passes take far longer to import than a short compilation
+takes, so they are imported by the functions that run the pipeline: a
+build whose every file is a CompileCache hit never imports them.
+"""
+import argparse
+import hashlib
+import io
+import os
+import pickle
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# The package only, which is cheap: it is here for its version
+import xdsl
+
+from .frontend.ast_table import ASTTable
+from .frontend.lexer import LispLexer
+from .frontend.lisp_ast import ExprAST
+from .frontend.parser import LispParser
+from .passes import DEFAULT_TILE_SIZES
+
+if TYPE_CHECKING:
+    from xdsl.context import Context
+    from xdsl.dialects.builtin import ModuleOp
+
+# Part of every cache key: bump it whenever the output of the pipeline changes
+COMPILER_VERSION = "0.2.0"
+
+# Size limit of a CompileCache directory
+DEFAULT_CACHE_SIZE = 256 << 20
+
+_ENTRY_SUFFIX = ".lispc"
+
+SOURCE_SUFFIX = ".lisp"
+
+# Files in flight per worker in compile_files: enough to keep every worker
+# busy while results are collected, few enough to bound memory
+PENDING_PER_WORKER = 2
+
+
+@dataclass(frozen=True)
+class CompileOptions:
+    # Shapes of the tensor inputs; other inputs are f64 scalars
+    input_shapes: Tuple[Tuple[str, Tuple[int, ...]], ...] = ()
+    optimize: bool = True
+    fuse: bool = True
+    tile_sizes: Tuple[int, int, int] = DEFAULT_TILE_SIZES
+    # Lower tensor ops to calls to the lisp accelerator, see lowering.py
+    accelerate: bool = False
+
+    @classmethod
+    def create(cls, input_shapes: Optional[Dict[str, Tuple[int, ...]]] = None, **options) -> "CompileOptions":
+        # Sorted, so the same inputs always give the same options (and key)
+        shapes = tuple(sorted((name, tuple(shape)) for name, shape in (input_shapes or {}).items()))
+        return cls(shapes, **options)
+
+
+@dataclass
+class CompileResult:
+    # The parsed program; an ASTTable loads from disk far faster than the
+    # node objects it stands for
+    ast: ASTTable
+    # The lisp module after the optimization passes
+    optimized_ir: str
+    # The module lowered to func/arith/scf/memref
+    lowered_ir: str
+    # LoweringStatistics.to_dict() of the lowering
+    statistics: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def forms(self) -> List[ExprAST]:
+        return list(self.ast.forms())
+
+    def optimized_module(self) -> "ModuleOp":
+        return _parse_module(self.optimized_ir)
+
+    def lowered_module(self) -> "ModuleOp":
+        return _parse_module(self.lowered_ir)
+
+
+def _context() -> "Context":
+    from xdsl.context import Context
+    from xdsl.dialects.arith import Arith
+    from xdsl.dialects.builtin import Builtin
+    from xdsl.dialects.func import Func
+    from xdsl.dialects.memref import MemRef
+    from xdsl.dialects.scf import Scf
+
+    from .dialects.lisp import LispDialect
+
+    ctx = Context()
+    for dialect in (Builtin, Func, Arith, Scf, MemRef, LispDialect):
+        ctx.load_dialect(dialect)
+    return ctx
+
+
+def _parse_module(text: str) -> "ModuleOp":
+    from xdsl.parser import Parser
+
+    return Parser(_context(), text).parse_module()
+
+
+def _print(module: "ModuleOp") -> str:
+    from xdsl.printer import Printer
+
+    # The generic format parses back without relying on custom syntax
+    stream = io.StringIO()
+    Printer(stream=stream, print_generic_format=True).print_op(module)
+    return stream.getvalue()
+
+
+def compile_source(text: str, options: CompileOptions = CompileOptions(), file_name: str = "<stdin>") -> CompileResult:
+    """
+    Runs the full pipeline on the program text.
+    """
+    from xdsl.dialects.builtin import TensorType, f64
+
+    from .frontend.ir_gen import IRGen
+    from .passes.fusion import fuse
+    from .passes.lowering import lower
+    from .passes.optimization import optimize
+
+    forms = list(LispParser(LispLexer(text), file_name).parse_program())
+
+    input_types = {name: TensorType(f64, list(shape)) for name, shape in options.input_shapes}
+    module = IRGen(input_types).ir_gen_module(forms)
+    if options.optimize:
+        optimize(module)
+    if options.fuse:
+        fuse(module)
+    optimized_ir = _print(module)
+
+    statistics = lower(module, options.tile_sizes, options.accelerate)
+    ast = ASTTable.from_forms(forms, file_name)
+    return CompileResult(ast, optimized_ir, _print(module), statistics.to_dict())
+
+
+def cache_key(text: str, options: CompileOptions, file_name: str = "<stdin>") -> str:
+    """
+    Content address of the compilation of text with options.
+    """
+    digest = hashlib.sha256()
+    # The xDSL version is part of the key as it decides how IR is printed
+    for part in (COMPILER_VERSION, str(xdsl.__version__), repr(options), file_name):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(text.encode())
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """
+    Content-addressed cache of CompileResults in a directory, shared
+    safely between processes.
+
+    After every put, the directory holds at most max_bytes, as long as no
+    more than writers processes put entries in it at once. An instance only
+    sees other processes' entries when it scans the directory. A lone
+    writer's running total is exact, so it scans only when the total goes
+    over max_bytes. With several writers, each one also scans once it has
+    written its share, max_bytes / (2 * writers), since its last scan, and
+    evicts down to max_bytes / 2. The writes none of them has seen yet then
+    fit in the other half.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE, writers: int = 1):
+        """
+        Args:
+            directory: Where the entries are stored; created if missing.
+            max_bytes: Size limit of the directory.
+            writers: Most processes putting entries in the directory at once.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.writers = max(writers, 1)
+        os.makedirs(directory, exist_ok=True)
+
+        # Counters of this instance, not of the whole directory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bytes in the directory at the last scan, None until the first put,
+        # and bytes this instance has written since
+        self._scanned: Optional[int] = None
+        self._written = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[CompileResult]:
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                result = pickle.load(file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Unreadable, or written by an incompatible version: drop it
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        # The modification time orders entries for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return result
+
+    def put(self, key: str, result: CompileResult) -> None:
+        # Written under a unique name and renamed into place, which is atomic,
+        # so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+                written = file.tell()
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        # A replaced entry is counted twice, which at worst scans early
+        self._written += written
+        if self.writers == 1:
+            share, low_water = self.max_bytes, self.max_bytes
+        else:
+            share = self.max_bytes // (2 * self.writers)
+            low_water = self.max_bytes - self.writers * share
+        if self._scanned is None or self._scanned + self._written > self.max_bytes or self._written > share:
+            self.evict(low_water)
+
+    def compile(self, text: str, options: CompileOptions = CompileOptions(), file_name: str = "<stdin>") -> CompileResult:
+        """
+        Returns the cached compilation of text, compiling and storing it on
+        a miss.
+        """
+        key = cache_key(text, options, file_name)
+        result = self.get(key)
+        if result is None:
+            result = compile_source(text, options, file_name)
+            self.put(key, result)
+        return result
+
+    def entries(self) -> List[Tuple[float, int, str]]:
+        # (mtime, size, path) of every entry, least recently used first
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith(_ENTRY_SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, max_bytes: Optional[int] = None) -> None:
+        """
+        Removes least recently used entries until the cache fits in
+        max_bytes, by default its own size limit.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            if self._remove(path):
+                self.evictions += 1
+            total -= size
+        self._scanned, self._written = total, 0
+
+    def clear(self) -> None:
+        for _, _, path in self.entries():
+            self._remove(path)
+        self._scanned, self._written = 0, 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        # Another process may have removed it first
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+
+@dataclass
+class FileResult:
+    path: str
+    # None if the file failed to compile
+    result: Optional[CompileResult]
+    # "<exception type>: <message>" of the failure
+    error: Optional[str] = None
+    # Wall-clock time spent reading and compiling the file, in the worker
+    seconds: float = 0.0
+    # Loaded from the CompileCache rather than compiled
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def collect_sources(paths: Iterable[str], suffix: str = SOURCE_SUFFIX) -> List[str]:
+    """
+    Returns the files among paths and, for every directory, the files with
+    the suffix below it, in sorted order, so a tree always compiles in the
+    same order.
+    """
+    sources = []
+    for path in paths:
+        if not os.path.isdir(path):
+            sources.append(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            sources.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(suffix))
+    return sources
+
+
+@lru_cache(maxsize=8)
+def _worker_cache(directory: str, max_bytes: int, writers: int) -> CompileCache:
+    # One CompileCache per directory and process, so its running size total
+    # lasts for the whole batch instead of being rescanned for every file
+    return CompileCache(directory, max_bytes, writers)
+
+
+# (directory, size limit, worker count) of the CompileCache of a batch
+_CacheSpec = Optional[Tuple[str, int, int]]
+
+
+def _compile_file(path: str, options: CompileOptions, cache_spec: _CacheSpec) -> FileResult:
+    # Runs in a worker; failures are returned, so one bad file does not stop
+    # the batch
+    start = time.perf_counter()
+    cached = False
+    try:
+        with open(path, encoding="utf-8") as file:
+            text = file.read()
+        if cache_spec is None:
+            result = compile_source(text, options, path)
+        else:
+            cache = _worker_cache(*cache_spec)
+            hits = cache.hits
+            result = cache.compile(text, options, path)
+            cached = cache.hits > hits
+    except Exception as error:
+        return FileResult(path, None, f"{type(error).__name__}: {error}", time.perf_counter() - start)
+    return FileResult(path, result, None, time.perf_counter() - start, cached)
+
+
+def compile_files(
+    paths: Sequence[str],
+    options: CompileOptions = CompileOptions(),
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    cache_directory: Optional[str] = None,
+    max_pending: Optional[int] = None,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+) -> Iterator[FileResult]:
+    """
+    Compiles every file on a pool of worker processes.
+
+    Args:
+        paths: The files to compile.
+        options: Options of every compilation.
+        max_workers: Size of the process pool, or of executor; defaults to
+            the CPU count. Every worker may write to the cache at once, so
+            each one gets its share of cache_size.
+        executor: An existing pool to reuse instead of starting a new one.
+        cache_directory: Directory of a CompileCache shared by the workers.
+        max_pending: Most files submitted but not yet yielded; defaults to
+            PENDING_PER_WORKER per worker.
+        cache_size: Size limit of the cache directory, in bytes.
+
+    Returns:
+        An iterator over the FileResult of every file, in the order of
+        paths. Results are yielded as soon as they and all those before
+        them are done, so a slow file holds back the ones after it but
+        never reorders them.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = PENDING_PER_WORKER * max_workers
+    cache_spec = None if cache_directory is None else (cache_directory, cache_size, max_workers)
+
+    if executor is None and max_workers == 1:
+        # Not worth starting a pool
+        return (_compile_file(path, options, cache_spec) for path in paths)
+    if executor is None:
+        return _compile_on_pool(paths, options, max_workers, cache_spec, max_pending)
+    return _compile_on(executor, paths, options, cache_spec, max_pending)
+
+
+def _compile_on_pool(
+    paths: Sequence[str], options: CompileOptions, max_workers: int, cache_spec: _CacheSpec, max_pending: int
+) -> Iterator[FileResult]:
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        yield from _compile_on(pool, paths, options, cache_spec, max_pending)
+
+
+def _compile_on(
+    executor: Executor, paths: Sequence[str], options: CompileOptions, cache_spec: _CacheSpec, max_pending: int
+) -> Iterator[FileResult]:
+    # Futures in submission order, which is input order: the oldest is
+    # always yielded first
+    pending: Deque[Future] = deque()
+    for path in paths:
+        if len(pending) >= max(max_pending, 1):
+            yield pending.popleft().result()
+        pending.append(executor.submit(_compile_file, path, options, cache_spec))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _parse_shape(text: str) -> Tuple[str, Tuple[int, ...]]:
+    # NAME=3x2
+    name, _, shape = text.partition("=")
+    try:
+        return name, tuple(int(extent) for extent in shape.split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME=3x2, got {text!r}")
+
+
+def _output_path(output_directory: str, root: str, path: str) -> str:
+    relative = os.path.relpath(os.path.abspath(path), root)
+    return os.path.join(output_directory, os.path.splitext(relative)[0] + ".mlir")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """
+    Compiles the LISP files and directories on the command line and reports
+    the time each took; returns 1 if any failed.
+    """
+    parser = argparse.ArgumentParser(prog="python -m LISP.compiler", description="Compile LISP programs to func/arith/scf/memref IR.")
+    parser.add_argument("paths", nargs="+", help=f"source files, and directories to search for *{SOURCE_SUFFIX} files")
+    parser.add_argument("-o", "--output", help="directory to write the lowered IR to, mirroring the sources")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: the CPU count)")
+    parser.add_argument("--input", type=_parse_shape, action="append", default=[], metavar="NAME=SHAPE",
+                        help="shape of a tensor input, such as W=3x2; may be repeated")
+    parser.add_argument("--no-optimize", action="store_true")
+    parser.add_argument("--no-fuse", action="store_true")
+    parser.add_argument("--accelerate", action="store_true", help="lower tensor ops to the lisp accelerator")
+    parser.add_argument("--tile-sizes", type=lambda text: tuple(map(int, text.split(","))), default=DEFAULT_TILE_SIZES,
+                        metavar="M,N,K")
+    parser.add_argument("--cache", metavar="DIRECTORY", help="CompileCache directory shared by the workers")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE >> 20, metavar="MIB",
+                        help=f"size limit of the cache directory (default {DEFAULT_CACHE_SIZE >> 20} MiB)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report failures and the totals")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="compile in this process with per-stage instrumentation and write a trace-event JSON file")
+    args = parser.parse_args(argv)
+
+    options = CompileOptions.create(
+        dict(args.input),
+        optimize=not args.no_optimize,
+        fuse=not args.no_fuse,
+        tile_sizes=args.tile_sizes,
+        accelerate=args.accelerate,
+    )
+    paths = collect_sources(args.paths)
+    if not paths:
+        print("no source files", file=sys.stderr)
+        return 1
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+
+    instrumentation = None
+    if args.trace is not None:
+        # Hooks are installed in this process only, so no workers
+        from .instrumentation import Instrumentation
+        instrumentation = Instrumentation(memory=True)
+        instrumentation.enable()
+        args.jobs = 1
+
+    start = time.perf_counter()
+    failures = 0
+    compile_time = 0.0
+    for file_result in compile_files(paths, options, args.jobs, cache_directory=args.cache, cache_size=args.cache_size << 20):
+        compile_time += file_result.seconds
+        if not file_result.ok:
+            failures += 1
+            print(f"{file_result.path}: error: {file_result.error}", file=sys.stderr)
+            continue
+        if args.output is not None:
+            output_path = _output_path(args.output, root, file_result.path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            with open(output_path, "w", encoding="utf-8") as file:
+                file.write(file_result.result.lowered_ir)
+        if not args.quiet:
+            print(f"{file_result.path}: {file_result.seconds * 1e3:.1f} ms{' (cached)' if file_result.cached else ''}")
+    wall_time = time.perf_counter() - start
+
+    if instrumentation is not None:
+        instrumentation.disable()
+        instrumentation.write_trace(args.trace)
+        print(instrumentation.report())
+    print(
+        f"{len(paths)} files, {failures} failed: {wall_time:.2f} s wall clock, "
+        f"{compile_time:.2f} s compiling ({compile_time / wall_time if wall_time else 0:.1f}x parallelism)"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,398 @@
-from typing import Annotated
-from xdsl.context import Context
-from xdsl.printer import Printer
-from xdsl.ir import Dialect, OpResult
-from xdsl.dialects.arith import ConstantOp, SignlessIntegerBinaryOperation
+"""
+lisp.py: the lisp dialect
+
+Every value is either an f64 scalar or a tensor<...xf64>. The arithmetic
+ops are elementwise and broadcast like NumPy, so the same op covers scalar
+BinaryExprAST nodes and the elementwise TensorOpExprAST operations.
+
+The fused ops hold a chain of elementwise ops as a postfix kernel, see
+kernel_type.
+"""
+from typing import Optional, Sequence, Union
+
+import numpy as np
+from xdsl.dialects.builtin import (
+    ArrayAttr,
+    BytesAttr,
+    DenseIntOrFPElementsAttr,
+    FloatAttr,
+    StringAttr,
+    TensorType,
+    f64,
+)
+from xdsl.ir import Attribute, Dialect, Operation, SSAValue
 from xdsl.irdl import (
-    Operand, 
-    operand_def, 
-    result_def,
     IRDLOperation,
     irdl_op_definition,
-    register
-)
-from xdsl.dialects.builtin import (
-    i64,
-    i32
+    operand_def,
+    prop_def,
+    result_def,
+    traits_def,
+    var_operand_def,
 )
+from xdsl.traits import ConstantLike, Pure
+from xdsl.utils.exceptions import VerifyException
+
+
+def shape_of(type: Attribute) -> tuple[int, ...]:
+    # Scalars have the empty shape
+    if isinstance(type, TensorType):
+        return tuple(type.get_shape())
+    return ()
+
+
+def type_for_shape(shape: Sequence[int]) -> Attribute:
+    if len(shape) == 0:
+        return f64
+    return TensorType(f64, list(shape))
+
+
+def broadcast_type(lhs: Attribute, rhs: Attribute) -> Attribute:
+    """
+    Result type of an elementwise op, following NumPy broadcasting.
+
+    Raises:
+        ValueError: If the shapes do not broadcast.
+    """
+    # Same-type and scalar operands are by far the most common
+    if lhs == rhs:
+        return lhs
+    lhs_tensor, rhs_tensor = isinstance(lhs, TensorType), isinstance(rhs, TensorType)
+    if lhs_tensor and not rhs_tensor:
+        return lhs
+    if rhs_tensor and not lhs_tensor:
+        return rhs
+    return type_for_shape(np.broadcast_shapes(shape_of(lhs), shape_of(rhs)))
+
+
+def matmul_type(lhs: Attribute, rhs: Attribute) -> Attribute:
+    """
+    Result type of lisp.matmul, following np.matmul; a scalar operand scales
+    the other one.
+
+    Raises:
+        ValueError: If the inner dimensions do not match.
+    """
+    lhs_shape, rhs_shape = shape_of(lhs), shape_of(rhs)
+    if not lhs_shape or not rhs_shape:
+        return broadcast_type(lhs, rhs)
+
+    lhs_matrix = lhs_shape if len(lhs_shape) > 1 else (1,) + lhs_shape
+    rhs_matrix = rhs_shape if len(rhs_shape) > 1 else rhs_shape + (1,)
+    if lhs_matrix[-1] != rhs_matrix[-2]:
+        raise ValueError(f"matmul inner dimensions differ: {lhs_shape} and {rhs_shape}")
+
+    batch = np.broadcast_shapes(lhs_matrix[:-2], rhs_matrix[:-2])
+    shape = batch + lhs_matrix[-2:-1] + rhs_matrix[-1:]
+    # Drop the axes added for vector operands
+    if len(lhs_shape) == 1:
+        shape = shape[:-2] + shape[-1:]
+    if len(rhs_shape) == 1:
+        shape = shape[:-1]
+    return type_for_shape(shape)
+
+
+def kernel_type(kernel: Sequence[str], arg_types: Sequence[Attribute]) -> Attribute:
+    """
+    Result type of a fused kernel. The kernel is in postfix order: "$i"
+    pushes argument i, and each of KERNEL_OPS pops two values and pushes
+    their elementwise result.
+
+    Raises:
+        ValueError: If the kernel is malformed or its shapes do not broadcast.
+    """
+    stack = []
+    for token in kernel:
+        if token.startswith("$"):
+            index = int(token[1:])
+            if not 0 <= index < len(arg_types):
+                raise ValueError(f"kernel argument {token} out of range")
+            stack.append(arg_types[index])
+        elif token in KERNEL_OPS and len(stack) >= 2:
+            rhs = stack.pop()
+            stack.append(broadcast_type(stack.pop(), rhs))
+        else:
+            raise ValueError(f"malformed kernel at '{token}'")
+    if len(stack) != 1:
+        raise ValueError("kernel must leave exactly one value")
+    return stack[0]
+
+
+def dense_attr(elements: np.ndarray) -> DenseIntOrFPElementsAttr:
+    # The attribute stores little-endian doubles, which is NumPy's "<f8" layout
+    data = np.ascontiguousarray(elements, dtype="<f8")
+    return DenseIntOrFPElementsAttr(TensorType(f64, list(data.shape)), BytesAttr(data.tobytes()))
+
+
+def dense_values(attr: DenseIntOrFPElementsAttr) -> np.ndarray:
+    # Read-only view of the attribute's bytes, without a copy
+    return np.frombuffer(attr.data.data, dtype="<f8").reshape(attr.get_shape())
+
+
+# Discardable attribute with the source location ("file:line:col") an op was
+# generated from; the passes copy it to the ops they replace an op with
+LOCATION_ATTR = "lisp.loc"
+
+
+def get_location(op: Operation) -> Optional[str]:
+    attr = op.attributes.get(LOCATION_ATTR)
+    return attr.data if isinstance(attr, StringAttr) else None
+
+
+def set_location(op: Operation, location: Optional[str]) -> None:
+    if location is not None:
+        op.attributes[LOCATION_ATTR] = StringAttr(location)
+
+
+@irdl_op_definition
+class ConstantOp(IRDLOperation):
+    """
+    A scalar or tensor literal.
+    """
+
+    name = "lisp.constant"
+
+    value = prop_def(FloatAttr | DenseIntOrFPElementsAttr)
+    result = result_def()
+
+    traits = traits_def(Pure(), ConstantLike())
+
+    def __init__(self, value: Union[float, np.ndarray, FloatAttr, DenseIntOrFPElementsAttr]):
+        if isinstance(value, np.ndarray):
+            value = dense_attr(value)
+        elif not isinstance(value, (FloatAttr, DenseIntOrFPElementsAttr)):
+            value = FloatAttr(float(value), f64)
+        super().__init__(result_types=[value.get_type()], properties={"value": value})
+
+    def get_value(self) -> Union[float, np.ndarray]:
+        if isinstance(self.value, FloatAttr):
+            return self.value.value.data
+        return dense_values(self.value)
+
+    def verify_(self) -> None:
+        if self.result.type != self.value.get_type():
+            raise VerifyException("lisp.constant result type must match its value")
+
+
+@irdl_op_definition
+class VarOp(IRDLOperation):
+    """
+    An input of the program: a variable read before any (set ...) binds it.
+    """
+
+    name = "lisp.var"
+
+    var_name = prop_def(StringAttr)
+    result = result_def()
+
+    traits = traits_def(Pure())
+
+    def __init__(self, var_name: str, type: Attribute = f64):
+        super().__init__(result_types=[type], properties={"var_name": StringAttr(var_name)})
+
+
+@irdl_op_definition
+class SetOp(IRDLOperation):
+    """
+    (set name value): names a value. Later references to the name use the
+    result of this op.
+    """
 
+    name = "lisp.set"
 
-class LispDialect(Dialect):
-    name = "lisp"
+    var_name = prop_def(StringAttr)
+    value = operand_def()
+    result = result_def()
 
-    context = Context()
+    traits = traits_def(Pure())
 
-    context.load_dialect(ConstantOp)
+    def __init__(self, var_name: str, value: SSAValue):
+        super().__init__(
+            operands=[value],
+            result_types=[value.type],
+            properties={"var_name": StringAttr(var_name)},
+        )
 
-#     context.register_dialect(LispAddOp)
+    def verify_(self) -> None:
+        if self.result.type != self.value.type:
+            raise VerifyException("lisp.set result type must match its operand")
+
+
+class BinaryOperation(IRDLOperation):
+    """
+    Base class of the elementwise binary ops, which broadcast like NumPy.
+    """
+
+    lhs = operand_def()
+    rhs = operand_def()
+    result = result_def()
+
+    traits = traits_def(Pure())
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(operands=[lhs, rhs], result_types=[self.infer_type(lhs.type, rhs.type)])
+
+    @staticmethod
+    def infer_type(lhs: Attribute, rhs: Attribute) -> Attribute:
+        return broadcast_type(lhs, rhs)
+
+    def verify_(self) -> None:
+        try:
+            expected = self.infer_type(self.lhs.type, self.rhs.type)
+        except ValueError as err:
+            raise VerifyException(f"{self.name}: {err}") from None
+        if self.result.type != expected:
+            raise VerifyException(f"{self.name} result type should be {expected}")
+
+
+@irdl_op_definition
+class AddOp(BinaryOperation):
+    name = "lisp.add"
+
+
+@irdl_op_definition
+class SubOp(BinaryOperation):
+    name = "lisp.sub"
+
+
+@irdl_op_definition
+class MulOp(BinaryOperation):
+    name = "lisp.mul"
+
+
+@irdl_op_definition
+class DivOp(BinaryOperation):
+    name = "lisp.div"
+
+
+@irdl_op_definition
+class MatmulOp(BinaryOperation):
+    name = "lisp.matmul"
+
+    @staticmethod
+    def infer_type(lhs: Attribute, rhs: Attribute) -> Attribute:
+        return matmul_type(lhs, rhs)
+
+
+class FusedOperation(IRDLOperation):
+    """
+    Base class of the fused ops, which evaluate their kernel in a single
+    pass instead of materialising every intermediate tensor.
+    """
+
+    kernel = prop_def(ArrayAttr[StringAttr])
+    result = result_def()
+
+    traits = traits_def(Pure())
+
+    def kernel_tokens(self) -> list[str]:
+        return [token.data for token in self.kernel.data]
+
+    def kernel_arg_types(self) -> list[Attribute]:
+        raise NotImplementedError()
+
+    def verify_(self) -> None:
+        try:
+            expected = kernel_type(self.kernel_tokens(), self.kernel_arg_types())
+        except ValueError as err:
+            raise VerifyException(f"{self.name}: {err}") from None
+        if self.result.type != expected:
+            raise VerifyException(f"{self.name} result type should be {expected}")
+
+
+def _kernel_attr(kernel: Sequence[str]) -> ArrayAttr[StringAttr]:
+    return ArrayAttr([StringAttr(token) for token in kernel])
+
+
+@irdl_op_definition
+class FusedElementwiseOp(FusedOperation):
+    """
+    A chain of elementwise ops; "$i" in the kernel is inputs[i].
+    """
+
+    name = "lisp.fused_elementwise"
+
+    inputs = var_operand_def()
+
+    def __init__(self, inputs: Sequence[SSAValue], kernel: Sequence[str], result_type: Attribute):
+        super().__init__(
+            operands=[inputs],
+            result_types=[result_type],
+            properties={"kernel": _kernel_attr(kernel)},
+        )
+
+    def kernel_arg_types(self) -> list[Attribute]:
+        return [value.type for value in self.inputs]
+
+
+@irdl_op_definition
+class FusedMatmulOp(FusedOperation):
+    """
+    A matmul followed by an elementwise epilogue; "$0" in the kernel is the
+    product lhs @ rhs and "$i" is inputs[i - 1].
+    """
+
+    name = "lisp.fused_matmul"
+
+    lhs = operand_def()
+    rhs = operand_def()
+    inputs = var_operand_def()
+
+    def __init__(
+        self,
+        lhs: SSAValue,
+        rhs: SSAValue,
+        inputs: Sequence[SSAValue],
+        kernel: Sequence[str],
+        result_type: Attribute,
+    ):
+        super().__init__(
+            operands=[lhs, rhs, inputs],
+            result_types=[result_type],
+            properties={"kernel": _kernel_attr(kernel)},
+        )
+
+    def kernel_arg_types(self) -> list[Attribute]:
+        return [matmul_type(self.lhs.type, self.rhs.type)] + [value.type for value in self.inputs]
+
+
+@irdl_op_definition
+class ReturnOp(IRDLOperation):
+    """
+    (return value): the result of the program.
+    """
+
+    name = "lisp.return"
+
+    value = operand_def()
+
+    def __init__(self, value: SSAValue):
+        super().__init__(operands=[value])
+
+
+# Operators a fused kernel may contain
+KERNEL_OPS = {
+    "add": AddOp,
+    "sub": SubOp,
+    "mul": MulOp,
+    "div": DivOp,
+}
+
+
+LispDialect = Dialect(
+    "lisp",
+    [
+        ConstantOp,
+        VarOp,
+        SetOp,
+        AddOp,
+        SubOp,
+        MulOp,
+        DivOp,
+        MatmulOp,
+        FusedElementwiseOp,
+        FusedMatmulOp,
+        ReturnOp,
+    ],
+    [],
+)
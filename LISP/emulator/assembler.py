@@ -0,0 +1,377 @@
+"""
+assembler.py: a two-section RISC-V assembler producing a loadable Program
+
+Assembler is driven either through its methods (the code generator does
+this) or with assemble(), which parses assembly text such as
+
+        .text
+    main:
+        li t0, 10
+    loop:
+        addi t0, t0, -1
+        bnez t0, loop
+        ret
+        .data
+    values:
+        .double 1.5, 2.5
+
+Instructions go to .text and data directives to .data; .data is placed
+after .text, aligned to a page. Labels may be used before they are defined
+and are resolved when the program is built. The usual pseudo-instructions
+(li, la, mv, j, ret, call, beqz, fmv.d, ...) expand to base instructions.
+"""
+import re
+import struct
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .isa import (
+    FLOAT_OPERANDS,
+    FLOAT_REGISTER_NUMBERS,
+    INSTRUCTIONS,
+    INT_REGISTER_NUMBERS,
+    ISAError,
+    Instruction,
+    encode,
+    sign_extend,
+)
+
+# Where programs are loaded unless told otherwise
+TEXT_BASE = 0x10000
+
+PAGE_SIZE = 1 << 12
+
+
+class AssemblerError(ValueError):
+    pass
+
+
+@dataclass
+class Program:
+    """
+    An assembled program: its two sections and the address of every label.
+    """
+    text_base: int
+    text: bytes
+    data_base: int
+    data: bytes
+    symbols: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def end(self) -> int:
+        # First address past the program
+        return self.data_base + len(self.data)
+
+
+# Operand is a register number, an immediate or a label (resolved later)
+Operand = Union[int, str]
+
+
+def _fits(value: int, bits: int) -> bool:
+    return -(1 << (bits - 1)) <= value < 1 << (bits - 1)
+
+
+def _hi_lo(value: int) -> Tuple[int, int]:
+    # Split value into lui/addi parts: (hi << 12) + lo == value, lo in 12 bits
+    lo = sign_extend(value, 12)
+    hi = ((value - lo) >> 12) & 0xFFFFF
+    return sign_extend(hi, 20), lo
+
+
+class Assembler:
+    def __init__(self, text_base: int = TEXT_BASE):
+        self.text_base = text_base
+        # Instructions, with label operands left unresolved until build()
+        self.text: List[Tuple[str, Tuple[Operand, ...], Optional[Callable]]] = []
+        self.data = bytearray()
+        # Label: (section, offset)
+        self.labels: Dict[str, Tuple[str, int]] = {}
+        self.section = "text"
+
+    # Sections and labels
+
+    def label(self, name: str) -> None:
+        if name in self.labels:
+            raise AssemblerError(f"label {name} defined twice")
+        offset = 4 * len(self.text) if self.section == "text" else len(self.data)
+        self.labels[name] = (self.section, offset)
+
+    def align(self, alignment: int) -> None:
+        if self.section == "text":
+            if alignment > 4:
+                while len(self.text) * 4 % alignment:
+                    self.instruction("addi", 0, 0, 0)
+        else:
+            self.data.extend(bytes(-len(self.data) % alignment))
+
+    def raw(self, data: bytes, alignment: int = 1) -> None:
+        # Raw data, e.g. a tensor's buffer, appended to .data
+        self.align(alignment)
+        self.data.extend(data)
+
+    def zero(self, size: int, alignment: int = 8) -> None:
+        self.align(alignment)
+        self.data.extend(bytes(size))
+
+    # Instructions
+
+    def instruction(self, name: str, rd: Operand = 0, rs1: Operand = 0, rs2: Operand = 0, imm: Operand = 0) -> None:
+        """
+        Appends a base instruction; imm may be a label, which becomes the
+        pc-relative offset for branches and jumps.
+        """
+        if name not in INSTRUCTIONS:
+            raise AssemblerError(f"unknown instruction {name}")
+        self.text.append((name, (rd, rs1, rs2, imm), None))
+
+    def _relocated(self, name: str, rd: int, rs1: int, label: str, part: Callable[[int, int], int]) -> None:
+        # part(label address, pc) gives the immediate
+        self.text.append((name, (rd, rs1, 0, label), part))
+
+    def li(self, rd: int, value: int) -> None:
+        value = sign_extend(value, 64)
+        if _fits(value, 12):
+            self.instruction("addi", rd, 0, 0, value)
+        elif _fits(value, 32):
+            hi, lo = _hi_lo(value)
+            self.instruction("lui", rd, imm=hi)
+            if lo:
+                self.instruction("addiw", rd, rd, 0, lo)
+        else:
+            # The upper part, then 12 bits at a time
+            lo = sign_extend(value, 12)
+            self.li(rd, (value - lo) >> 12)
+            self.instruction("slli", rd, rd, 0, 12)
+            if lo:
+                self.instruction("addi", rd, rd, 0, lo)
+
+    def la(self, rd: int, label: str, offset: int = 0) -> None:
+        # Programs live in the low 2 GB, so an absolute lui/addi pair reaches every label
+        self._relocated("lui", rd, 0, label, lambda address, pc: _hi_lo(address + offset)[0])
+        self._relocated("addi", rd, rd, label, lambda address, pc: _hi_lo(address + offset)[1])
+
+    # Building
+
+    def address(self, label: str, data_base: int) -> int:
+        try:
+            section, offset = self.labels[label]
+        except KeyError:
+            raise AssemblerError(f"undefined label {label}") from None
+        return (self.text_base if section == "text" else data_base) + offset
+
+    def build(self) -> Program:
+        text_end = self.text_base + 4 * len(self.text)
+        data_base = (text_end + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+        words = []
+        for index, (name, (rd, rs1, rs2, imm), part) in enumerate(self.text):
+            pc = self.text_base + 4 * index
+            if isinstance(imm, str):
+                address = self.address(imm, data_base)
+                imm = part(address, pc) if part is not None else address - pc
+            try:
+                words.append(encode(Instruction(name, rd, rs1, rs2, imm)))
+            except ISAError as error:
+                raise AssemblerError(f"{error} at {pc:#x}") from None
+
+        symbols = {label: self.address(label, data_base) for label in self.labels}
+        text = struct.pack(f"<{len(words)}I", *words)
+        return Program(self.text_base, text, data_base, bytes(self.data), symbols)
+
+    # Assembly text
+
+    def parse_line(self, line: str) -> None:
+        line = line.split("#", 1)[0].strip()
+        while True:
+            match = _LABEL.match(line)
+            if match is None:
+                break
+            self.label(match.group(1))
+            line = line[match.end():].strip()
+        if not line:
+            return
+
+        name, _, rest = line.partition(" ")
+        operands = [operand.strip() for operand in rest.split(",")] if rest.strip() else []
+        if name.startswith("."):
+            self.directive(name, operands)
+        else:
+            self.mnemonic(name, operands)
+
+    def directive(self, name: str, operands: List[str]) -> None:
+        if name in (".text", ".data"):
+            self.section = name[1:]
+        elif name == ".align" or name == ".p2align":
+            self.align(1 << int(operands[0]))
+        elif name == ".balign":
+            self.align(int(operands[0], 0))
+        elif name in _DATA_FORMATS:
+            fmt = _DATA_FORMATS[name]
+            if self.section != "data":
+                raise AssemblerError(f"{name} outside of .data")
+            for operand in operands:
+                value = float(operand) if fmt == "<d" else int(operand, 0)
+                self.data.extend(struct.pack(fmt, value))
+        elif name == ".zero":
+            self.data.extend(bytes(int(operands[0], 0)))
+        elif name in (".globl", ".global", ".section"):
+            pass
+        else:
+            raise AssemblerError(f"unknown directive {name}")
+
+    def mnemonic(self, name: str, operands: List[str]) -> None:
+        pseudo = _PSEUDO.get(name)
+        if pseudo is not None:
+            pseudo(self, operands)
+            return
+        spec = INSTRUCTIONS.get(name)
+        if spec is None:
+            raise AssemblerError(f"unknown instruction {name}")
+
+        fmt = spec[0]
+        floats = FLOAT_OPERANDS.get(name, ())
+        reg = lambda field, operand: _register(operand, field in floats)
+        if fmt == "FC" and len(operands) == 2:
+            # fmv.x.d and fmv.d.x have a single source
+            rd, rs1 = operands
+            self.instruction(name, reg("rd", rd), reg("rs1", rs1))
+        elif fmt in ("R", "FR", "FC"):
+            rd, rs1, rs2 = operands
+            self.instruction(name, reg("rd", rd), reg("rs1", rs1), reg("rs2", rs2))
+        elif fmt == "FU":
+            # An optional rounding mode is accepted and ignored
+            rd, rs1 = operands[:2]
+            self.instruction(name, reg("rd", rd), reg("rs1", rs1))
+        elif fmt in ("I", "SH", "SHW") and spec[1] in _MEMORY_OPCODES or name == "jalr" and len(operands) == 2:
+            # ld rd, imm(rs1)
+            rd, address = operands
+            imm, rs1 = _memory_operand(address)
+            self.instruction(name, reg("rd", rd), _register(rs1, False), 0, imm)
+        elif name in ("fence", "fence.i"):
+            self.instruction(name)
+        elif fmt in ("I", "SH", "SHW"):
+            rd, rs1, imm = operands
+            self.instruction(name, reg("rd", rd), reg("rs1", rs1), 0, _immediate(imm))
+        elif fmt == "S":
+            rs2, address = operands
+            imm, rs1 = _memory_operand(address)
+            self.instruction(name, 0, _register(rs1, False), reg("rs2", rs2), imm)
+        elif fmt == "B":
+            rs1, rs2, target = operands
+            self.instruction(name, 0, reg("rs1", rs1), reg("rs2", rs2), _target(target))
+        elif fmt == "U":
+            rd, imm = operands
+            self.instruction(name, reg("rd", rd), imm=_immediate(imm))
+        elif fmt == "J":
+            if len(operands) == 1:
+                operands = ["ra"] + operands
+            rd, target = operands
+            self.instruction(name, reg("rd", rd), imm=_target(target))
+        else:
+            self.instruction(name)
+
+
+def assemble(source: str, text_base: int = TEXT_BASE) -> Program:
+    """
+    Assembles source text into a Program.
+    """
+    assembler = Assembler(text_base)
+    for number, line in enumerate(source.splitlines(), 1):
+        try:
+            assembler.parse_line(line)
+        except (AssemblerError, ValueError, KeyError) as error:
+            raise AssemblerError(f"line {number}: {error}: {line.strip()}") from None
+    return assembler.build()
+
+
+_LABEL = re.compile(r"([A-Za-z_.$][\w.$]*):")
+_MEMORY = re.compile(r"(.*)\((\w+)\)$")
+_MEMORY_OPCODES = {INSTRUCTIONS["ld"][1], INSTRUCTIONS["fld"][1]}
+
+_DATA_FORMATS = {
+    ".byte": "<b",
+    ".half": "<h",
+    ".word": "<i",
+    ".dword": "<q",
+    ".double": "<d",
+}
+
+
+def _register(operand: str, floating: bool) -> int:
+    names = FLOAT_REGISTER_NUMBERS if floating else INT_REGISTER_NUMBERS
+    try:
+        return names[operand]
+    except KeyError:
+        kind = "floating-point" if floating else "integer"
+        raise AssemblerError(f"unknown {kind} register {operand}") from None
+
+
+def _immediate(operand: str) -> int:
+    return int(operand, 0)
+
+
+def _target(operand: str) -> Operand:
+    # A label, or a numeric pc-relative offset
+    try:
+        return int(operand, 0)
+    except ValueError:
+        return operand
+
+
+def _memory_operand(operand: str) -> Tuple[int, str]:
+    match = _MEMORY.match(operand)
+    if match is None:
+        raise AssemblerError(f"expected offset(register), got {operand}")
+    offset = match.group(1).strip()
+    return (int(offset, 0) if offset else 0), match.group(2)
+
+
+def _pseudo_branch(name: str, swap: bool = False, zero: Optional[str] = None):
+    # Branches with swapped operands (bgt, ble) or against zero (beqz, ...)
+    def expand(assembler: Assembler, operands: List[str]) -> None:
+        if zero is not None:
+            rs, target = operands
+            rs1, rs2 = (rs, "zero") if zero == "rhs" else ("zero", rs)
+        else:
+            rs1, rs2, target = operands
+            if swap:
+                rs1, rs2 = rs2, rs1
+        assembler.instruction(name, 0, _register(rs1, False), _register(rs2, False), _target(target))
+    return expand
+
+
+def _pseudo_float(name: str):
+    # fmv.d, fneg.d and fabs.d are sign injections of a register with itself
+    def expand(assembler: Assembler, operands: List[str]) -> None:
+        rd, rs = operands
+        assembler.instruction(name, _register(rd, True), _register(rs, True), _register(rs, True))
+    return expand
+
+
+_PSEUDO: Dict[str, Callable[[Assembler, List[str]], None]] = {
+    "nop": lambda asm, ops: asm.instruction("addi", 0, 0, 0, 0),
+    "li": lambda asm, ops: asm.li(_register(ops[0], False), _immediate(ops[1])),
+    "la": lambda asm, ops: asm.la(_register(ops[0], False), ops[1]),
+    "mv": lambda asm, ops: asm.instruction("addi", _register(ops[0], False), _register(ops[1], False), 0, 0),
+    "not": lambda asm, ops: asm.instruction("xori", _register(ops[0], False), _register(ops[1], False), 0, -1),
+    "neg": lambda asm, ops: asm.instruction("sub", _register(ops[0], False), 0, _register(ops[1], False)),
+    "seqz": lambda asm, ops: asm.instruction("sltiu", _register(ops[0], False), _register(ops[1], False), 0, 1),
+    "snez": lambda asm, ops: asm.instruction("sltu", _register(ops[0], False), 0, _register(ops[1], False)),
+    "j": lambda asm, ops: asm.instruction("jal", 0, imm=_target(ops[0])),
+    "jr": lambda asm, ops: asm.instruction("jalr", 0, _register(ops[0], False), 0, 0),
+    "ret": lambda asm, ops: asm.instruction("jalr", 0, INT_REGISTER_NUMBERS["ra"], 0, 0),
+    "call": lambda asm, ops: asm.instruction("jal", INT_REGISTER_NUMBERS["ra"], imm=_target(ops[0])),
+    "beqz": _pseudo_branch("beq", zero="rhs"),
+    "bnez": _pseudo_branch("bne", zero="rhs"),
+    "bltz": _pseudo_branch("blt", zero="rhs"),
+    "bgez": _pseudo_branch("bge", zero="rhs"),
+    "blez": _pseudo_branch("bge", zero="lhs"),
+    "bgtz": _pseudo_branch("blt", zero="lhs"),
+    "bgt": _pseudo_branch("blt", swap=True),
+    "ble": _pseudo_branch("bge", swap=True),
+    "bgtu": _pseudo_branch("bltu", swap=True),
+    "bleu": _pseudo_branch("bgeu", swap=True),
+    "fmv.d": _pseudo_float("fsgnj.d"),
+    "fneg.d": _pseudo_float("fsgnjn.d"),
+    "fabs.d": _pseudo_float("fsgnjx.d"),
+}
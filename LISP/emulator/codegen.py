@@ -0,0 +1,581 @@
+"""
+codegen.py: RISC-V code generation for lowered lisp programs
+
+generate() turns the func/arith/scf/memref module of lowering.py into an
+RV64IMD Program whose main follows the LP64D calling convention: tensor
+inputs are passed as pointers in a0-a7 and scalar inputs in fa0-fa7, in the
+order of @main's arguments, and the result comes back in fa0 (a scalar) or
+a0 (a pointer to the result tensor).
+
+- tensor constants become data, and every memref.alloc a static buffer, so
+  a program is not reentrant: each call overwrites the previous result
+- values get registers by linear scan over the ops in order, where a value
+  used inside a loop stays live until the end of that loop; values left
+  without a register live in a slot of the scalar area that gp points into
+- index constants are never held in registers, they are folded into
+  immediates (address offsets, loop bounds) or materialized with li
+- calls to the accelerator's functions (ACCELERATOR_PREFIX) become its
+  lacc.* instructions, see lisp_accelerator_instruction_functions.py
+- the code of every top-level op of @main maps back to the source location
+  in its lisp.loc attribute, if it has one, see MachineProgram.location
+"""
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from math import prod
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from xdsl.dialects import arith, func, memref, scf
+from xdsl.dialects.builtin import FloatAttr, IndexType, IntegerAttr, MemRefType, ModuleOp, UnrankedMemRefType
+from xdsl.ir import Block, BlockArgument, Operation, SSAValue
+
+from ..dialects.lisp import dense_values, get_location
+from ..frontend import location as source
+from ..passes.lowering import ACCELERATOR_PREFIX
+from .assembler import Assembler, Program
+from .isa import FLOAT_REGISTER_NUMBERS as F
+from .isa import INSTRUCTIONS
+from .isa import INT_REGISTER_NUMBERS as X
+
+
+class CodegenError(Exception):
+    pass
+
+
+# Registers handed out by the allocator, caller-saved ones first
+INT_POOL = tuple(X[name] for name in (
+    "t0", "t1", "t2", "a0", "a1", "a2", "a3", "a4", "a5", "a6", "a7",
+    "s0", "s1", "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9", "s10", "s11",
+))
+FLOAT_POOL = tuple(F[name] for name in (
+    "ft0", "ft1", "ft2", "ft3", "ft4", "ft5", "ft6", "ft7", "ft8",
+    "fa0", "fa1", "fa2", "fa3", "fa4", "fa5", "fa6", "fa7",
+    "fs0", "fs1", "fs2", "fs3", "fs4", "fs5", "fs6", "fs7", "fs8", "fs9", "fs10", "fs11",
+))
+_INT_SAVED = {X[f"s{n}"] for n in range(12)}
+_FLOAT_SAVED = {F[f"fs{n}"] for n in range(12)}
+
+# Scratch registers for operands and results that have no register of their own
+ZERO, RA, SP, GP = X["zero"], X["ra"], X["sp"], X["gp"]
+T3, T4, T5, T6 = X["t3"], X["t4"], X["t5"], X["t6"]
+FT9, FT10, FT11 = F["ft9"], F["ft10"], F["ft11"]
+
+# Slots of the scalar area are addressed as 12-bit offsets from gp
+_MAX_SLOTS = 512
+_GP_BIAS = 2048
+
+_ARITH_FLOAT_OPS = {
+    arith.AddfOp: "fadd.d",
+    arith.SubfOp: "fsub.d",
+    arith.MulfOp: "fmul.d",
+    arith.DivfOp: "fdiv.d",
+}
+
+
+@dataclass
+class MachineProgram:
+    """
+    A program generated for the emulator, and how to call its main.
+    """
+    program: Program
+    # Name and shape (None for a scalar) of every input, in argument order
+    inputs: List[Tuple[str, Optional[Tuple[int, ...]]]] = field(default_factory=list)
+    # Shape of the result, None for a scalar; has_result is False when the
+    # program returns nothing
+    result_shape: Optional[Tuple[int, ...]] = None
+    has_result: bool = False
+    # (address, source location) in address order: the code from each
+    # address up to the next one was generated for that location
+    source_map: List[Tuple[int, Optional[source.Location]]] = field(default_factory=list)
+
+    @property
+    def entry(self) -> int:
+        return self.program.symbols["main"]
+
+    def location(self, address: int) -> Optional[source.Location]:
+        """
+        Returns the source location the instruction at address was generated
+        for, or None.
+        """
+        index = bisect_right(self.source_map, address, key=lambda entry: entry[0])
+        return self.source_map[index - 1][1] if index else None
+
+
+@dataclass
+class _Slot:
+    # A value without a register: its offset from gp
+    offset: int
+
+
+# Where a value lives: a register number or a slot
+Location = Union[int, _Slot]
+
+
+def _is_float(value: SSAValue) -> bool:
+    return not isinstance(value.type, (IndexType, MemRefType, UnrankedMemRefType))
+
+
+def _uncast(value: SSAValue) -> SSAValue:
+    # memref.cast only changes the type: the pointer is the source's
+    while isinstance(value.owner, memref.CastOp):
+        value = value.owner.source
+    return value
+
+
+def _fits12(value: int) -> bool:
+    return -2048 <= value < 2048
+
+
+class RISCVCodegen:
+    def __init__(self):
+        self.asm = Assembler()
+        # Position of every op in program order, and of the end of every loop
+        self.position: Dict[Operation, int] = {}
+        self.loop_end: Dict[Operation, int] = {}
+        self.locations: Dict[SSAValue, Location] = {}
+        # Data labels of the pointers memref.alloc and memref.get_global produce
+        self.pointers: Dict[SSAValue, str] = {}
+        # Initial contents of the scalar area, one double or zero per slot
+        self.slots: List[float] = []
+        # (is float, register) of the callee-saved registers handed out
+        self.used_saved: set = set()
+        self.source_map: List[Tuple[int, Optional[source.Location]]] = []
+        self._labels = 0
+
+    def generate(self, module: ModuleOp) -> MachineProgram:
+        main = None
+        self.asm.section = "data"
+        for op in module.body.block.ops:
+            if isinstance(op, memref.GlobalOp):
+                self.asm.label(op.sym_name.data)
+                values = np.ascontiguousarray(dense_values(op.initial_value), dtype="<f8")
+                self.asm.raw(values.tobytes(), alignment=8)
+                self.asm.align(8)
+            elif isinstance(op, func.FuncOp) and op.sym_name.data == "main":
+                main = op
+            elif isinstance(op, func.FuncOp) and op.is_declaration and op.sym_name.data.startswith(ACCELERATOR_PREFIX):
+                # Implemented by the accelerator's instructions
+                pass
+            else:
+                raise CodegenError(f"cannot generate code for {op.name}")
+        if main is None:
+            raise CodegenError("the module has no func.func @main")
+
+        block = main.body.block
+        self.number(block)
+        self.allocate(block)
+
+        self.asm.section = "text"
+        self.asm.label("main")
+        self.prologue()
+        for op in block.ops:
+            self.map_source(op)
+            self.emit_op(op)
+
+        # The scalar area, after everything else in .data
+        self.asm.section = "data"
+        self.asm.align(8)
+        self.asm.label("__scalars")
+        self.asm.raw(np.array(self.slots, dtype="<f8").tobytes())
+
+        inputs = [
+            (arg.name_hint, tuple(arg.type.get_shape()) if isinstance(arg.type, MemRefType) else None)
+            for arg in block.args
+        ]
+        outputs = main.function_type.outputs.data
+        result_shape = tuple(outputs[0].get_shape()) if outputs and isinstance(outputs[0], MemRefType) else None
+        return MachineProgram(self.asm.build(), inputs, result_shape, bool(outputs), self.source_map)
+
+    def map_source(self, op: Operation) -> None:
+        # The code from here on belongs to op's location
+        text = get_location(op)
+        location = source.Location.parse(text) if text is not None else None
+        address = self.asm.text_base + 4 * len(self.asm.text)
+        if self.source_map and self.source_map[-1][0] == address:
+            # The previous op emitted no code
+            self.source_map.pop()
+        if not self.source_map or self.source_map[-1][1] != location:
+            self.source_map.append((address, location))
+
+    # Liveness and register allocation
+
+    def number(self, block: Block) -> None:
+        for op in block.ops:
+            self.position[op] = len(self.position) + len(self.loop_end)
+            if isinstance(op, scf.ForOp):
+                self.number(op.body.block)
+                self.loop_end[op] = len(self.position) + len(self.loop_end)
+
+    def interval(self, value: SSAValue, start: int) -> int:
+        # The last position value is live at: uses inside a loop that does not
+        # define it keep it live to the end of that loop, as every iteration
+        # reads it
+        end = start
+        for use in value.uses:
+            user = use.operation
+            end = max(end, self.position[user])
+            if isinstance(user, memref.CastOp):
+                # Its uses are uses of value
+                end = max(end, self.interval(user.dest, start))
+            if isinstance(user, scf.ForOp) and use.index > 0:
+                # The upper bound and step are read on every iteration
+                end = max(end, self.loop_end[user])
+            parent = user.parent_op()
+            while isinstance(parent, scf.ForOp):
+                if self.position[parent] <= start:
+                    # This loop, and every one around it, contains the definition
+                    break
+                end = max(end, self.loop_end[parent])
+                parent = parent.parent_op()
+        return end
+
+    def allocate(self, block: Block) -> None:
+        intervals = []
+        int_args = float_args = 0
+        for arg in block.args:
+            # Arguments arrive in their ABI registers and stay there
+            if (float_args if _is_float(arg) else int_args) == 8:
+                raise CodegenError("more than 8 tensor or 8 scalar inputs")
+            if _is_float(arg):
+                register, float_args = F[f"fa{float_args}"], float_args + 1
+            else:
+                register, int_args = X[f"a{int_args}"], int_args + 1
+            # Defined before the first op
+            intervals.append((-1, self.interval(arg, -1), arg, register))
+
+        for op in self.position:
+            values = list(op.results)
+            if isinstance(op, scf.ForOp):
+                values.append(op.body.block.args[0])
+            for value in values:
+                if _index_constant(value) is not None or not value.uses and not isinstance(value, BlockArgument):
+                    continue
+                if isinstance(op, memref.CastOp):
+                    continue
+                start = self.position[op]
+                end = self.interval(value, start)
+                if isinstance(value, BlockArgument):
+                    # The induction variable is updated at the end of its loop
+                    end = max(end, self.loop_end[op])
+                intervals.append((start, end, value, None))
+
+        intervals.sort(key=lambda interval: interval[0])
+        free = {False: list(INT_POOL), True: list(FLOAT_POOL)}
+        active: List[Tuple[int, SSAValue, int, bool]] = []
+        for start, end, value, fixed in intervals:
+            # Registers of intervals that ended before start are free again
+            for interval in [interval for interval in active if interval[0] < start]:
+                active.remove(interval)
+                free[_is_float(interval[1])].append(interval[2])
+
+            pool = free[_is_float(value)]
+            if fixed is not None:
+                pool.remove(fixed)
+                register = fixed
+            elif pool:
+                register = pool.pop(0)
+            else:
+                # Spill whichever interval ends last
+                candidates = [interval for interval in active if interval[1] is not None
+                              and _is_float(interval[1]) == _is_float(value) and not interval[3]]
+                victim = max(candidates, key=lambda interval: interval[0], default=None)
+                if victim is None or victim[0] <= end:
+                    self.spill(value)
+                    continue
+                active.remove(victim)
+                self.spill(victim[1])
+                register = victim[2]
+            self.locations[value] = register
+            floating = _is_float(value)
+            if register in (_FLOAT_SAVED if floating else _INT_SAVED):
+                self.used_saved.add((floating, register))
+            active.append((end, value, register, fixed is not None))
+            active.sort(key=lambda interval: interval[0])
+
+    def spill(self, value: SSAValue) -> None:
+        if value in self.pointers or isinstance(value.owner, (memref.AllocOp, memref.GetGlobalOp)):
+            # Pointers are rematerialized with la instead
+            self.locations[value] = _Slot(0)
+            return
+        constant = _float_constant(value)
+        self.locations[value] = self.slot(constant if constant is not None else 0.0)
+
+    def slot(self, initial: float) -> _Slot:
+        if len(self.slots) == _MAX_SLOTS:
+            raise CodegenError("too many values live at once")
+        self.slots.append(initial)
+        return _Slot(8 * (len(self.slots) - 1) - _GP_BIAS)
+
+    # Operands and results
+
+    def int_operand(self, value: SSAValue, scratch: int) -> int:
+        """
+        Returns a register holding the integer value, loading it into
+        scratch if it has none.
+        """
+        constant = _index_constant(value)
+        if constant is not None:
+            if constant == 0:
+                return ZERO
+            self.asm.li(scratch, constant)
+            return scratch
+        location = self.locations[value]
+        if isinstance(location, int):
+            return location
+        if value in self.pointers:
+            self.asm.la(scratch, self.pointers[value])
+        else:
+            self.asm.instruction("ld", scratch, GP, 0, location.offset)
+        return scratch
+
+    def float_operand(self, value: SSAValue, scratch: int) -> int:
+        location = self.locations[value]
+        if isinstance(location, int):
+            return location
+        self.asm.instruction("fld", scratch, GP, 0, location.offset)
+        return scratch
+
+    def result(self, value: SSAValue, scratch: int) -> int:
+        # Register to compute value into; finish() stores it if spilled
+        location = self.locations.get(value)
+        return location if isinstance(location, int) else scratch
+
+    def finish(self, value: SSAValue, register: int) -> None:
+        location = self.locations.get(value)
+        if isinstance(location, _Slot):
+            self.asm.instruction("fsd" if _is_float(value) else "sd", 0, GP, register, location.offset)
+
+    # Emission
+
+    def new_label(self, hint: str) -> str:
+        self._labels += 1
+        return f".L{hint}{self._labels}"
+
+    def prologue(self) -> None:
+        # Save gp and the callee-saved registers main uses, point gp at the scalar area
+        self.saved = [(False, GP)] + sorted(self.used_saved)
+        self.frame = (8 * len(self.saved) + 15) // 16 * 16
+        self.asm.instruction("addi", SP, SP, 0, -self.frame)
+        for index, (floating, register) in enumerate(self.saved):
+            self.asm.instruction("fsd" if floating else "sd", 0, SP, register, 8 * index)
+        self.asm.la(GP, "__scalars", _GP_BIAS)
+
+    def epilogue(self) -> None:
+        for index, (floating, register) in enumerate(self.saved):
+            self.asm.instruction("fld" if floating else "ld", register, SP, 0, 8 * index)
+        self.asm.instruction("addi", SP, SP, 0, self.frame)
+        self.asm.instruction("jalr", ZERO, RA, 0, 0)
+
+    def emit_block(self, block: Block) -> None:
+        for op in block.ops:
+            self.emit_op(op)
+
+    def emit_op(self, op: Operation) -> None:
+        if op.results and not any(result.uses for result in op.results):
+            # Nothing reads it and it has no side effects
+            return
+
+        if isinstance(op, arith.ConstantOp):
+            value = op.result
+            if isinstance(op.value, FloatAttr):
+                constant = op.value.value.data
+                location = self.locations[value]
+                if isinstance(location, int):
+                    self.asm.instruction("fld", location, GP, 0, self.slot(constant).offset)
+                    return
+                # The value's slot already holds the constant
+            return
+        if type(op) in _ARITH_FLOAT_OPS:
+            lhs = self.float_operand(op.lhs, FT9)
+            rhs = self.float_operand(op.rhs, FT10)
+            rd = self.result(op.result, FT11)
+            self.asm.instruction(_ARITH_FLOAT_OPS[type(op)], rd, lhs, rhs)
+            self.finish(op.result, rd)
+        elif isinstance(op, arith.AddiOp):
+            self.emit_addi(op)
+        elif isinstance(op, arith.MinSIOp):
+            self.emit_minsi(op)
+        elif isinstance(op, (memref.AllocOp, memref.GetGlobalOp)):
+            self.emit_pointer(op)
+        elif isinstance(op, memref.LoadOp):
+            base, offset = self.address(op.memref, op.indices)
+            rd = self.result(op.res, FT11)
+            self.asm.instruction("fld", rd, base, 0, offset)
+            self.finish(op.res, rd)
+        elif isinstance(op, memref.StoreOp):
+            value = self.float_operand(op.value, FT9)
+            base, offset = self.address(op.memref, op.indices)
+            self.asm.instruction("fsd", 0, base, value, offset)
+        elif isinstance(op, scf.ForOp):
+            self.emit_for(op)
+        elif isinstance(op, scf.YieldOp):
+            pass
+        elif isinstance(op, func.ReturnOp):
+            self.emit_return(op)
+        elif isinstance(op, memref.CastOp):
+            pass
+        elif isinstance(op, func.CallOp) and op.callee.string_value().startswith(ACCELERATOR_PREFIX):
+            self.emit_accelerator_call(op)
+        else:
+            raise CodegenError(f"cannot generate code for {op.name}")
+
+    def emit_addi(self, op: arith.AddiOp) -> None:
+        lhs, rhs = op.lhs, op.rhs
+        if _index_constant(lhs) is not None:
+            lhs, rhs = rhs, lhs
+        rd = self.result(op.result, T3)
+        constant = _index_constant(rhs)
+        if constant is not None and _fits12(constant):
+            self.asm.instruction("addi", rd, self.int_operand(lhs, T4), 0, constant)
+        else:
+            self.asm.instruction("add", rd, self.int_operand(lhs, T4), self.int_operand(rhs, T5))
+        self.finish(op.result, rd)
+
+    def emit_minsi(self, op: arith.MinSIOp) -> None:
+        # Branch-free: min(a, b) = b ^ ((a ^ b) & -(a < b))
+        a = self.int_operand(op.lhs, T4)
+        b = self.int_operand(op.rhs, T5)
+        rd = self.result(op.result, T3)
+        self.asm.instruction("slt", T6, a, b)
+        self.asm.instruction("sub", T6, ZERO, T6)
+        self.asm.instruction("xor", rd, a, b)
+        self.asm.instruction("and", rd, rd, T6)
+        self.asm.instruction("xor", rd, b, rd)
+        self.finish(op.result, rd)
+
+    def emit_accelerator_call(self, op: func.CallOp) -> None:
+        # lacc.shape depth, rows, cols then the operation on dst, lhs, rhs
+        name = f"lacc.{op.callee.string_value()[len(ACCELERATOR_PREFIX):]}"
+        if name not in INSTRUCTIONS:
+            raise CodegenError(f"the accelerator has no {name} instruction")
+        dst, lhs, rhs, *sizes = op.arguments
+        if len(sizes) == 2:
+            sizes.append(None)
+        rows, cols, depth = (
+            ZERO if size is None else self.int_operand(size, scratch)
+            for size, scratch in zip(sizes, (T3, T4, T5))
+        )
+        self.asm.instruction("lacc.shape", depth, rows, cols)
+        self.asm.instruction(
+            name, self.int_operand(_uncast(dst), T3), self.int_operand(_uncast(lhs), T4),
+            self.int_operand(_uncast(rhs), T5)
+        )
+
+    def emit_pointer(self, op: Operation) -> None:
+        value = op.results[0]
+        if isinstance(op, memref.AllocOp):
+            label = f"__buffer_{len(self.pointers)}"
+            self.asm.section = "data"
+            self.asm.label(label)
+            self.asm.zero(8 * prod(value.type.get_shape()))
+            self.asm.section = "text"
+        else:
+            label = op.name_.root_reference.data
+        self.pointers[value] = label
+        location = self.locations[value]
+        if isinstance(location, int):
+            self.asm.la(location, label)
+
+    def address(self, pointer: SSAValue, indices) -> Tuple[int, int]:
+        """
+        Computes the address of pointer[indices], a row-major array of
+        doubles.
+
+        Returns:
+            A base register and a 12-bit offset from it.
+        """
+        shape = pointer.type.get_shape()
+        strides = [8 * prod(shape[dim + 1:]) for dim in range(len(shape))]
+        offset = 0
+        terms = []
+        for index, stride in zip(indices, strides):
+            constant = _index_constant(index)
+            if constant is not None:
+                offset += constant * stride
+            else:
+                terms.append((index, stride))
+
+        if not terms:
+            base = self.int_operand(pointer, T5)
+        else:
+            # T5 accumulates the byte offset, T6 holds one term
+            for n, (index, stride) in enumerate(terms):
+                target = T5 if n == 0 else T6
+                register = self.int_operand(index, T6)
+                if stride & (stride - 1) == 0:
+                    self.asm.instruction("slli", target, register, 0, stride.bit_length() - 1)
+                else:
+                    self.asm.li(T4, stride)
+                    self.asm.instruction("mul", target, register, T4)
+                if n:
+                    self.asm.instruction("add", T5, T5, T6)
+            self.asm.instruction("add", T5, T5, self.int_operand(pointer, T6))
+            base = T5
+
+        if not _fits12(offset):
+            self.asm.li(T6, offset)
+            self.asm.instruction("add", T5, base, T6)
+            base, offset = T5, 0
+        return base, offset
+
+    def emit_for(self, op: scf.ForOp) -> None:
+        iv = op.body.block.args[0]
+        lower, upper, step = _index_constant(op.lb), _index_constant(op.ub), _index_constant(op.step)
+        if lower is not None and upper is not None and lower >= upper:
+            return
+        body, end = self.new_label("loop"), self.new_label("done")
+
+        counter = self.result(iv, T3)
+        if lower is not None:
+            self.asm.li(counter, lower)
+        else:
+            self.asm.instruction("addi", counter, self.int_operand(op.lb, T3), 0, 0)
+        self.finish(iv, counter)
+        if lower is None or upper is None:
+            self.asm.instruction("bge", 0, counter, self.int_operand(op.ub, T4), end)
+
+        self.asm.label(body)
+        self.emit_block(op.body.block)
+
+        # Rotated loop: the test is at the bottom, one branch per iteration
+        counter = self.int_operand(iv, T3)
+        if step is not None and _fits12(step):
+            self.asm.instruction("addi", counter, counter, 0, step)
+        else:
+            self.asm.instruction("add", counter, counter, self.int_operand(op.step, T5))
+        self.finish(iv, counter)
+        self.asm.instruction("blt", 0, counter, self.int_operand(op.ub, T4), body)
+        self.asm.label(end)
+
+    def emit_return(self, op: func.ReturnOp) -> None:
+        if op.arguments:
+            value = op.arguments[0]
+            if _is_float(value):
+                register = self.float_operand(value, FT9)
+                self.asm.instruction("fsgnj.d", F["fa0"], register, register)
+            else:
+                self.asm.instruction("addi", X["a0"], self.int_operand(value, T3), 0, 0)
+        self.epilogue()
+
+
+def _index_constant(value: SSAValue) -> Optional[int]:
+    owner = value.owner
+    if isinstance(owner, arith.ConstantOp) and isinstance(value.type, IndexType):
+        attr = owner.value
+        if isinstance(attr, IntegerAttr):
+            return attr.value.data
+    return None
+
+
+def _float_constant(value: SSAValue) -> Optional[float]:
+    owner = value.owner
+    if isinstance(owner, arith.ConstantOp) and isinstance(owner.value, FloatAttr):
+        return owner.value.value.data
+    return None
+
+
+def generate(module: ModuleOp) -> MachineProgram:
+    """
+    Generates the RISC-V program of a module lowered by LispLoweringPass.
+    """
+    return RISCVCodegen().generate(module)
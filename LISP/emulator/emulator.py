@@ -0,0 +1,742 @@
+"""
+emulator.py: an RV64IMD emulator that runs cached, pre-decoded basic blocks
+
+Instructions are decoded once. Starting at a block's first address, the
+emulator decodes instructions until the next branch, jump or system
+instruction (or the end of the page) and turns each one into a Python
+closure with its registers and immediate already bound, so executing it is
+a single call with no decoding and no dispatch on the opcode. The block is
+a tuple of those closures plus an exit closure that returns the address of
+the next block, and it is cached by its start address.
+
+Pages holding translated code are watched: a store into one of them drops
+the cached blocks on that page, so self-modifying code is decoded again
+the next time it runs. A block that is already running finishes with the
+instructions it was decoded with, the behaviour FENCE.I makes visible on
+hardware.
+
+Setting a Profile as Emulator.profile counts the executions of every
+block, see profile.py.
+
+Registers are Python ints (signed 64-bit) and floats, and memory is a flat
+Memory buffer starting at address 0, accessed with struct; the host maps
+NumPy arrays onto it with array().
+"""
+import math
+import struct
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .assembler import PAGE_SIZE, Program
+from .isa import RM_RDN, RM_RTZ, RM_RUP, ISAError, Instruction, decode
+from .lisp_accelerator_instruction_functions import Accelerator
+from .memory import EmulatorError, Memory, MemoryFault
+from .profile import Profile
+
+# Default size of guest memory
+DEFAULT_MEMORY_SIZE = 64 << 20
+
+# Returning to (or jumping to) this address stops the emulator
+EXIT_ADDRESS = 0
+
+# Longest run of instructions in one block
+MAX_BLOCK_SIZE = 256
+
+# Syscall numbers (a7) of ecall, as on Linux
+SYS_WRITE = 64
+SYS_EXIT = 93
+
+_PAGE_SHIFT = PAGE_SIZE.bit_length() - 1
+_SIGN = 1 << 63
+_MASK = (1 << 64) - 1
+_SIGN32 = 1 << 31
+_MASK32 = (1 << 32) - 1
+
+_FETCH = struct.Struct("<I").unpack_from
+_DOUBLE = struct.Struct("<d")
+_INT64 = struct.Struct("<q")
+
+# name: (struct format, size) of the loads and stores
+_LOADS = {"lb": "<b", "lh": "<h", "lw": "<i", "ld": "<q", "lbu": "<B", "lhu": "<H", "lwu": "<I"}
+_STORES = {"sb": ("<B", 0xFF), "sh": ("<H", 0xFFFF), "sw": ("<I", _MASK32), "sd": ("<Q", _MASK)}
+
+
+def _wrap(value: int) -> int:
+    # Two's complement wrap-around to 64 bits
+    return ((value + _SIGN) & _MASK) - _SIGN
+
+
+def _wrap32(value: int) -> int:
+    # The low 32 bits, sign-extended, as the *W instructions produce
+    return ((value + _SIGN32) & _MASK32) - _SIGN32
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        return -1
+    quotient = abs(a) // abs(b)
+    return _wrap(-quotient if (a < 0) != (b < 0) else quotient)
+
+
+def _rem(a: int, b: int) -> int:
+    if b == 0:
+        return a
+    remainder = abs(a) % abs(b)
+    return -remainder if a < 0 else remainder
+
+
+def _fdiv(a: float, b: float) -> float:
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def _fsqrt(a: float) -> float:
+    return math.sqrt(a) if a >= 0 else math.nan
+
+
+def _to_int(value: float, rm: int, bits: int) -> int:
+    # fcvt.w.d and fcvt.l.d: round with rm, saturating like the hardware
+    high = (1 << (bits - 1)) - 1
+    if value != value:
+        return high
+    if value in (math.inf, -math.inf):
+        return high if value > 0 else -high - 1
+    if rm == RM_RTZ:
+        result = math.trunc(value)
+    elif rm == RM_RDN:
+        result = math.floor(value)
+    elif rm == RM_RUP:
+        result = math.ceil(value)
+    else:
+        result = round(value)
+    return max(-high - 1, min(high, result))
+
+
+class Block:
+    """
+    A translated basic block.
+    """
+    __slots__ = ("start", "end", "body", "exit", "names", "size")
+
+    def __init__(
+        self,
+        start: int,
+        end: int,
+        body: Tuple[Callable[[], None], ...],
+        exit: Callable[[], int],
+        names: Tuple[str, ...],
+    ):
+        self.start = start
+        # First address past the block
+        self.end = end
+        self.body = body
+        # Returns the address of the next block
+        self.exit = exit
+        # Mnemonic of every instruction, for profiles
+        self.names = names
+        # Instructions retired by running the block
+        self.size = len(names)
+
+
+class Emulator:
+    def __init__(
+        self,
+        memory_size: int = DEFAULT_MEMORY_SIZE,
+        use_mmap: Optional[bool] = None,
+        accelerator: Optional[Accelerator] = None,
+    ):
+        self.memory = Memory(memory_size, use_mmap)
+        # Runs the lacc.* instructions
+        self.accelerator = accelerator if accelerator is not None else Accelerator()
+        self.x: List[int] = [0] * 32
+        self.f: List[float] = [0.0] * 32
+
+        # Translated blocks by start address, and the start addresses of the
+        # blocks on every page
+        self.blocks: Dict[int, Block] = {}
+        self.page_blocks: Dict[int, List[int]] = {}
+        # Non-zero for every page a store must check for translated code
+        self.code_pages = bytearray((memory_size >> _PAGE_SHIFT) + 1)
+
+        self.instret = 0
+        self.translations = 0
+        self.invalidations = 0
+        self.exit_code: Optional[int] = None
+        self.output = bytearray()
+        # Counts the executions of every block while set
+        self.profile: Optional[Profile] = None
+
+    # Memory seen from the host
+
+    def write(self, address: int, data: bytes) -> None:
+        self.memory.write(address, data)
+        self.invalidate(address, len(data))
+
+    def read(self, address: int, size: int) -> bytes:
+        return self.memory.read(address, size)
+
+    def array(self, address: int, shape: Sequence[int], dtype="<f8") -> np.ndarray:
+        """
+        Maps an array onto guest memory at address, see Memory.array.
+        Translated code in the range is dropped now; writes to code through
+        the array later are not watched, unlike guest stores and write().
+        """
+        array = self.memory.array(address, shape, dtype)
+        self.invalidate(address, array.nbytes)
+        return array
+
+    def load(self, program: Program) -> None:
+        self.write(program.text_base, program.text)
+        self.write(program.data_base, program.data)
+
+    # Running
+
+    def call(
+        self,
+        address: int,
+        int_args: Sequence[int] = (),
+        float_args: Sequence[float] = (),
+        max_instructions: Optional[int] = None,
+    ) -> None:
+        """
+        Calls the function at address with the arguments in a0-a7 and
+        fa0-fa7, and runs until it returns.
+        """
+        if len(int_args) > 8 or len(float_args) > 8:
+            raise EmulatorError("at most 8 integer and 8 floating-point arguments are passed in registers")
+        x, f = self.x, self.f
+        for number, value in enumerate(int_args, 10):
+            x[number] = _wrap(value)
+        for number, value in enumerate(float_args, 10):
+            f[number] = float(value)
+        x[1] = EXIT_ADDRESS
+        # The stack grows down from the top of memory
+        x[2] = len(self.memory) & ~15
+        self.run(address, max_instructions)
+
+    def run(self, pc: int, max_instructions: Optional[int] = None) -> int:
+        """
+        Runs from pc until the program jumps to EXIT_ADDRESS or exits.
+
+        Returns:
+            The number of instructions retired.
+        """
+        blocks = self.blocks
+        limit = max_instructions if max_instructions is not None else -1
+        counts = self.profile.counts if self.profile is not None else None
+        retired = 0
+        block = None
+        try:
+            while pc != EXIT_ADDRESS:
+                block = blocks.get(pc)
+                if block is None:
+                    block = self.translate(pc)
+                for op in block.body:
+                    op()
+                pc = block.exit()
+                retired += block.size
+                if counts is not None:
+                    counts[block] = counts.get(block, 0) + 1
+                if 0 <= limit < retired:
+                    raise EmulatorError(f"instruction limit of {limit} reached at {pc:#x}")
+        except struct.error:
+            raise MemoryFault(f"memory access outside of memory in the block at {block.start:#x}") from None
+        finally:
+            self.instret += retired
+        return retired
+
+    # Translation
+
+    def translate(self, pc: int) -> Block:
+        """
+        Decodes the block starting at pc and caches it.
+        """
+        if pc & 3 or not 0 <= pc <= len(self.memory) - 4:
+            raise MemoryFault(f"instruction fetch at {pc:#x}")
+        start = pc
+        page = pc >> _PAGE_SHIFT
+        body = []
+        names = []
+        exit = None
+        memory = self.memory.buffer
+        while exit is None:
+            try:
+                ins, rm = decode(_FETCH(memory, pc)[0])
+            except ISAError as error:
+                raise EmulatorError(f"{error} at {pc:#x}") from None
+            op, terminates = self._translate_instruction(ins, rm, pc)
+            names.append(ins.name)
+            pc += 4
+            if terminates:
+                exit = op
+            else:
+                if op is not None:
+                    body.append(op)
+                if pc - start >= 4 * MAX_BLOCK_SIZE or pc >> _PAGE_SHIFT != page or pc > len(memory) - 4:
+                    exit = _constant(pc)
+
+        block = Block(start, pc, tuple(body), exit, tuple(names))
+        self.blocks[start] = block
+        self.page_blocks.setdefault(page, []).append(start)
+        # A store that starts on the page before can reach this one
+        self.code_pages[page] = 1
+        if page > 0:
+            self.code_pages[page - 1] = 1
+        self.translations += 1
+        return block
+
+    def invalidate(self, address: int, size: int) -> None:
+        """
+        Drops the translated blocks that overlap [address, address + size).
+        """
+        for page in range(address >> _PAGE_SHIFT, ((address + size - 1) >> _PAGE_SHIFT) + 1):
+            starts = self.page_blocks.pop(page, None)
+            if starts is None:
+                continue
+            for start in starts:
+                if self.blocks.pop(start, None) is not None:
+                    self.invalidations += 1
+            # Stop watching the page, and the one before it, unless they are
+            # still next to code
+            for watched in (page - 1, page):
+                if watched >= 0 and watched not in self.page_blocks and watched + 1 not in self.page_blocks:
+                    self.code_pages[watched] = 0
+
+    def flush(self) -> None:
+        # Drops every translated block
+        self.blocks.clear()
+        self.page_blocks.clear()
+        self.code_pages[:] = bytes(len(self.code_pages))
+
+    def _translate_instruction(self, ins: Instruction, rm: int, pc: int) -> Tuple[Optional[Callable], bool]:
+        """
+        Returns the closure that executes ins and whether it ends a block;
+        block-ending closures return the next pc. Instructions without an
+        effect (writes to x0) translate to None.
+        """
+        name, rd, rs1, rs2, imm = ins
+        x, f, memory = self.x, self.f, self.memory.buffer
+
+        # Control flow
+        if name in _BRANCHES:
+            return _BRANCHES[name](x, rs1, rs2, pc + imm, pc + 4), True
+        if name == "jal":
+            target, link = pc + imm, pc + 4
+            if rd == 0:
+                return _constant(target), True
+
+            def jal():
+                x[rd] = link
+                return target
+            return jal, True
+        if name == "jalr":
+            link = pc + 4
+
+            def jalr():
+                target = (x[rs1] + imm) & ~1
+                if rd:
+                    x[rd] = link
+                return target
+            return jalr, True
+        if name == "ecall":
+            return (lambda: self._syscall(pc + 4)), True
+        if name == "ebreak":
+            return _constant(EXIT_ADDRESS), True
+        if name.startswith("lacc."):
+            return self.accelerator.translate(ins, x, self.memory, self.invalidate), False
+        if name == "fence.i":
+            return _constant(pc + 4), True
+        if name == "fence":
+            return None, False
+
+        # Memory
+        if name in _LOADS:
+            unpack = struct.Struct(_LOADS[name]).unpack_from
+            if rd == 0:
+                return None, False
+
+            def load():
+                address = x[rs1] + imm
+                if address < 0:
+                    raise MemoryFault(f"load at {address:#x}")
+                x[rd] = unpack(memory, address)[0]
+            return load, False
+        if name == "fld":
+            unpack = _DOUBLE.unpack_from
+
+            def fld():
+                address = x[rs1] + imm
+                if address < 0:
+                    raise MemoryFault(f"load at {address:#x}")
+                f[rd] = unpack(memory, address)[0]
+            return fld, False
+        if name in _STORES or name == "fsd":
+            return self._store(name, rs1, rs2, imm), False
+
+        # Floating point
+        if name in _FLOAT_OPS:
+            return _FLOAT_OPS[name](x, f, rd, rs1, rs2, rm), False
+
+        # Integer; writes to x0 are dropped
+        if rd == 0:
+            return None, False
+        if name == "lui":
+            value = imm << 12
+
+            def lui():
+                x[rd] = value
+            return lui, False
+        if name == "auipc":
+            value = _wrap(pc + (imm << 12))
+
+            def auipc():
+                x[rd] = value
+            return auipc, False
+        if name in _IMMEDIATE_OPS:
+            return _IMMEDIATE_OPS[name](x, rd, rs1, imm), False
+        if name in _REGISTER_OPS:
+            return _REGISTER_OPS[name](x, rd, rs1, rs2), False
+        raise EmulatorError(f"unsupported instruction {name} at {pc:#x}")
+
+    def _store(self, name: str, rs1: int, rs2: int, imm: int) -> Callable[[], None]:
+        x, memory, code_pages, invalidate = self.x, self.memory.buffer, self.code_pages, self.invalidate
+        if name == "fsd":
+            f, pack, size = self.f, _DOUBLE.pack_into, 8
+
+            def fsd():
+                address = x[rs1] + imm
+                if address < 0:
+                    raise MemoryFault(f"store at {address:#x}")
+                pack(memory, address, f[rs2])
+                if code_pages[address >> _PAGE_SHIFT]:
+                    invalidate(address, size)
+            return fsd
+
+        fmt, mask = _STORES[name]
+        pack, size = struct.Struct(fmt).pack_into, struct.calcsize(fmt)
+
+        def store():
+            address = x[rs1] + imm
+            if address < 0:
+                raise MemoryFault(f"store at {address:#x}")
+            pack(memory, address, x[rs2] & mask)
+            if code_pages[address >> _PAGE_SHIFT]:
+                invalidate(address, size)
+        return store
+
+    def _syscall(self, next_pc: int) -> int:
+        x = self.x
+        number = x[17]
+        if number == SYS_EXIT:
+            self.exit_code = x[10]
+            return EXIT_ADDRESS
+        if number == SYS_WRITE:
+            self.output += self.read(x[11], x[12])
+            x[10] = x[12]
+            return next_pc
+        raise EmulatorError(f"unknown syscall {number}")
+
+
+def _constant(pc: int) -> Callable[[], int]:
+    return lambda: pc
+
+
+def _branch(compare: Callable[[int, int], bool]):
+    def factory(x, rs1, rs2, target, fallthrough):
+        def branch():
+            return target if compare(x[rs1], x[rs2]) else fallthrough
+        return branch
+    return factory
+
+
+def _unsigned_branch(compare: Callable[[int, int], bool]):
+    return _branch(lambda a, b: compare(a & _MASK, b & _MASK))
+
+
+def _beq(x, rs1, rs2, target, fallthrough):
+    def beq():
+        return target if x[rs1] == x[rs2] else fallthrough
+    return beq
+
+
+def _bne(x, rs1, rs2, target, fallthrough):
+    def bne():
+        return target if x[rs1] != x[rs2] else fallthrough
+    return bne
+
+
+def _blt(x, rs1, rs2, target, fallthrough):
+    def blt():
+        return target if x[rs1] < x[rs2] else fallthrough
+    return blt
+
+
+def _bge(x, rs1, rs2, target, fallthrough):
+    def bge():
+        return target if x[rs1] >= x[rs2] else fallthrough
+    return bge
+
+
+_BRANCHES = {
+    "beq": _beq,
+    "bne": _bne,
+    "blt": _blt,
+    "bge": _bge,
+    "bltu": _unsigned_branch(lambda a, b: a < b),
+    "bgeu": _unsigned_branch(lambda a, b: a >= b),
+}
+
+
+def _addi(x, rd, rs1, imm):
+    if rs1 == 0:
+        # li
+        def li():
+            x[rd] = imm
+        return li
+    if imm == 0:
+        # mv
+        def mv():
+            x[rd] = x[rs1]
+        return mv
+
+    def addi():
+        x[rd] = ((x[rs1] + imm + _SIGN) & _MASK) - _SIGN
+    return addi
+
+
+def _immediate_op(compute: Callable[[int, int], int]):
+    # Generic I-type op; compute returns the final (wrapped) result
+    def factory(x, rd, rs1, imm):
+        def op():
+            x[rd] = compute(x[rs1], imm)
+        return op
+    return factory
+
+
+def _slli(x, rd, rs1, imm):
+    def slli():
+        x[rd] = ((x[rs1] << imm) + _SIGN & _MASK) - _SIGN
+    return slli
+
+
+_IMMEDIATE_OPS = {
+    "addi": _addi,
+    "slli": _slli,
+    "slti": _immediate_op(lambda a, imm: int(a < imm)),
+    "sltiu": _immediate_op(lambda a, imm: int((a & _MASK) < (imm & _MASK))),
+    "xori": _immediate_op(lambda a, imm: a ^ imm),
+    "ori": _immediate_op(lambda a, imm: a | imm),
+    "andi": _immediate_op(lambda a, imm: a & imm),
+    "srli": _immediate_op(lambda a, imm: _wrap((a & _MASK) >> imm)),
+    "srai": _immediate_op(lambda a, imm: a >> imm),
+    "addiw": _immediate_op(lambda a, imm: _wrap32(a + imm)),
+    "slliw": _immediate_op(lambda a, imm: _wrap32(a << imm)),
+    "srliw": _immediate_op(lambda a, imm: _wrap32((a & _MASK32) >> imm)),
+    "sraiw": _immediate_op(lambda a, imm: _wrap32(a) >> imm),
+}
+
+
+def _register_op(compute: Callable[[int, int], int]):
+    def factory(x, rd, rs1, rs2):
+        def op():
+            x[rd] = compute(x[rs1], x[rs2])
+        return op
+    return factory
+
+
+def _add(x, rd, rs1, rs2):
+    def add():
+        x[rd] = ((x[rs1] + x[rs2] + _SIGN) & _MASK) - _SIGN
+    return add
+
+
+def _sub(x, rd, rs1, rs2):
+    def sub():
+        x[rd] = ((x[rs1] - x[rs2] + _SIGN) & _MASK) - _SIGN
+    return sub
+
+
+def _mul(x, rd, rs1, rs2):
+    def mul():
+        x[rd] = ((x[rs1] * x[rs2] + _SIGN) & _MASK) - _SIGN
+    return mul
+
+
+def _divu(a: int, b: int) -> int:
+    a, b = a & _MASK, b & _MASK
+    return _wrap(a // b) if b else -1
+
+
+def _remu(a: int, b: int) -> int:
+    a, b = a & _MASK, b & _MASK
+    return _wrap(a % b) if b else _wrap(a)
+
+
+def _divuw(a: int, b: int) -> int:
+    a, b = a & _MASK32, b & _MASK32
+    return _wrap32(a // b) if b else -1
+
+
+def _remuw(a: int, b: int) -> int:
+    a, b = a & _MASK32, b & _MASK32
+    return _wrap32(a % b) if b else _wrap32(a)
+
+
+_REGISTER_OPS = {
+    "add": _add,
+    "sub": _sub,
+    "mul": _mul,
+    "sll": _register_op(lambda a, b: _wrap(a << (b & 63))),
+    "slt": _register_op(lambda a, b: int(a < b)),
+    "sltu": _register_op(lambda a, b: int((a & _MASK) < (b & _MASK))),
+    "xor": _register_op(lambda a, b: a ^ b),
+    "srl": _register_op(lambda a, b: _wrap((a & _MASK) >> (b & 63))),
+    "sra": _register_op(lambda a, b: a >> (b & 63)),
+    "or": _register_op(lambda a, b: a | b),
+    "and": _register_op(lambda a, b: a & b),
+    "addw": _register_op(lambda a, b: _wrap32(a + b)),
+    "subw": _register_op(lambda a, b: _wrap32(a - b)),
+    "sllw": _register_op(lambda a, b: _wrap32(a << (b & 31))),
+    "srlw": _register_op(lambda a, b: _wrap32((a & _MASK32) >> (b & 31))),
+    "sraw": _register_op(lambda a, b: _wrap32(a) >> (b & 31)),
+    "mulh": _register_op(lambda a, b: (a * b) >> 64),
+    "mulhsu": _register_op(lambda a, b: (a * (b & _MASK)) >> 64),
+    "mulhu": _register_op(lambda a, b: _wrap(((a & _MASK) * (b & _MASK)) >> 64)),
+    "div": _register_op(_div),
+    "divu": _register_op(_divu),
+    "rem": _register_op(_rem),
+    "remu": _register_op(_remu),
+    "mulw": _register_op(lambda a, b: _wrap32(a * b)),
+    "divw": _register_op(lambda a, b: _wrap32(_div(_wrap32(a), _wrap32(b)))),
+    "divuw": _register_op(_divuw),
+    "remw": _register_op(lambda a, b: _wrap32(_rem(_wrap32(a), _wrap32(b)))),
+    "remuw": _register_op(_remuw),
+}
+
+
+def _float_op(compute: Callable[[float, float], float]):
+    def factory(x, f, rd, rs1, rs2, rm):
+        def op():
+            f[rd] = compute(f[rs1], f[rs2])
+        return op
+    return factory
+
+
+def _fadd(x, f, rd, rs1, rs2, rm):
+    def fadd():
+        f[rd] = f[rs1] + f[rs2]
+    return fadd
+
+
+def _fsub(x, f, rd, rs1, rs2, rm):
+    def fsub():
+        f[rd] = f[rs1] - f[rs2]
+    return fsub
+
+
+def _fmul(x, f, rd, rs1, rs2, rm):
+    def fmul():
+        f[rd] = f[rs1] * f[rs2]
+    return fmul
+
+
+def _fsgnj(x, f, rd, rs1, rs2, rm):
+    if rs1 == rs2:
+        # fmv.d
+        def fmv():
+            f[rd] = f[rs1]
+        return fmv
+
+    def fsgnj():
+        f[rd] = math.copysign(f[rs1], f[rs2])
+    return fsgnj
+
+
+def _float_compare(compare: Callable[[float, float], bool]):
+    def factory(x, f, rd, rs1, rs2, rm):
+        if rd == 0:
+            return None
+
+        def op():
+            x[rd] = int(compare(f[rs1], f[rs2]))
+        return op
+    return factory
+
+
+def _float_to_int(bits: int):
+    def factory(x, f, rd, rs1, rs2, rm):
+        if rd == 0:
+            return None
+
+        def op():
+            x[rd] = _to_int(f[rs1], rm, bits)
+        return op
+    return factory
+
+
+def _int_to_float(bits: int):
+    def factory(x, f, rd, rs1, rs2, rm):
+        def op():
+            value = x[rs1]
+            f[rd] = float(_wrap32(value) if bits == 32 else value)
+        return op
+    return factory
+
+
+def _fmv_x_d(x, f, rd, rs1, rs2, rm):
+    if rd == 0:
+        return None
+
+    def fmv_x_d():
+        x[rd] = _INT64.unpack(_DOUBLE.pack(f[rs1]))[0]
+    return fmv_x_d
+
+
+def _fmv_d_x(x, f, rd, rs1, rs2, rm):
+    def fmv_d_x():
+        f[rd] = _DOUBLE.unpack(_INT64.pack(x[rs1]))[0]
+    return fmv_d_x
+
+
+def _fmin(a: float, b: float) -> float:
+    if a != a:
+        return b
+    if b != b:
+        return a
+    return min(a, b)
+
+
+def _fmax(a: float, b: float) -> float:
+    if a != a:
+        return b
+    if b != b:
+        return a
+    return max(a, b)
+
+
+_FLOAT_OPS = {
+    "fadd.d": _fadd,
+    "fsub.d": _fsub,
+    "fmul.d": _fmul,
+    "fdiv.d": _float_op(_fdiv),
+    "fsqrt.d": _float_op(lambda a, b: _fsqrt(a)),
+    "fsgnj.d": _fsgnj,
+    "fsgnjn.d": _float_op(lambda a, b: math.copysign(a, -math.copysign(1.0, b))),
+    "fsgnjx.d": _float_op(lambda a, b: math.copysign(a, math.copysign(1.0, a) * math.copysign(1.0, b))),
+    "fmin.d": _float_op(_fmin),
+    "fmax.d": _float_op(_fmax),
+    "feq.d": _float_compare(lambda a, b: a == b),
+    "flt.d": _float_compare(lambda a, b: a < b),
+    "fle.d": _float_compare(lambda a, b: a <= b),
+    "fcvt.w.d": _float_to_int(32),
+    "fcvt.l.d": _float_to_int(64),
+    "fcvt.d.w": _int_to_float(32),
+    "fcvt.d.l": _int_to_float(64),
+    "fmv.x.d": _fmv_x_d,
+    "fmv.d.x": _fmv_d_x,
+}
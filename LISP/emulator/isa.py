@@ -0,0 +1,358 @@
+"""
+isa.py: encoding and decoding of the RV64IMD instructions the emulator runs,
+and of the lisp accelerator's instructions in the custom-0 opcode space
+
+Every instruction is described once, in INSTRUCTIONS, by its format and
+the fixed bits of its encoding. encode() packs an Instruction into a 32-bit
+word and decode() unpacks one, both driven by that table, so the assembler
+and the emulator cannot disagree about an encoding.
+"""
+from typing import Dict, NamedTuple, Tuple
+
+
+class Instruction(NamedTuple):
+    # Mnemonic, register numbers and the sign-extended immediate; fields an
+    # instruction does not have are 0
+    name: str
+    rd: int = 0
+    rs1: int = 0
+    rs2: int = 0
+    imm: int = 0
+
+
+class ISAError(ValueError):
+    pass
+
+
+# Major opcodes
+LOAD = 0b0000011
+LOAD_FP = 0b0000111
+MISC_MEM = 0b0001111
+OP_IMM = 0b0010011
+AUIPC = 0b0010111
+OP_IMM_32 = 0b0011011
+STORE = 0b0100011
+STORE_FP = 0b0100111
+OP = 0b0110011
+LUI = 0b0110111
+OP_32 = 0b0111011
+OP_FP = 0b1010011
+BRANCH = 0b1100011
+JALR = 0b1100111
+JAL = 0b1101111
+SYSTEM = 0b1110011
+# Reserved for custom extensions; the lisp accelerator's
+CUSTOM_0 = 0b0001011
+
+# Rounding modes of the floating-point conversions (the rm field)
+RM_RNE, RM_RTZ, RM_RDN, RM_RUP, RM_DYN = 0, 1, 2, 3, 7
+
+# name: (format, opcode, funct3, funct7)
+#
+# Formats are the base R, I, S, B, U and J, plus
+#   SH   RV64 shifts by a 6-bit amount, funct7 holds funct6 << 1
+#   SHW  32-bit shifts by a 5-bit amount
+#   FR   floating-point ops with two sources, funct3 is the rounding mode
+#   FU   floating-point ops with one source, funct3 is the rounding mode and
+#        the rs2 field (the last entry) selects the operation
+#   FC   floating-point compares and moves, funct3 selects the operation
+#   SYS  ecall and ebreak, told apart by the immediate (the last entry)
+INSTRUCTIONS: Dict[str, Tuple] = {
+    "lui": ("U", LUI, 0, 0),
+    "auipc": ("U", AUIPC, 0, 0),
+    "jal": ("J", JAL, 0, 0),
+    "jalr": ("I", JALR, 0b000, 0),
+
+    "beq": ("B", BRANCH, 0b000, 0),
+    "bne": ("B", BRANCH, 0b001, 0),
+    "blt": ("B", BRANCH, 0b100, 0),
+    "bge": ("B", BRANCH, 0b101, 0),
+    "bltu": ("B", BRANCH, 0b110, 0),
+    "bgeu": ("B", BRANCH, 0b111, 0),
+
+    "lb": ("I", LOAD, 0b000, 0),
+    "lh": ("I", LOAD, 0b001, 0),
+    "lw": ("I", LOAD, 0b010, 0),
+    "ld": ("I", LOAD, 0b011, 0),
+    "lbu": ("I", LOAD, 0b100, 0),
+    "lhu": ("I", LOAD, 0b101, 0),
+    "lwu": ("I", LOAD, 0b110, 0),
+    "sb": ("S", STORE, 0b000, 0),
+    "sh": ("S", STORE, 0b001, 0),
+    "sw": ("S", STORE, 0b010, 0),
+    "sd": ("S", STORE, 0b011, 0),
+
+    "addi": ("I", OP_IMM, 0b000, 0),
+    "slti": ("I", OP_IMM, 0b010, 0),
+    "sltiu": ("I", OP_IMM, 0b011, 0),
+    "xori": ("I", OP_IMM, 0b100, 0),
+    "ori": ("I", OP_IMM, 0b110, 0),
+    "andi": ("I", OP_IMM, 0b111, 0),
+    "slli": ("SH", OP_IMM, 0b001, 0b0000000),
+    "srli": ("SH", OP_IMM, 0b101, 0b0000000),
+    "srai": ("SH", OP_IMM, 0b101, 0b0100000),
+    "addiw": ("I", OP_IMM_32, 0b000, 0),
+    "slliw": ("SHW", OP_IMM_32, 0b001, 0b0000000),
+    "srliw": ("SHW", OP_IMM_32, 0b101, 0b0000000),
+    "sraiw": ("SHW", OP_IMM_32, 0b101, 0b0100000),
+
+    "add": ("R", OP, 0b000, 0b0000000),
+    "sub": ("R", OP, 0b000, 0b0100000),
+    "sll": ("R", OP, 0b001, 0b0000000),
+    "slt": ("R", OP, 0b010, 0b0000000),
+    "sltu": ("R", OP, 0b011, 0b0000000),
+    "xor": ("R", OP, 0b100, 0b0000000),
+    "srl": ("R", OP, 0b101, 0b0000000),
+    "sra": ("R", OP, 0b101, 0b0100000),
+    "or": ("R", OP, 0b110, 0b0000000),
+    "and": ("R", OP, 0b111, 0b0000000),
+    "addw": ("R", OP_32, 0b000, 0b0000000),
+    "subw": ("R", OP_32, 0b000, 0b0100000),
+    "sllw": ("R", OP_32, 0b001, 0b0000000),
+    "srlw": ("R", OP_32, 0b101, 0b0000000),
+    "sraw": ("R", OP_32, 0b101, 0b0100000),
+
+    "mul": ("R", OP, 0b000, 0b0000001),
+    "mulh": ("R", OP, 0b001, 0b0000001),
+    "mulhsu": ("R", OP, 0b010, 0b0000001),
+    "mulhu": ("R", OP, 0b011, 0b0000001),
+    "div": ("R", OP, 0b100, 0b0000001),
+    "divu": ("R", OP, 0b101, 0b0000001),
+    "rem": ("R", OP, 0b110, 0b0000001),
+    "remu": ("R", OP, 0b111, 0b0000001),
+    "mulw": ("R", OP_32, 0b000, 0b0000001),
+    "divw": ("R", OP_32, 0b100, 0b0000001),
+    "divuw": ("R", OP_32, 0b101, 0b0000001),
+    "remw": ("R", OP_32, 0b110, 0b0000001),
+    "remuw": ("R", OP_32, 0b111, 0b0000001),
+
+    "fld": ("I", LOAD_FP, 0b011, 0),
+    "fsd": ("S", STORE_FP, 0b011, 0),
+    "fadd.d": ("FR", OP_FP, RM_DYN, 0b0000001),
+    "fsub.d": ("FR", OP_FP, RM_DYN, 0b0000101),
+    "fmul.d": ("FR", OP_FP, RM_DYN, 0b0001001),
+    "fdiv.d": ("FR", OP_FP, RM_DYN, 0b0001101),
+    "fsqrt.d": ("FU", OP_FP, RM_DYN, 0b0101101, 0),
+    "fsgnj.d": ("FC", OP_FP, 0b000, 0b0010001),
+    "fsgnjn.d": ("FC", OP_FP, 0b001, 0b0010001),
+    "fsgnjx.d": ("FC", OP_FP, 0b010, 0b0010001),
+    "fmin.d": ("FC", OP_FP, 0b000, 0b0010101),
+    "fmax.d": ("FC", OP_FP, 0b001, 0b0010101),
+    "fle.d": ("FC", OP_FP, 0b000, 0b1010001),
+    "flt.d": ("FC", OP_FP, 0b001, 0b1010001),
+    "feq.d": ("FC", OP_FP, 0b010, 0b1010001),
+    "fcvt.w.d": ("FU", OP_FP, RM_RTZ, 0b1100001, 0),
+    "fcvt.l.d": ("FU", OP_FP, RM_RTZ, 0b1100001, 2),
+    "fcvt.d.w": ("FU", OP_FP, RM_DYN, 0b1101001, 0),
+    "fcvt.d.l": ("FU", OP_FP, RM_DYN, 0b1101001, 2),
+    "fmv.x.d": ("FC", OP_FP, 0b000, 0b1110001),
+    "fmv.d.x": ("FC", OP_FP, 0b000, 0b1111001),
+
+    "fence": ("I", MISC_MEM, 0b000, 0),
+    "fence.i": ("I", MISC_MEM, 0b001, 0),
+    "ecall": ("SYS", SYSTEM, 0b000, 0, 0),
+    "ebreak": ("SYS", SYSTEM, 0b000, 0, 1),
+    # The lisp accelerator, see lisp_accelerator_instruction_functions.py;
+    # rd, rs1 and rs2 are all read
+    "lacc.shape": ("R", CUSTOM_0, 0b000, 0b0000000),
+    "lacc.stride": ("R", CUSTOM_0, 0b000, 0b0000001),
+    "lacc.matmul": ("R", CUSTOM_0, 0b001, 0),
+    "lacc.add": ("R", CUSTOM_0, 0b010, 0),
+    "lacc.subtract": ("R", CUSTOM_0, 0b011, 0),
+    "lacc.multiply": ("R", CUSTOM_0, 0b100, 0),
+}
+
+# Instructions that read or write the floating-point registers, by operand:
+# the operands not listed are integer registers
+FLOAT_OPERANDS = {
+    "fld": ("rd",),
+    "fsd": ("rs2",),
+    "fadd.d": ("rd", "rs1", "rs2"),
+    "fsub.d": ("rd", "rs1", "rs2"),
+    "fmul.d": ("rd", "rs1", "rs2"),
+    "fdiv.d": ("rd", "rs1", "rs2"),
+    "fsqrt.d": ("rd", "rs1"),
+    "fsgnj.d": ("rd", "rs1", "rs2"),
+    "fsgnjn.d": ("rd", "rs1", "rs2"),
+    "fsgnjx.d": ("rd", "rs1", "rs2"),
+    "fmin.d": ("rd", "rs1", "rs2"),
+    "fmax.d": ("rd", "rs1", "rs2"),
+    "fle.d": ("rs1", "rs2"),
+    "flt.d": ("rs1", "rs2"),
+    "feq.d": ("rs1", "rs2"),
+    "fcvt.w.d": ("rs1",),
+    "fcvt.l.d": ("rs1",),
+    "fcvt.d.w": ("rd",),
+    "fcvt.d.l": ("rd",),
+    "fmv.x.d": ("rs1",),
+    "fmv.d.x": ("rd",),
+}
+
+# ABI names of the integer and floating-point registers
+INT_REGISTERS = (
+    "zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2",
+    "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+    "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7",
+    "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6",
+)
+FLOAT_REGISTERS = (
+    "ft0", "ft1", "ft2", "ft3", "ft4", "ft5", "ft6", "ft7",
+    "fs0", "fs1", "fa0", "fa1", "fa2", "fa3", "fa4", "fa5",
+    "fa6", "fa7", "fs2", "fs3", "fs4", "fs5", "fs6", "fs7",
+    "fs8", "fs9", "fs10", "fs11", "ft8", "ft9", "ft10", "ft11",
+)
+
+INT_REGISTER_NUMBERS = {name: number for number, name in enumerate(INT_REGISTERS)}
+INT_REGISTER_NUMBERS.update({f"x{number}": number for number in range(32)})
+INT_REGISTER_NUMBERS["fp"] = 8
+FLOAT_REGISTER_NUMBERS = {name: number for number, name in enumerate(FLOAT_REGISTERS)}
+FLOAT_REGISTER_NUMBERS.update({f"f{number}": number for number in range(32)})
+
+
+def sign_extend(value: int, bits: int) -> int:
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+def _check_immediate(ins: Instruction, bits: int, signed: bool = True, multiple: int = 1) -> int:
+    imm = ins.imm
+    low, high = (-(1 << (bits - 1)), 1 << (bits - 1)) if signed else (0, 1 << bits)
+    if not low <= imm < high or imm % multiple:
+        raise ISAError(f"immediate {imm} out of range for {ins.name}")
+    return imm & ((1 << bits) - 1)
+
+
+def encode(ins: Instruction) -> int:
+    """
+    Returns the 32-bit encoding of ins.
+    """
+    try:
+        spec = INSTRUCTIONS[ins.name]
+    except KeyError:
+        raise ISAError(f"unknown instruction {ins.name}") from None
+    fmt, opcode, funct3, funct7 = spec[:4]
+    rd, rs1, rs2 = ins.rd, ins.rs1, ins.rs2
+    for reg in (rd, rs1, rs2):
+        if not 0 <= reg < 32:
+            raise ISAError(f"register {reg} out of range in {ins.name}")
+
+    if fmt == "R" or fmt == "FR" or fmt == "FC":
+        return funct7 << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+    if fmt == "FU":
+        return funct7 << 25 | spec[4] << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+    if fmt == "I":
+        imm = _check_immediate(ins, 12)
+        return imm << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+    if fmt == "SH":
+        imm = _check_immediate(ins, 6, signed=False)
+        return funct7 << 25 | imm << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+    if fmt == "SHW":
+        imm = _check_immediate(ins, 5, signed=False)
+        return funct7 << 25 | imm << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+    if fmt == "S":
+        imm = _check_immediate(ins, 12)
+        return (imm >> 5) << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | (imm & 0x1F) << 7 | opcode
+    if fmt == "B":
+        imm = _check_immediate(ins, 13, multiple=2)
+        return (
+            (imm >> 12 & 1) << 31 | (imm >> 5 & 0x3F) << 25 | rs2 << 20 | rs1 << 15
+            | funct3 << 12 | (imm >> 1 & 0xF) << 8 | (imm >> 11 & 1) << 7 | opcode
+        )
+    if fmt == "U":
+        # The immediate is the upper 20 bits, as written in assembly
+        imm = _check_immediate(ins, 20, signed=False) if ins.imm >= 0 else _check_immediate(ins, 20)
+        return imm << 12 | rd << 7 | opcode
+    if fmt == "J":
+        imm = _check_immediate(ins, 21, multiple=2)
+        return (
+            (imm >> 20 & 1) << 31 | (imm >> 1 & 0x3FF) << 21 | (imm >> 11 & 1) << 20
+            | (imm >> 12 & 0xFF) << 12 | rd << 7 | opcode
+        )
+    # SYS
+    return spec[4] << 20 | opcode
+
+
+def _decode_tables():
+    # (opcode, funct3, funct7) for R-like formats, (opcode, funct3) for the
+    # others, (opcode, funct7, rs2) for the one-source floating-point ops
+    by_funct7, by_funct3, by_rs2, by_opcode = {}, {}, {}, {}
+    for name, spec in INSTRUCTIONS.items():
+        fmt, opcode, funct3, funct7 = spec[:4]
+        if fmt in ("R", "FC", "SH", "SHW"):
+            # A shift's funct6 leaves bit 25 to the amount
+            key7 = funct7 >> 1 if fmt == "SH" else funct7
+            by_funct7[opcode, funct3, key7] = (name, fmt)
+        elif fmt == "FR":
+            by_rs2[opcode, funct7, None] = (name, fmt)
+        elif fmt == "FU":
+            by_rs2[opcode, funct7, spec[4]] = (name, fmt)
+        elif fmt in ("U", "J"):
+            by_opcode[opcode] = (name, fmt)
+        elif fmt == "SYS":
+            by_funct3[opcode, spec[4]] = (name, fmt)
+        else:
+            by_funct3[opcode, funct3] = (name, fmt)
+    return by_funct7, by_funct3, by_rs2, by_opcode
+
+
+_BY_FUNCT7, _BY_FUNCT3, _BY_RS2, _BY_OPCODE = _decode_tables()
+
+
+def decode(word: int) -> Tuple[Instruction, int]:
+    """
+    Decodes a 32-bit instruction word.
+
+    Returns:
+        The instruction and its rounding-mode field (meaningful only for
+        the floating-point ops).
+    """
+    opcode = word & 0x7F
+    rd = word >> 7 & 0x1F
+    funct3 = word >> 12 & 0x7
+    rs1 = word >> 15 & 0x1F
+    rs2 = word >> 20 & 0x1F
+    funct7 = word >> 25
+
+    entry = None
+    if opcode == OP_FP:
+        entry = _BY_RS2.get((opcode, funct7, None)) or _BY_RS2.get((opcode, funct7, rs2))
+        if entry is None:
+            entry = _BY_FUNCT7.get((opcode, funct3, funct7))
+    elif opcode in (OP, OP_32, CUSTOM_0):
+        entry = _BY_FUNCT7.get((opcode, funct3, funct7))
+    elif opcode == OP_IMM and funct3 in (0b001, 0b101):
+        entry = _BY_FUNCT7.get((opcode, funct3, funct7 >> 1))
+    elif opcode == OP_IMM_32 and funct3 in (0b001, 0b101):
+        entry = _BY_FUNCT7.get((opcode, funct3, funct7))
+    elif opcode == SYSTEM:
+        if funct3 == 0 and rd == 0 and rs1 == 0:
+            entry = _BY_FUNCT3.get((opcode, word >> 20))
+    elif opcode in (LUI, AUIPC, JAL):
+        entry = _BY_OPCODE.get(opcode)
+    else:
+        entry = _BY_FUNCT3.get((opcode, funct3))
+    if entry is None:
+        raise ISAError(f"illegal instruction {word:#010x}")
+
+    name, fmt = entry
+    if fmt in ("R", "FR", "FC"):
+        return Instruction(name, rd, rs1, rs2), funct3
+    if fmt == "FU":
+        return Instruction(name, rd, rs1), funct3
+    if fmt == "I":
+        return Instruction(name, rd, rs1, 0, sign_extend(word >> 20, 12)), funct3
+    if fmt == "SH":
+        return Instruction(name, rd, rs1, 0, word >> 20 & 0x3F), funct3
+    if fmt == "SHW":
+        return Instruction(name, rd, rs1, 0, rs2), funct3
+    if fmt == "S":
+        return Instruction(name, 0, rs1, rs2, sign_extend(funct7 << 5 | rd, 12)), funct3
+    if fmt == "B":
+        imm = (word >> 31 & 1) << 12 | (word >> 7 & 1) << 11 | (word >> 25 & 0x3F) << 5 | (word >> 8 & 0xF) << 1
+        return Instruction(name, 0, rs1, rs2, sign_extend(imm, 13)), funct3
+    if fmt == "U":
+        return Instruction(name, rd, 0, 0, sign_extend(word >> 12, 20)), funct3
+    if fmt == "J":
+        imm = (word >> 31 & 1) << 20 | (word >> 12 & 0xFF) << 12 | (word >> 20 & 1) << 11 | (word >> 21 & 0x3FF) << 1
+        return Instruction(name, rd, 0, 0, sign_extend(imm, 21)), funct3
+    return Instruction(name), funct3
@@ -1,3 +1,150 @@
 """
-Risc-V emulator for OP instructions 
-"""
\ No newline at end of file
+Risc-V emulator for OP instructions
+
+The lisp accelerator is a tensor unit behind custom-0 instructions. It works
+on tiles of row-major f64 matrices in guest memory, described by its
+configuration registers:
+
+- lacc.shape rd, rs1, rs2 sets the tile to x[rs1] rows by x[rs2] columns
+  and the depth of a matmul to x[rd], and makes every operand contiguous
+- lacc.stride rd, rs1, rs2 sets the row strides, in elements, of the
+  destination (x[rd]), the lhs (x[rs1]) and the rhs (x[rs2]), so the
+  operands can be tiles of larger matrices
+- lacc.matmul rd, rs1, rs2 stores the rows x depth matrix at x[rs1] times
+  the depth x cols matrix at x[rs2] to the rows x cols tile at x[rd]
+- lacc.add, lacc.subtract and lacc.multiply store the elementwise sum,
+  difference or product of the rows x cols tiles at x[rs1] and x[rs2] to
+  the one at x[rd]
+
+Every register an accelerator instruction names is read and none is
+written. The operations run as NumPy kernels on arrays mapped straight onto
+guest memory, and an AcceleratorCostModel estimates the cycles each one
+would take on the unit, which Accelerator.cycles adds up.
+"""
+from dataclasses import dataclass
+from math import ceil
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .isa import Instruction
+from .memory import EmulatorError, Memory, MemoryFault
+
+_KERNELS = {
+    "lacc.matmul": np.matmul,
+    "lacc.add": np.add,
+    "lacc.subtract": np.subtract,
+    "lacc.multiply": np.multiply,
+}
+
+
+@dataclass(frozen=True)
+class AcceleratorCostModel:
+    """
+    Cycles of the accelerator's operations: a systolic array of tile_rows
+    by tile_cols processing elements for matmul and a vector unit for the
+    elementwise ops, both fed by memory at bytes_per_cycle.
+    """
+    tile_rows: int = 16
+    tile_cols: int = 16
+    # Elements the vector unit processes per cycle
+    lanes: int = 16
+    bytes_per_cycle: int = 64
+    # Fixed cost of every operation: issue and starting the transfers
+    setup: int = 20
+    # Cycles of a configuration instruction
+    configure: int = 1
+
+    def matmul(self, rows: int, cols: int, depth: int) -> int:
+        # Every array-sized tile of the result streams the whole depth
+        # through the array, plus the cycles to fill and drain it
+        tiles = ceil(rows / self.tile_rows) * ceil(cols / self.tile_cols)
+        compute = tiles * (depth + self.tile_rows + self.tile_cols)
+        transfer = ceil(8 * (rows * depth + depth * cols + rows * cols) / self.bytes_per_cycle)
+        return self.setup + max(compute, transfer)
+
+    def elementwise(self, rows: int, cols: int) -> int:
+        compute = ceil(rows * cols / self.lanes)
+        transfer = ceil(24 * rows * cols / self.bytes_per_cycle)
+        return self.setup + max(compute, transfer)
+
+
+class Accelerator:
+    def __init__(self, cost_model: AcceleratorCostModel = AcceleratorCostModel()):
+        self.cost_model = cost_model
+        # Configuration registers
+        self.rows = self.cols = self.depth = 0
+        # Row strides in elements; None for contiguous
+        self.strides: List[Optional[int]] = [None, None, None]
+
+        # Estimated cycles, and the number of operations of each kind
+        self.cycles = 0
+        self.operations: Dict[str, int] = dict.fromkeys(_KERNELS, 0)
+        self.flops = 0
+
+    def reset(self) -> None:
+        self.rows = self.cols = self.depth = 0
+        self.strides = [None, None, None]
+
+    def translate(
+        self,
+        ins: Instruction,
+        x: List[int],
+        memory: Memory,
+        invalidate: Callable[[int, int], None],
+    ) -> Callable[[], None]:
+        """
+        Returns the closure that executes an accelerator instruction, in the
+        emulator's registers x and memory; invalidate is called with every
+        range the accelerator stores to.
+        """
+        name, rd, rs1, rs2 = ins.name, ins.rd, ins.rs1, ins.rs2
+        if name == "lacc.shape":
+            def shape():
+                self.rows, self.cols, self.depth = x[rs1], x[rs2], x[rd]
+                self.strides = [None, None, None]
+                self.cycles += self.cost_model.configure
+            return shape
+        if name == "lacc.stride":
+            def stride():
+                self.strides = [x[rd], x[rs1], x[rs2]]
+                self.cycles += self.cost_model.configure
+            return stride
+
+        kernel = _KERNELS[name]
+        matmul = name == "lacc.matmul"
+
+        def operate():
+            rows, cols, depth = self.rows, self.cols, self.depth
+            if rows <= 0 or cols <= 0:
+                return
+            if matmul and depth < 0:
+                raise EmulatorError(f"lacc.matmul with a depth of {depth}")
+            shapes = ((rows, cols), (rows, depth), (depth, cols)) if matmul else ((rows, cols),) * 3
+            dst, lhs, rhs = (
+                _tile(memory, x[register], shape, stride)
+                for register, shape, stride in zip((rd, rs1, rs2), shapes, self.strides)
+            )
+            kernel(lhs, rhs, out=dst)
+            # From the tile's first element to past its last
+            invalidate(x[rd], dst.strides[0] * (rows - 1) + 8 * cols)
+
+            self.operations[name] += 1
+            if matmul:
+                self.cycles += self.cost_model.matmul(rows, cols, depth)
+                self.flops += 2 * rows * cols * depth
+            else:
+                self.cycles += self.cost_model.elementwise(rows, cols)
+                self.flops += rows * cols
+        return operate
+
+
+def _tile(memory: Memory, address: int, shape, stride: Optional[int]) -> np.ndarray:
+    # The rows x cols tile at address, its rows stride elements apart
+    rows, cols = shape
+    if stride is None:
+        stride = cols
+    size = 8 * ((rows - 1) * stride + cols) if rows and cols else 0
+    if address < 0 or stride < 0 or address + size > len(memory):
+        raise MemoryFault(f"accelerator tile of {rows}x{cols} at {address:#x} outside of memory")
+    return np.ndarray(shape, dtype="<f8", buffer=memory.buffer, offset=address, strides=(8 * stride, 8))
@@ -0,0 +1,90 @@
+"""
+memory.py: flat guest memory shared with the host without copies
+
+Guest memory is one buffer starting at address 0: a bytearray, or an
+anonymous mmap for large sizes, whose pages the OS zeroes lazily on first
+touch instead of all up front. The emulator reads and writes it with
+struct, and the host maps NumPy arrays straight onto guest address ranges,
+so tensors cross the boundary without being copied.
+"""
+import mmap
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+# Memories of at least this many bytes are backed by an anonymous mmap
+MMAP_THRESHOLD = 16 << 20
+
+
+class EmulatorError(RuntimeError):
+    pass
+
+
+class MemoryFault(EmulatorError):
+    pass
+
+
+class Memory:
+    def __init__(self, size: int, use_mmap: Optional[bool] = None):
+        """
+        Args:
+            size: Size in bytes.
+            use_mmap: Back the memory with an anonymous mmap; by default for
+                sizes of at least MMAP_THRESHOLD.
+        """
+        if size <= 0:
+            raise ValueError(f"memory size must be positive, got {size}")
+        if use_mmap is None:
+            use_mmap = size >= MMAP_THRESHOLD
+        self.size = size
+        # What the emulator's loads and stores pack into and unpack from
+        self.buffer: Union[bytearray, mmap.mmap] = mmap.mmap(-1, size) if use_mmap else bytearray(size)
+        self._view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def check(self, address: int, size: int, access: str = "access") -> None:
+        if address < 0 or size < 0 or address + size > self.size:
+            raise MemoryFault(f"{access} of {size} bytes at {address:#x} outside of memory")
+
+    def view(self, address: int, size: int) -> memoryview:
+        """
+        Returns a writable memoryview of [address, address + size).
+        """
+        self.check(address, size)
+        return self._view[address:address + size]
+
+    def read(self, address: int, size: int) -> bytes:
+        self.check(address, size, "read")
+        return bytes(self._view[address:address + size])
+
+    def write(self, address: int, data) -> None:
+        data = memoryview(data).cast("B")
+        self.check(address, len(data), "write")
+        self._view[address:address + len(data)] = data
+
+    def array(self, address: int, shape: Sequence[int], dtype="<f8") -> np.ndarray:
+        """
+        Returns a C-contiguous array of the given shape and dtype that lives
+        in guest memory at address: writes through it are writes to guest
+        memory and the other way round.
+        """
+        dtype = np.dtype(dtype)
+        shape = tuple(int(extent) for extent in shape)
+        count = int(np.prod(shape, dtype=np.int64))
+        self.check(address, count * dtype.itemsize)
+        return np.frombuffer(self.buffer, dtype, count, address).reshape(shape)
+
+    def address_of(self, array: np.ndarray) -> int:
+        """
+        Returns the guest address of an array that lives in this memory, as
+        from array(), or -1 for any other array.
+        """
+        if not array.flags.c_contiguous:
+            return -1
+        base = np.frombuffer(self.buffer, np.uint8, 1).ctypes.data
+        address = array.ctypes.data - base
+        if 0 <= address and address + array.nbytes <= self.size:
+            return address
+        return -1
@@ -0,0 +1,218 @@
+"""
+profile.py: performance counters and hot blocks of emulated programs
+
+With a Profile set as Emulator.profile, the run loop counts how many times
+every translated block executes, and nothing else. An execution of a block
+retires each of its instructions exactly once, so everything else is
+derived from those counts when it is asked for: retired instructions, the
+per-opcode histogram, memory traffic and estimated cycles are the static
+contents of each block times its executions. Without a profile the run
+loop pays one test per block.
+
+Cycles are estimated with a CostModel, a fixed latency per instruction
+class in the spirit of a simple in-order core; it ignores caches and branch
+prediction, so it is for comparing programs and compiler passes with each
+other, not for predicting hardware. Hot blocks map back to source locations
+through MachineProgram.location.
+"""
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+from ..frontend.location import Location
+from .isa import INSTRUCTIONS
+
+if TYPE_CHECKING:
+    from .codegen import MachineProgram
+    from .emulator import Block
+
+# Bytes moved by every load and store
+LOAD_SIZES = {"lb": 1, "lh": 2, "lw": 4, "ld": 8, "lbu": 1, "lhu": 2, "lwu": 4, "fld": 8}
+STORE_SIZES = {"sb": 1, "sh": 2, "sw": 4, "sd": 8, "fsd": 8}
+
+# Instruction class of the mnemonics not costed as "alu"
+_CLASSES = {
+    **{name: "load" for name in LOAD_SIZES},
+    **{name: "store" for name in STORE_SIZES},
+    **{name: "branch" for name in ("beq", "bne", "blt", "bge", "bltu", "bgeu")},
+    **{name: "jump" for name in ("jal", "jalr")},
+    **{name: "multiply" for name in ("mul", "mulh", "mulhsu", "mulhu", "mulw")},
+    **{name: "divide" for name in ("div", "divu", "rem", "remu", "divw", "divuw", "remw", "remuw")},
+    **{name: "float_add" for name in ("fadd.d", "fsub.d", "fmin.d", "fmax.d")},
+    "fmul.d": "float_multiply",
+    "fdiv.d": "float_divide",
+    "fsqrt.d": "float_sqrt",
+    **{name: "float_convert" for name in ("fcvt.w.d", "fcvt.l.d", "fcvt.d.w", "fcvt.d.l")},
+    **{name: "system" for name in ("ecall", "ebreak", "fence", "fence.i")},
+    **{name: "accelerator" for name in INSTRUCTIONS if name.startswith("lacc.")},
+}
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """
+    Cycles per instruction of every instruction class.
+    """
+    alu: int = 1
+    load: int = 3
+    store: int = 1
+    branch: int = 1
+    jump: int = 2
+    multiply: int = 3
+    divide: int = 20
+    float_add: int = 4
+    float_multiply: int = 4
+    float_divide: int = 20
+    float_sqrt: int = 25
+    float_convert: int = 2
+    system: int = 1
+    # Issuing a lacc.* instruction; the accelerator's own cycles are in
+    # Accelerator.cycles
+    accelerator: int = 1
+
+    def cycles(self, name: str) -> int:
+        return getattr(self, _CLASSES.get(name, "alu"))
+
+
+class HotBlock(NamedTuple):
+    start: int
+    end: int
+    executions: int
+    instructions: int
+    cycles: int
+    # Source location of the block's first instruction
+    location: Optional[Location]
+
+
+class Profile:
+    def __init__(self, cost_model: CostModel = CostModel()):
+        self.cost_model = cost_model
+        # Executions of every block run while the profile was set
+        self.counts: Dict["Block", int] = {}
+        self._block_cycles: Dict["Block", int] = {}
+
+    def reset(self) -> None:
+        self.counts.clear()
+        self._block_cycles.clear()
+
+    def cycles_of(self, block: "Block") -> int:
+        # Estimated cycles of one execution of block
+        cycles = self._block_cycles.get(block)
+        if cycles is None:
+            cycles = self._block_cycles[block] = sum(map(self.cost_model.cycles, block.names))
+        return cycles
+
+    def histogram(self) -> Dict[str, int]:
+        """
+        Returns the number of retired instructions of every mnemonic, most
+        frequent first.
+        """
+        histogram = Counter()
+        for block, executions in self.counts.items():
+            for name in block.names:
+                histogram[name] += executions
+        return dict(histogram.most_common())
+
+    def counters(self) -> Dict[str, int]:
+        counters = dict.fromkeys(("instructions", "cycles", "loads", "stores", "bytes_loaded", "bytes_stored"), 0)
+        for name, count in self.histogram().items():
+            counters["instructions"] += count
+            counters["cycles"] += count * self.cost_model.cycles(name)
+            if name in LOAD_SIZES:
+                counters["loads"] += count
+                counters["bytes_loaded"] += count * LOAD_SIZES[name]
+            elif name in STORE_SIZES:
+                counters["stores"] += count
+                counters["bytes_stored"] += count * STORE_SIZES[name]
+        counters["block_executions"] = sum(self.counts.values())
+        counters["blocks"] = len(self.counts)
+        return counters
+
+    def hot_blocks(self, count: int = 10, program: Optional["MachineProgram"] = None) -> List[HotBlock]:
+        """
+        Returns the count blocks with the most estimated cycles, hottest
+        first, with their source locations if the program is given.
+        """
+        hot = sorted(self.counts.items(), key=lambda item: item[1] * self.cycles_of(item[0]), reverse=True)[:count]
+        return [
+            HotBlock(
+                block.start,
+                block.end,
+                executions,
+                executions * block.size,
+                executions * self.cycles_of(block),
+                program.location(block.start) if program is not None else None,
+            )
+            for block, executions in hot
+        ]
+
+    def by_location(self, program: "MachineProgram") -> List[Tuple[Optional[Location], int, int]]:
+        """
+        Returns (source location, retired instructions, estimated cycles) of
+        the code of every location, hottest first; the None location holds
+        the code generated for no node, such as the prologue.
+        """
+        # Locations are not hashable, their text is
+        totals: Dict[str, list] = {}
+        for block, executions in self.counts.items():
+            for index, name in enumerate(block.names):
+                location = program.location(block.start + 4 * index)
+                entry = totals.get(repr(location))
+                if entry is None:
+                    entry = totals[repr(location)] = [location, 0, 0]
+                entry[1] += executions
+                entry[2] += executions * self.cost_model.cycles(name)
+        return sorted(map(tuple, totals.values()), key=lambda entry: entry[2], reverse=True)
+
+    def to_dict(self, program: Optional["MachineProgram"] = None, hot_blocks: int = 10) -> dict:
+        counters = self.counters()
+        total = counters["cycles"] or 1
+        result = {
+            "cost_model": asdict(self.cost_model),
+            "counters": counters,
+            "histogram": self.histogram(),
+            "hot_blocks": [
+                {
+                    **block._asdict(),
+                    "location": None if block.location is None else repr(block.location),
+                    "share": block.cycles / total,
+                }
+                for block in self.hot_blocks(hot_blocks, program)
+            ],
+        }
+        if program is not None:
+            result["locations"] = [
+                {
+                    "location": None if location is None else repr(location),
+                    "instructions": instructions,
+                    "cycles": cycles,
+                    "share": cycles / total,
+                }
+                for location, instructions, cycles in self.by_location(program)
+            ]
+        return result
+
+    def to_json(self, program: Optional["MachineProgram"] = None, hot_blocks: int = 10, **kwargs) -> str:
+        return json.dumps(self.to_dict(program, hot_blocks), **kwargs)
+
+    def report(self, program: Optional["MachineProgram"] = None, hot_blocks: int = 10) -> str:
+        """
+        Returns the counters and hot blocks as text.
+        """
+        counters = self.counters()
+        total = counters["cycles"] or 1
+        lines = [
+            f"{counters['instructions']} instructions, {counters['cycles']} cycles (estimated), "
+            f"{counters['block_executions']} block executions of {counters['blocks']} blocks",
+            f"{counters['loads']} loads ({counters['bytes_loaded']} bytes), "
+            f"{counters['stores']} stores ({counters['bytes_stored']} bytes)",
+            "hot blocks:",
+        ]
+        for block in self.hot_blocks(hot_blocks, program):
+            where = f"  {block.location}" if block.location is not None else ""
+            lines.append(
+                f"  {block.start:#x}-{block.end:#x}: {block.cycles / total:6.1%} of cycles, "
+                f"{block.executions} executions, {block.instructions} instructions{where}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,146 @@
+"""
+runner.py: compile lisp programs to RISC-V and run them in the emulator
+
+build_program runs the compiler pipeline (parse, IR generation, the
+optimization and fusion passes, lowering) and generates RISC-V code for
+the result. run_program places the inputs in an emulator sized for the
+program, calls main and returns the result as an array that lives in guest
+memory. Tensors cross the boundary without copies: input_arrays maps the
+inputs onto guest memory so the host can fill them in place, and
+run_program does not copy a value that already lives there.
+"""
+from typing import Any, Dict, Optional
+
+import numpy as np
+from xdsl.dialects.builtin import TensorType, f64
+
+from ..compiler import CompileOptions
+from ..frontend.ir_gen import IRGen
+from ..frontend.lexer import LispLexer
+from ..frontend.parser import LispParser
+from ..passes.fusion import fuse
+from ..passes.lowering import lower
+from ..passes.optimization import optimize
+from .codegen import MachineProgram, generate
+from .emulator import Emulator, EmulatorError
+
+# Guest memory set aside for the stack
+STACK_SIZE = 64 << 10
+
+_ALIGNMENT = 64
+
+
+def _align(address: int) -> int:
+    return (address + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def build_program(text: str, options: CompileOptions = CompileOptions(), file_name: str = "<stdin>") -> MachineProgram:
+    """
+    Compiles the program text to RISC-V.
+    """
+    forms = LispParser(LispLexer(text), file_name).parse_program()
+    input_types = {name: TensorType(f64, list(shape)) for name, shape in options.input_shapes}
+    ir_gen = IRGen(input_types)
+    module = ir_gen.ir_gen_module(forms)
+    if options.optimize:
+        optimize(module)
+    # For MachineProgram.location, and the profiles that use it
+    ir_gen.attach_locations(module)
+    if options.fuse:
+        fuse(module)
+    lower(module, options.tile_sizes, options.accelerate)
+    return generate(module)
+
+
+def _input_addresses(machine: MachineProgram) -> Dict[str, int]:
+    # Tensor inputs are placed one after another after the program
+    addresses = {}
+    address = _align(machine.program.end)
+    for name, shape in machine.inputs:
+        if shape is not None:
+            addresses[name] = address
+            address += _align(8 * int(np.prod(shape)))
+    return addresses
+
+
+def new_emulator(machine: MachineProgram) -> Emulator:
+    """
+    Returns an emulator with the program loaded and room for its inputs.
+    """
+    inputs_size = sum(_align(8 * int(np.prod(shape))) for _, shape in machine.inputs if shape is not None)
+    emulator = Emulator(_align(machine.program.end) + inputs_size + STACK_SIZE)
+    emulator.load(machine.program)
+    return emulator
+
+
+def input_arrays(machine: MachineProgram, emulator: Emulator) -> Dict[str, np.ndarray]:
+    """
+    Returns the guest memory of every tensor input of the program as an
+    array, to be filled in place and passed to run_program without a copy.
+    """
+    shapes = dict(machine.inputs)
+    return {name: emulator.array(address, shapes[name]) for name, address in _input_addresses(machine).items()}
+
+
+def run_program(
+    machine: MachineProgram,
+    values: Optional[Dict[str, Any]] = None,
+    emulator: Optional[Emulator] = None,
+    max_instructions: Optional[int] = None,
+) -> Any:
+    """
+    Calls the program's main with the given inputs.
+
+    Args:
+        machine: The program, from build_program.
+        values: Value of every input, a float or an ndarray of the compiled shape.
+        emulator: Emulator to run in, from new_emulator(machine); a new one by default.
+        max_instructions: Stop with an EmulatorError after this many instructions.
+
+    Returns:
+        The result of the program: a float, None, or an ndarray that lives in
+        guest memory and is overwritten by the next run in the same emulator.
+    """
+    values = values or {}
+    if emulator is None:
+        emulator = new_emulator(machine)
+
+    addresses = _input_addresses(machine)
+    int_args, float_args = [], []
+    for name, shape in machine.inputs:
+        if name not in values:
+            raise EmulatorError(f"no value for input {name}")
+        value = values[name]
+        if shape is None:
+            float_args.append(float(value))
+            continue
+        if np.shape(value) != shape:
+            raise EmulatorError(f"input {name} has shape {np.shape(value)}, the program was compiled for {shape}")
+        address = addresses[name]
+        # Values from input_arrays are already in place
+        if not (
+            isinstance(value, np.ndarray)
+            and value.dtype == np.dtype("<f8")
+            and emulator.memory.address_of(value) == address
+        ):
+            emulator.array(address, shape)[...] = value
+        int_args.append(address)
+
+    emulator.call(machine.entry, int_args, float_args, max_instructions)
+
+    if not machine.has_result:
+        return None
+    if machine.result_shape is None:
+        return emulator.f[10]
+    return emulator.array(emulator.x[10], machine.result_shape)
+
+
+def run_source(text: str, values: Optional[Dict[str, Any]] = None, file_name: str = "<stdin>") -> Any:
+    """
+    Compiles and runs the program text; ndarray inputs are compiled for
+    their shapes and everything else is a scalar.
+    """
+    values = values or {}
+    shapes = {name: np.shape(value) for name, value in values.items() if isinstance(value, np.ndarray)}
+    machine = build_program(text, CompileOptions.create(shapes), file_name)
+    return run_program(machine, values)
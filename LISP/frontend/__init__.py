@@ -0,0 +1,34 @@
+"""
+Names of the front end, imported from their modules on first use (PEP 562)
+like those of the LISP package.
+"""
+import importlib
+
+# Name -> module it lives in
+_LAZY = {
+    "LispLexer": "lexer",
+    "LispParser": "parser",
+    "Location": "location",
+    "LineIndex": "location",
+    "ASTTable": "ast_table",
+    "IncrementalParse": "incremental",
+    "Resolver": "resolver",
+    "parse_parallel": "parallel",
+    "IRGen": "ir_gen",
+}
+
+__all__ = sorted(_LAZY)
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    # Later lookups find it without calling __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,174 @@
+"""
+ast_table.py: struct-of-arrays storage for large programs
+
+Every node is a row spread over a few typed arrays (kind, operands, value,
+name, line, col) instead of a Python object with its own Location. The
+lisp_ast node classes remain the way to look at the program: node() and
+forms() build them on demand as views over the rows.
+"""
+from array import array
+from typing import Iterable, Iterator, List
+
+from .lexer import LispLexer
+from .lisp_ast import *
+from .parser import LispParser
+
+_KINDS = list(ExprASTKind)
+
+# Marks an unused operand or name slot
+NO_INDEX = -1
+
+
+class ASTTable:
+    def __init__(self, file_name: str = "<stdin>"):
+        self.file_name = file_name
+
+        # One entry per node
+        self.kinds = array("B")   # ExprASTKind value
+        self.lhs = array("i")     # lhs/expr child, or the constant of a tensor literal
+        self.rhs = array("i")     # rhs child, or the var_type shape of a set
+        self.values = array("d")  # value of a number
+        self.names = array("i")   # interned name or operator
+        self.lines = array("i")
+        self.cols = array("i")
+
+        # Indices of the top-level forms
+        self.roots = array("i")
+
+        # Names and operators, each stored once
+        self.strings: List[str] = []
+        self._string_ids = {}
+        self._shape_ids = {}
+
+        # Payloads that do not fit a column (tensor elements, types)
+        self.constants: List[object] = []
+
+    @classmethod
+    def from_forms(cls, forms: Iterable[ExprAST], file_name: str = "<stdin>") -> "ASTTable":
+        table = cls(file_name)
+        for form in forms:
+            table.add_form(form)
+        return table
+
+    @classmethod
+    def parse(cls, text: str, file_name: str = "<stdin>") -> "ASTTable":
+        # Forms are packed as they are parsed, so only one form exists as objects at a time
+        parser = LispParser(LispLexer(text), file_name)
+        return cls.from_forms(parser.parse_program(), file_name)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @property
+    def nbytes(self) -> int:
+        # Size of the column buffers, excluding strings and constants
+        columns = (self.kinds, self.lhs, self.rhs, self.values, self.names, self.lines, self.cols, self.roots)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def add_form(self, form: ExprAST) -> int:
+        index = self.add(form)
+        self.roots.append(index)
+        return index
+
+    def add(self, expr: ExprAST) -> int:
+        # Children are appended before their parent
+        lhs = rhs = name = NO_INDEX
+        value = 0.0
+
+        if isinstance(expr, NumberExprAST):
+            value = expr.val
+        elif isinstance(expr, VariableExprAST):
+            name = self._intern(expr.name)
+        elif isinstance(expr, (BinaryExprAST, TensorOpExprAST)):
+            lhs = self.add(expr.lhs)
+            rhs = self.add(expr.rhs)
+            name = self._intern(expr.op)
+        elif isinstance(expr, VarDeclExprAST):
+            lhs = self.add(expr.expr)
+            rhs = self._intern_shape(expr.var_type.shape)
+            name = self._intern(expr.name)
+        elif isinstance(expr, ReturnExprAST):
+            lhs = self.add(expr.expr)
+        elif isinstance(expr, TensorLiteralExprAST):
+            lhs = self._constant((expr.elements, expr.tensor_type))
+        else:
+            raise TypeError(f"Cannot store {type(expr).__name__} in an ASTTable")
+
+        self.kinds.append(expr.kind.value)
+        self.lhs.append(lhs)
+        self.rhs.append(rhs)
+        self.values.append(value)
+        self.names.append(name)
+        self.lines.append(expr.loc.line)
+        self.cols.append(expr.loc.col)
+        return len(self.kinds) - 1
+
+    def kind(self, index: int) -> ExprASTKind:
+        return _KINDS[self.kinds[index] - 1]
+
+    def location(self, index: int) -> Location:
+        return Location(self.file_name, self.lines[index], self.cols[index])
+
+    def node(self, index: int) -> ExprAST:
+        """
+        Builds the lisp_ast node stored at index, including its children.
+        """
+        kind = self.kind(index)
+        loc = self.location(index)
+        name = self.names[index]
+
+        if kind is ExprASTKind.Num:
+            return NumberExprAST(loc=loc, val=self.values[index])
+        elif kind is ExprASTKind.Var:
+            return VariableExprAST(loc=loc, name=self.strings[name])
+        elif kind is ExprASTKind.BinOp:
+            return BinaryExprAST(
+                loc=loc,
+                op=self.strings[name],
+                lhs=self.node(self.lhs[index]),
+                rhs=self.node(self.rhs[index])
+            )
+        elif kind is ExprASTKind.TensorOp:
+            return TensorOpExprAST(
+                loc=loc,
+                op=self.strings[name],
+                lhs=self.node(self.lhs[index]),
+                rhs=self.node(self.rhs[index])
+            )
+        elif kind is ExprASTKind.VarDecl:
+            return VarDeclExprAST(
+                loc=loc,
+                name=self.strings[name],
+                var_type=VarType(list(self.constants[self.rhs[index]])),
+                expr=self.node(self.lhs[index])
+            )
+        elif kind is ExprASTKind.Return:
+            return ReturnExprAST(loc=loc, expr=self.node(self.lhs[index]))
+        else:
+            elements, tensor_type = self.constants[self.lhs[index]]
+            return TensorLiteralExprAST(loc=loc, elements=elements, tensor_type=tensor_type)
+
+    def forms(self) -> Iterator[ExprAST]:
+        for root in self.roots:
+            yield self.node(root)
+
+    def _intern(self, string: str) -> int:
+        index = self._string_ids.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(string)
+            self._string_ids[string] = index
+        return index
+
+    def _intern_shape(self, shape) -> int:
+        # Declared types repeat across forms, so share one tuple per shape
+        shape = tuple(shape)
+        index = self._shape_ids.get(shape)
+        if index is None:
+            index = self._constant(shape)
+            self._shape_ids[shape] = index
+        return index
+
+    def _constant(self, value: object) -> int:
+        self.constants.append(value)
+        return len(self.constants) - 1
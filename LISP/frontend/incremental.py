@@ -0,0 +1,180 @@
+"""
+incremental.py: reparse only the top-level forms an edit touches
+
+IncrementalParse keeps the forms of a source together with the character
+span of each one. After an edit, the forms overlapping the edited range are
+lexed and parsed again and every other form is reused as it is. Forms after
+the edit keep their nodes, but their locations have to follow the text: the
+line shift is recorded for the whole tail at once, in NumPy, and applied to
+the nodes of a form the first time it is read, so the cost of an edit does
+not grow with the size of the file.
+"""
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+from .lexer import LispLexer
+from .lisp_ast import (
+    BinaryExprAST,
+    ExprAST,
+    ReturnExprAST,
+    TensorOpExprAST,
+    VarDeclExprAST,
+)
+from .location import LineIndex
+from .parser import LispParser
+
+
+def _parse_spans(text: str, file_name: str, first_line: int, first_col: int) -> Tuple[List[ExprAST], List[int], List[int]]:
+    """
+    Parses every top-level form of text.
+
+    Returns:
+        The forms, and the start and end offsets in text of each one.
+    """
+    parser = LispParser(LispLexer(text), file_name, LineIndex(text, first_line, first_col))
+    forms, starts, ends = [], [], []
+    while True:
+        tok = parser.current_token()
+        if tok is None:
+            break
+        starts.append(tok.lexpos)
+        forms.append(parser.parse())
+        # A form ends with the token just eaten, and nothing past it has been
+        # read yet, so the lexer stands right after the closing parenthesis
+        ends.append(parser.lexer.lexer.lexpos)
+    return forms, starts, ends
+
+
+def walk(expr: ExprAST) -> Iterator[ExprAST]:
+    """
+    Yields expr and every node below it.
+    """
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (BinaryExprAST, TensorOpExprAST)):
+            stack.append(node.rhs)
+            stack.append(node.lhs)
+        elif isinstance(node, (VarDeclExprAST, ReturnExprAST)):
+            stack.append(node.expr)
+
+
+def _position(text: str, offset: int) -> Tuple[int, int]:
+    # 1-based line and column of offset, counted in C
+    line = text.count("\n", 0, offset) + 1
+    col = offset - (text.rfind("\n", 0, offset) + 1) + 1
+    return line, col
+
+
+class IncrementalParse:
+    """
+    The parse of a source that is kept up to date across edits.
+
+    Reading the forms (form, forms) gives the same nodes, with the same
+    locations, as parsing the current text from scratch.
+    """
+
+    def __init__(self, text: str, file_name: str = "<stdin>"):
+        self.text = text
+        self.file_name = file_name
+
+        forms, starts, ends = _parse_spans(text, file_name, 1, 1)
+        self._forms = forms
+        self.starts = np.array(starts, dtype=np.int64)
+        self.ends = np.array(ends, dtype=np.int64)
+        # Lines every form still has to move by since it was last read
+        self._line_shift = np.zeros(len(forms), dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._forms)
+
+    def form(self, index: int) -> ExprAST:
+        """
+        Returns the top-level form at index, with up to date locations.
+        """
+        shift = int(self._line_shift[index])
+        form = self._forms[index]
+        if shift:
+            for node in walk(form):
+                node.loc.line += shift
+            self._line_shift[index] = 0
+        return form
+
+    @property
+    def forms(self) -> List[ExprAST]:
+        for index in np.flatnonzero(self._line_shift):
+            self.form(int(index))
+        return list(self._forms)
+
+    def span(self, index: int) -> Tuple[int, int]:
+        # Start and end offsets of the form at index in the current text
+        return int(self.starts[index]), int(self.ends[index])
+
+    def edit(self, start: int, end: int, new_text: str) -> range:
+        """
+        Replaces text[start:end] with new_text and updates the forms.
+
+        Only the forms overlapping or next to [start, end] are parsed again.
+        On a syntax error the parse is left as it was before the edit.
+
+        Returns:
+            The indices of the forms that were parsed again; all the others
+            are the same node objects as before.
+        """
+        old_text = self.text
+        if not 0 <= start <= end <= len(old_text):
+            raise ValueError(f"edit range {start}:{end} outside of a text of length {len(old_text)}")
+
+        text = old_text[:start] + new_text + old_text[end:]
+        delta = len(new_text) - (end - start)
+        new_end = end + delta
+
+        # The forms ending at or after start and starting at or before end;
+        # forms right next to the edit are included, as the edit may extend them
+        first = int(np.searchsorted(self.ends, start, "left"))
+        stop = int(np.searchsorted(self.starts, end, "right"))
+        region_start, region_end = start, new_end
+        if first < stop:
+            region_start = min(start, int(self.starts[first]))
+            region_end = max(new_end, int(self.ends[stop - 1]) + delta)
+
+        line, col = _position(text, region_start)
+        try:
+            forms, starts, ends = _parse_spans(text[region_start:region_end], self.file_name, line, col)
+        except SyntaxError:
+            # The unchanged forms are balanced, so an edit that broke the
+            # nesting cannot be repaired by them; parse to the end of the text
+            # so the error is the one a full parse reports, or take the forms
+            # that parse does find
+            forms, starts, ends = _parse_spans(text[region_start:], self.file_name, line, col)
+            stop = len(self._forms)
+            region_end = len(text)
+
+        # Nothing has changed so far; update the state all at once
+        count = len(forms)
+        self._forms[first:stop] = forms
+        self.starts = np.concatenate((self.starts[:first], np.array(starts, dtype=np.int64) + region_start, self.starts[stop:] + delta))
+        self.ends = np.concatenate((self.ends[:first], np.array(ends, dtype=np.int64) + region_start, self.ends[stop:] + delta))
+
+        lines = new_text.count("\n") - old_text.count("\n", start, end)
+        self._line_shift = np.concatenate((self._line_shift[:first], np.zeros(count, dtype=np.int64), self._line_shift[stop:] + lines))
+        self.text = text
+
+        # Forms further along the line the edit ends on also move sideways
+        old_col = end - (old_text.rfind("\n", 0, end) + 1)
+        new_col = new_end - (text.rfind("\n", 0, new_end) + 1)
+        if new_col != old_col and region_end < len(text):
+            line_end = text.find("\n", region_end)
+            if line_end == -1:
+                line_end = len(text)
+            end_line = line + text.count("\n", region_start, new_end)
+            index = first + count
+            while index < len(self._forms) and self.starts[index] < line_end:
+                for node in walk(self.form(index)):
+                    if node.loc.line == end_line:
+                        node.loc.col += new_col - old_col
+                index += 1
+
+        return range(first, first + count)
@@ -4,4 +4,152 @@ Emit xDSL Operations using your lisp_dialect
 
 Basically the code generator from Lisp AST to IR.
 """
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from xdsl.dialects.builtin import FloatAttr, ModuleOp, StringAttr, f64
+from xdsl.ir import Attribute, Operation, SSAValue
+
+from ..dialects import lisp
+from .lisp_ast import *
+from .location import Location
+
+
+class IRGenError(Exception):
+    pass
+
+
+# Elementwise operators of BinaryExprAST and TensorOpExprAST
+_BINARY_OPS = {
+    "+": lisp.AddOp,
+    "-": lisp.SubOp,
+    "*": lisp.MulOp,
+    "/": lisp.DivOp,
+}
+
+_TENSOR_OPS = {
+    "add": lisp.AddOp,
+    "subtract": lisp.SubOp,
+    "multiply": lisp.MulOp,
+    "matmul": lisp.MatmulOp,
+}
+
+
+class IRGen:
+    """
+    Implementation of a simple MLIR emission from the Lisp AST.
+
+    Every node is visited once and emits at most one operation, appended to
+    a flat list that becomes the module body, so generation is linear in the
+    size of the program.
+    """
+
+    def __init__(self, input_types: Optional[Dict[str, Attribute]] = None):
+        # Types of the program inputs; inputs not listed are f64 scalars
+        self.input_types = input_types or {}
+        self.ops: List[Operation] = []
+        # Value currently bound to each name
+        self.symbol_table: Dict[str, SSAValue] = {}
+        # Scalar literals repeat a lot, so each value is emitted only once;
+        # the module body is a single block, so the first one dominates every use.
+        # Keyed by value and sign, as -0.0 == 0.0 but 1/-0.0 != 1/0.0
+        self.scalar_constants: Dict[Tuple[float, float], SSAValue] = {}
+        # Source location of every op emitted for a node, see attach_locations
+        self.locations: Dict[Operation, Location] = {}
+
+    def ir_gen_module(self, program: Iterable[ExprAST]) -> ModuleOp:
+        """
+        Converts the top-level forms to a module. Like the interpreter, the
+        first top-level (return ...) ends the program, and a program that
+        never returns returns the value of its last form.
+        """
+        result = None
+        for form in program:
+            if isinstance(form, ReturnExprAST):
+                self.ir_gen_return(form)
+                break
+            result = self.ir_gen_expr(form)
+        else:
+            if result is not None:
+                self.emit(lisp.ReturnOp(result))
+        return ModuleOp(self.ops)
+
+    def emit(self, op: Operation, loc: Optional[Location] = None) -> SSAValue:
+        self.ops.append(op)
+        if loc is not None:
+            self.locations[op] = loc
+        return op.results[0] if op.results else None
+
+    def attach_locations(self, module: ModuleOp) -> None:
+        """
+        Sets the lisp.loc attribute of every op of module that was generated
+        from a node. Run it after LispOptimizationPass, if at all: CSE
+        compares attributes, so it would no longer merge identical ops from
+        different places.
+        """
+        for op in module.body.block.ops:
+            location = self.locations.get(op)
+            if location is not None:
+                lisp.set_location(op, repr(location))
+
+    def ir_gen_expr(self, expr: ExprAST) -> SSAValue:
+        kind = expr.kind
+        if kind is ExprASTKind.Num:
+            return self.ir_gen_number(expr)
+        elif kind is ExprASTKind.Var:
+            return self.ir_gen_variable(expr)
+        elif kind is ExprASTKind.BinOp:
+            return self.ir_gen_binary(expr, _BINARY_OPS)
+        elif kind is ExprASTKind.TensorOp:
+            return self.ir_gen_binary(expr, _TENSOR_OPS)
+        elif kind is ExprASTKind.TensorLiteral:
+            return self.emit(lisp.ConstantOp(expr.elements), expr.loc)
+        elif kind is ExprASTKind.VarDecl:
+            value = self.ir_gen_expr(expr.expr)
+            result = self.emit(lisp.SetOp.create(
+                operands=[value],
+                result_types=[value.type],
+                properties={"var_name": StringAttr(expr.name)}
+            ), expr.loc)
+            result.name_hint = expr.name
+            self.symbol_table[expr.name] = result
+            return result
+        else:
+            raise IRGenError(f"{expr.loc}: (return ...) is only allowed at the top level")
+
+    def ir_gen_number(self, expr: NumberExprAST) -> SSAValue:
+        key = (expr.val, math.copysign(1.0, expr.val))
+        value = self.scalar_constants.get(key)
+        if value is None:
+            value = self.emit(lisp.ConstantOp.create(
+                result_types=[f64],
+                properties={"value": FloatAttr(expr.val, f64)}
+            ), expr.loc)
+            self.scalar_constants[key] = value
+        return value
+
+    def ir_gen_variable(self, expr: VariableExprAST) -> SSAValue:
+        value = self.symbol_table.get(expr.name)
+        if value is None:
+            # First read of a name that was never set: a program input
+            value = self.emit(lisp.VarOp(expr.name, self.input_types.get(expr.name, f64)), expr.loc)
+            value.name_hint = expr.name
+            self.symbol_table[expr.name] = value
+        return value
+
+    def ir_gen_binary(self, expr: ExprAST, ops) -> SSAValue:
+        op_class = ops.get(expr.op)
+        if op_class is None:
+            raise IRGenError(f"{expr.loc}: unknown operator '{expr.op}'")
+        lhs = self.ir_gen_expr(expr.lhs)
+        rhs = self.ir_gen_expr(expr.rhs)
+        try:
+            result_type = op_class.infer_type(lhs.type, rhs.type)
+        except ValueError as err:
+            raise IRGenError(f"{expr.loc}: {expr.op}: {err}") from None
+        # create() skips the generic IRDL argument processing of __init__,
+        # which costs more than the rest of IR generation put together
+        return self.emit(op_class.create(operands=[lhs, rhs], result_types=[result_type]), expr.loc)
+
+    def ir_gen_return(self, expr: ReturnExprAST) -> None:
+        self.emit(lisp.ReturnOp(self.ir_gen_expr(expr.expr)), expr.loc)
@@ -1,7 +1,13 @@
 import re
+import threading
 from enum import Enum, auto
+from typing import TYPE_CHECKING, Optional, Tuple
+
 from ply import lex
 
+if TYPE_CHECKING:
+    import numpy as np
+
 # Token kinds
 class LispTokenKind(Enum):
     PARENTHESE_OPEN = auto()    # "("
@@ -14,14 +20,129 @@ class LispTokenKind(Enum):
     TENSOR_OP = auto()          # Tensor operations (e.g. matmul)
     IDENTIFIER = auto()         # Variable names
     NUMBER = auto()             # Numbers (e.g. 42, 3.14)
+    TENSOR_DATA = auto()        # A whole numeric [ ... ] block, converted in bulk
     EOF = auto()                # End of file token
 
+# Longest run of characters that can appear in a numeric [ ... ] block
+_NUMERIC_RUN = re.compile(r'[\[\] \t\r\n0-9.eE+\-]*')
+
+
+def _scan_tensor_block(text: str, start: int, run_end: int) -> Optional[Tuple[int, list, int]]:
+    """
+    Checks the structure of the bracketed numeric block opening at start,
+    visiting only its brackets, never its numbers.
+
+    Returns:
+        (end offset, length of every non-innermost level, number of
+        innermost rows), or None if the block is not a regular numeric
+        tensor and must be lexed token by token.
+    """
+    dims = []       # dims[d]: number of children of every level at depth d
+    children = []   # children seen so far by each open level
+    rows = 0
+    rank = None     # depth of the innermost rows
+    prev_pos, prev_open = start, True
+
+    # Brackets are found with str.find (memchr) rather than a regex scan
+    next_open = text.find("[", start, run_end)
+    next_close = text.find("]", start, run_end)
+
+    while next_close != -1:
+        if next_open != -1 and next_open < next_close:
+            pos, is_open = next_open, True
+            next_open = text.find("[", pos + 1, run_end)
+        else:
+            pos, is_open = next_close, False
+            next_close = text.find("]", pos + 1, run_end)
+        # Numbers may only sit between the brackets of an innermost row
+        if not (prev_open and not is_open) and text[prev_pos + 1:pos].strip():
+            return None
+
+        if is_open:
+            if children:
+                children[-1] += 1
+            children.append(0)
+        else:
+            depth = len(children) - 1
+            if prev_open:
+                # Closing an innermost row
+                if rank is None:
+                    rank = depth
+                elif rank != depth:
+                    return None
+                rows += 1
+            else:
+                # Inner levels close first, so dims can be shorter than depth here
+                if depth >= len(dims):
+                    dims.extend([None] * (depth + 1 - len(dims)))
+                if dims[depth] is None:
+                    dims[depth] = children[-1]
+                elif dims[depth] != children[-1]:
+                    return None
+            children.pop()
+            if not children:
+                return pos + 1, dims, rows
+        prev_pos, prev_open = pos, is_open
+    return None
+
+
+def _tensor_block_array(block: str, dims: list, rows: int) -> Optional["np.ndarray"]:
+    # Only large tensor literals get here; NumPy is not imported before
+    import numpy as np
+
+    # loadtxt reads numbers as float() does, which also takes a leading '+'
+    # or '.' ('+5', '-.5') that the NUMBER rule rejects. Both must lex the
+    # same, so '+' may only follow an exponent's 'e' and '.' only a digit
+    chars = np.frombuffer(block.encode("ascii"), dtype=np.uint8)
+    before, after = chars[:-1], chars[1:]
+    misplaced_plus = (after == ord("+")) & (before != ord("e")) & (before != ord("E"))
+    misplaced_dot = (after == ord(".")) & ((before < ord("0")) | (before > ord("9")))
+    if (misplaced_plus | misplaced_dot).any():
+        return None
+    # One line per innermost row, split only at its ']': a row may span
+    # several source lines. loadtxt checks every row has the same length
+    lines = block.replace("\n", " ").replace("\r", " ").replace("[", "").split("]")
+    try:
+        data = np.loadtxt(lines, dtype=np.float64, ndmin=2)
+    except ValueError:
+        return None
+    if data.shape[0] != rows:
+        # loadtxt skips blank lines, so an empty row [] leaves one row short
+        return None
+    return data.reshape(dims + [data.shape[1]])
+
+
 # Lexer class definition
 class LispLexer:
+    # Numeric [ ... ] blocks at least this long are returned as one TENSOR_DATA token
+    bulk_tensor_min_size = 4096
+
+    # PLY lexer holding the compiled master regex, shared by every instance
+    _prototype = None
+    _prototype_lock = threading.Lock()
+
     def __init__(self, input_text):
         self.input = input_text
-        self.lexer = lex.lex(module=self)
+        self._bulk_checked_until = 0
+        # Clone the shared lexer instead of rebuilding its tables; the clone
+        # has its own position/input state and its rules are bound to self
+        self.lexer = self._get_prototype().clone(self)
+        # clone() rebinds the per-state tables but not the active one
+        self.lexer.begin("INITIAL")
         self.lexer.input(input_text)
+
+    @classmethod
+    def _get_prototype(cls):
+        # Look in the class's own namespace so subclasses with extra rules get their own
+        prototype = cls.__dict__.get("_prototype")
+        if prototype is None:
+            with cls._prototype_lock:
+                prototype = cls.__dict__.get("_prototype")
+                if prototype is None:
+                    # lex.lex() needs bound rule methods, so reflect over a bare instance
+                    prototype = lex.lex(module=object.__new__(cls))
+                    cls._prototype = prototype
+        return prototype
     
     tokens = (
         'PARENTHESE_OPEN',
@@ -34,6 +155,7 @@ class LispLexer:
         'TENSOR_OP',
         'IDENTIFIER',
         'NUMBER',
+        'TENSOR_DATA',
     )
     
     t_PARENTHESE_OPEN = r'\('
@@ -68,8 +190,31 @@ class LispLexer:
         r'-?\d+\.?\d*([eE][+-]?\d+)?'
         return t
     
-    # Square bracket tokens
-    t_SQUARE_BRACKET_OPEN = r'\['
+    # Square bracket tokens; a large numeric block is converted in one pass
+    # with NumPy instead of producing a NUMBER token per element
+    def t_SQUARE_BRACKET_OPEN(self, t):
+        r'\['
+        if t.lexpos < self._bulk_checked_until:
+            # Inside a run that was already rejected
+            return t
+        text = t.lexer.lexdata
+        run_end = _NUMERIC_RUN.match(text, t.lexpos).end()
+        if run_end - t.lexpos < self.bulk_tensor_min_size:
+            return t
+
+        block = _scan_tensor_block(text, t.lexpos, run_end)
+        if block is not None and block[0] - t.lexpos >= self.bulk_tensor_min_size:
+            end, dims, rows = block
+            data = _tensor_block_array(text[t.lexpos:end], dims, rows)
+            if data is not None:
+                t.type = "TENSOR_DATA"
+                t.value = data
+                t.lexer.lexpos = end
+                return t
+        # Irregular blocks go through the per-token rules; the parser reports the error
+        self._bulk_checked_until = run_end
+        return t
+
     t_SQUARE_BRACKET_CLOSE = r'\]'
     
     # Ignore whitespace and comments
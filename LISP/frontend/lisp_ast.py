@@ -1,9 +1,14 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import Optional, Union, List
+from typing import TYPE_CHECKING, Optional, Union, List
 
 from .location import Location  
 
+if TYPE_CHECKING:
+    # NumPy is imported when a tensor literal is, so programs without one
+    # never pay for it
+    import numpy as np
+
 class ExprASTKind(Enum):
     VarDecl = auto()    # "(set x 5)"
     Return = auto()     # "(return x)"
@@ -13,16 +18,16 @@ class ExprASTKind(Enum):
     TensorLiteral = auto() # Tensor ([1 2] [3 4])
     TensorOp = auto()   # e.g. matmul or addition
 
-@dataclass
+@dataclass(slots=True)
 class VarType:
     shape: int
 
-@dataclass 
+@dataclass(slots=True)
 class TensorVarType: 
     shape: list[int] # (e.g., [2, 2] for a 2x2 tensor)
 
 # base class for all expressions
-@dataclass
+@dataclass(slots=True)
 class ExprAST:
     loc: Location
 
@@ -31,18 +36,20 @@ class ExprAST:
         raise NotImplementedError("Subclasses should implement this!")
 
 # variable declarations (e.g., (set x 5))
-@dataclass
+@dataclass(slots=True)
 class VarDeclExprAST(ExprAST):
     name: str
     var_type: VarType
     expr: ExprAST  # Expression assigned to the variable
+    # Frame slot of the variable, set by the Resolver; -1 until then
+    slot: int = field(default=-1, compare=False, repr=False)
 
     @property
     def kind(self):
         return ExprASTKind.VarDecl
 
 # numeric expressions (e.g., 10)
-@dataclass
+@dataclass(slots=True)
 class NumberExprAST(ExprAST):
     val: float  # The numeric literal value
 
@@ -51,16 +58,18 @@ class NumberExprAST(ExprAST):
         return ExprASTKind.Num
 
 # variable references (e.g., x)
-@dataclass
+@dataclass(slots=True)
 class VariableExprAST(ExprAST):
     name: str  # Variable name
+    # Frame slot of the variable, set by the Resolver; -1 until then
+    slot: int = field(default=-1, compare=False, repr=False)
 
     @property
     def kind(self):
         return ExprASTKind.Var
 
 # binary operations (e.g., (+ x 2))
-@dataclass
+@dataclass(slots=True)
 class BinaryExprAST(ExprAST):
     op: str  # The operator (e.g., +, -, *, /)
     lhs: ExprAST  # Left-hand side expression
@@ -71,7 +80,7 @@ class BinaryExprAST(ExprAST):
         return ExprASTKind.BinOp
 
 # return statements (e.g., (return x))
-@dataclass
+@dataclass(slots=True)
 class ReturnExprAST(ExprAST):
     expr: ExprAST  # Expression to return
 
@@ -85,14 +94,25 @@ class ReturnExprAST(ExprAST):
 (set A ([1 2] [3 4]) : tensor<2x2xi64>)
 (set B ([5 6] [7 8]) : tensor<2x2xi64>)
 """
-@dataclass
+@dataclass(slots=True, eq=False)
 class TensorLiteralExprAST(ExprAST):
-    elements: List[List[Union[float, int]]]
-    tensor_type: TensorVarType
+    elements: "np.ndarray"  # Contiguous float64 buffer of any rank
+    tensor_type: TensorVarType  # Shape of elements
 
     @property
     def kind(self):
         return ExprASTKind.TensorLiteral
+
+    def __eq__(self, other):
+        import numpy as np
+
+        if not isinstance(other, TensorLiteralExprAST):
+            return NotImplemented
+        return (
+            self.loc == other.loc
+            and self.tensor_type == other.tensor_type
+            and np.array_equal(self.elements, other.elements)
+        )
     
 """
 MULTIPLICATION:
@@ -100,7 +120,7 @@ MULTIPLICATION:
 ADDITION:
 (set C (+ A B))
 """  
-@dataclass
+@dataclass(slots=True)
 class TensorOpExprAST(ExprAST):
     op: str  # Operation type, e.g., "matmul" or "+"
     lhs: ExprAST  # Left-hand side tensor expression
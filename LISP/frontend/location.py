@@ -1,9 +1,14 @@
 import re
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
 
-from typing_extensions import Any
-
-from xdsl.utils.lexer import Token
+if TYPE_CHECKING:
+    # Only loc() takes xDSL tokens; importing xDSL here would slow down
+    # every parse
+    from xdsl.utils.lexer import Token
 
 """
 location.py is a source code location tracker 
@@ -12,7 +17,7 @@ a helper module that lets you figure out where in the source code (file, line, c
 - debugging
 """
 
-@dataclass
+@dataclass(slots=True)
 class Location:
     """
     Represents a specific location in a source file.
@@ -25,11 +30,59 @@ class Location:
     def __repr__(self):
         return f"{self.file}:{self.line}:{self.col}"
 
+    @classmethod
+    def parse(cls, text: str) -> "Location":
+        """
+        Inverse of repr: "file:line:col" back to a Location.
+        """
+        file, line, col = text.rsplit(":", 2)
+        return cls(file, int(line), int(col))
+
 # Regex pattern to find newlines, used to compute line and column numbers
 _NEWLINE = re.compile(r"\n")
 
 
-def loc(token: Token[Any]) -> Location:
+class LineIndex:
+    """
+    Table of line-start offsets for one source buffer.
+
+    Built once per input in a single pass, after which any character offset
+    is mapped to a (line, column) pair with a binary search.
+    """
+
+    __slots__ = ("line_starts", "line_base", "col_base")
+
+    def __init__(self, text: str, first_line: int = 1, first_col: int = 1):
+        # Offset of the first character of every line; line 1 starts at 0.
+        # Packed 8 bytes an offset, where a list of ints costs ~36
+        self.line_starts = array("q", [0])
+        self.line_starts.extend(match.end() for match in _NEWLINE.finditer(text))
+        # Where the buffer starts in its file, when it is a slice of a larger source
+        self.line_base = first_line - 1
+        self.col_base = first_col - 1
+
+    def line_col(self, offset: int) -> tuple[int, int]:
+        """
+        Maps a character offset to a 1-based (line, column) pair.
+        """
+        line = bisect_right(self.line_starts, offset)
+        col = offset - self.line_starts[line - 1] + 1
+        if line == 1:
+            col += self.col_base
+        return line + self.line_base, col
+
+    def location(self, file: str, offset: int) -> Location:
+        line, col = self.line_col(offset)
+        return Location(file, line, col)
+
+
+@lru_cache(maxsize=8)
+def _line_index(content: str) -> LineIndex:
+    # Tokens of the same input share one index
+    return LineIndex(content)
+
+
+def loc(token: "Token[Any]") -> Location:
     """
     Calculates the source code location (file, line, column)
     for a given token using its span data.
@@ -39,29 +92,6 @@ def loc(token: Token[Any]) -> Location:
 
     Returns:
         A Location object pointing to the position of the token.
-
-    Raises:
-        AssertionError: If the position cannot be calculated.
     """
-    file = token.span.input.name # Source file name
-    # Could be much faster
-
-    # Offset from the beginning of the input to the start of the token
-    remaining = token.span.start
-    prev_end = 0 # End position of the last newline
-
-    # Iterate over every newline in the input to determine line and column
-    for line, newline_match in enumerate(
-        re.finditer(_NEWLINE, token.span.input.content)
-    ):
-        len_line = newline_match.start() - prev_end
-        if remaining < len_line:
-            # Found the correct line; calculate column
-            return Location(file, line + 1, remaining + 1)
-        
-        # Move to next line
-        remaining -= len_line + 1 # +1 for the newline character
-        prev_end = newline_match.end()
-
-    # If we get here, we failed to locate the token in the input
-    raise AssertionError(f"Could not find location of token {token}")
\ No newline at end of file
+    span_input = token.span.input
+    return _line_index(span_input.content).location(span_input.name, token.span.start)
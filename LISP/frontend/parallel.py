@@ -0,0 +1,141 @@
+"""
+parallel.py: parse large sources across a process pool
+
+The input is cut into chunks at top-level form boundaries, each chunk is
+lexed and parsed in a worker, and the forms are merged back in source order.
+Every chunk records the line and column it starts at, so the locations
+computed by the workers are positions in the original file.
+"""
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from .lexer import LispLexer
+from .lisp_ast import ExprAST
+from .location import LineIndex
+from .parser import LispParser
+
+# Below this size a chunk is not worth shipping to another process
+MIN_CHUNK_SIZE = 1 << 16
+
+# Chunks per worker, so uneven chunks still balance across the pool
+CHUNKS_PER_WORKER = 4
+
+_PARENTHESES = re.compile(r"[()]")
+
+
+def _form_end(text: str, pos: int, depth: int) -> Optional[int]:
+    """
+    Returns the first offset at or after pos that lies outside every
+    top-level form, given the nesting depth at pos, or None if there is
+    no such offset.
+    """
+    if depth == 0:
+        return pos
+    if depth < 0:
+        # Unbalanced input; leave it to the parser to report
+        return None
+
+    for match in _PARENTHESES.finditer(text, pos):
+        depth += 1 if match.group() == "(" else -1
+        if depth == 0:
+            return match.end()
+    return None
+
+
+def split_top_level(text: str, num_chunks: int) -> List[int]:
+    """
+    Splits text into about num_chunks pieces without cutting through a
+    top-level form.
+
+    Returns:
+        Sorted chunk start offsets; the first is always 0.
+    """
+    starts = [0]
+    step = len(text) // max(num_chunks, 1)
+    if step == 0:
+        return starts
+
+    for target in range(step, len(text), step):
+        if target <= starts[-1]:
+            # The previous form ran past this target
+            continue
+        # The last start has depth 0, so count parentheses from there (in C,
+        # rather than character by character)
+        depth = text.count("(", starts[-1], target) - text.count(")", starts[-1], target)
+        cut = _form_end(text, target, depth)
+        if cut is None:
+            break
+        if starts[-1] < cut < len(text):
+            starts.append(cut)
+    return starts
+
+
+def _start_positions(text: str, starts: List[int]) -> List[Tuple[int, int]]:
+    # 1-based line and column of every chunk start, counting newlines once
+    positions = []
+    line, prev = 1, 0
+    for start in starts:
+        line += text.count("\n", prev, start)
+        col = start - (text.rfind("\n", 0, start) + 1) + 1
+        positions.append((line, col))
+        prev = start
+    return positions
+
+
+def _parse_chunk(chunk: str, file_name: str, first_line: int, first_col: int) -> List[ExprAST]:
+    line_index = LineIndex(chunk, first_line, first_col)
+    parser = LispParser(LispLexer(chunk), file_name, line_index)
+    return list(parser.parse_program())
+
+
+def parse_parallel(
+    text: str,
+    file_name: str = "<stdin>",
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    min_chunk_size: int = MIN_CHUNK_SIZE,
+) -> List[ExprAST]:
+    """
+    Parses every top-level form of text, splitting the work across processes.
+
+    Args:
+        text: The source to parse.
+        file_name: File name recorded in the node locations.
+        max_workers: Size of the process pool; defaults to the CPU count.
+        executor: An existing pool to reuse instead of starting a new one.
+        min_chunk_size: Smallest chunk, in characters, worth parsing in a worker.
+
+    Returns:
+        The top-level forms in source order, as LispParser.parse_program would.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    num_chunks = min(max_workers * CHUNKS_PER_WORKER, len(text) // max(min_chunk_size, 1))
+    starts = split_top_level(text, num_chunks) if max_workers > 1 else [0]
+    if len(starts) == 1:
+        # Too small to be worth the inter-process traffic
+        return _parse_chunk(text, file_name, 1, 1)
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return _parse_chunks(text, file_name, starts, pool)
+    return _parse_chunks(text, file_name, starts, executor)
+
+
+def _parse_chunks(text: str, file_name: str, starts: List[int], executor: Executor) -> List[ExprAST]:
+    ends = starts[1:] + [len(text)]
+    positions = _start_positions(text, starts)
+
+    futures = [
+        executor.submit(_parse_chunk, text[start:end], file_name, line, col)
+        for start, end, (line, col) in zip(starts, ends, positions)
+    ]
+
+    # Futures are collected in submission order, which is source order
+    forms: List[ExprAST] = []
+    for future in futures:
+        forms.extend(future.result())
+    return forms
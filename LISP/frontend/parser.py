@@ -1,29 +1,49 @@
+import sys
+from array import array
+from collections import deque
+from typing import Iterator, Optional
+
 from .lisp_ast import *
 from .lexer import LispLexer, LispTokenKind
-from .location import Location
+from .location import LineIndex
 
 class LispParser:
-    def __init__(self, lexer: LispLexer, file_name: str = "<stdin>"):
-        self.tokens = list(lexer)
-        self.index = 0
+    def __init__(self, lexer: LispLexer, file_name: str = "<stdin>", line_index: Optional[LineIndex] = None):
+        # Tokens are pulled from the lexer on demand into a small lookahead buffer
+        self.lexer = lexer
+        self.lookahead = deque()
         self.file_name = file_name
+        self.line_index = line_index if line_index is not None else LineIndex(lexer.input)
+
+    def peek(self, offset: int = 0):
+        while len(self.lookahead) <= offset:
+            tok = self.lexer.token()
+            if tok is None:
+                return None
+            self.lookahead.append(tok)
+        return self.lookahead[offset]
 
     def current_token(self):
-        if self.index < len(self.tokens):
-            return self.tokens[self.index]
-        return None
+        return self.peek()
 
     def eat(self, expected_type: str):
         tok = self.current_token()
         if tok is None:
             raise SyntaxError("Unexpected end of input")
         if tok.type != expected_type:
-            raise SyntaxError(f"Expected {expected_type}, got {tok.type}")
-        self.index += 1
+            raise self.syntax_error(tok, f"Expected {expected_type}, got {tok.type}")
+        self.lookahead.popleft()
         return tok
 
+    def parse_program(self) -> Iterator[ExprAST]:
+        # Yield each top-level form as soon as its closing parenthesis is read
+        while self.current_token() is not None:
+            yield self.parse()
+
     def parse(self) -> ExprAST:
         tok = self.current_token()
+        if tok is None:
+            raise SyntaxError("Unexpected end of input")
         if tok.type == "PARENTHESE_OPEN":
             return self.parse_expr()
         else:
@@ -53,7 +73,7 @@ class LispParser:
         self.eat("PARENTHESE_CLOSE")
         return VarDeclExprAST(
             loc=self.get_loc(set_tok),
-            name=name_tok.value,
+            name=sys.intern(name_tok.value),
             var_type=VarType([]),
             expr=expr
         )
@@ -78,36 +98,80 @@ class LispParser:
 
     def parse_any_expr(self) -> ExprAST:
         tok = self.current_token()
+        if tok is None:
+            raise SyntaxError("Unexpected end of input")
         if tok.type == "NUMBER":
             num_tok = self.eat("NUMBER")
             return NumberExprAST(loc=self.get_loc(num_tok), val=float(num_tok.value))
         elif tok.type == "IDENTIFIER":
             id_tok = self.eat("IDENTIFIER")
-            return VariableExprAST(loc=self.get_loc(id_tok), name=id_tok.value)
+            return VariableExprAST(loc=self.get_loc(id_tok), name=sys.intern(id_tok.value))
         elif tok.type == "PARENTHESE_OPEN":
             return self.parse_expr()
         elif tok.type == "SQUARE_BRACKET_OPEN":
             return self.parse_tensor_literal()
+        elif tok.type == "TENSOR_DATA":
+            # Bulk-converted by the lexer
+            data_tok = self.eat("TENSOR_DATA")
+            return TensorLiteralExprAST(
+                loc=self.get_loc(data_tok),
+                elements=data_tok.value,
+                tensor_type=TensorVarType(shape=list(data_tok.value.shape))
+            )
         else:
             raise SyntaxError(f"Unexpected token {tok.type} in expression")
         
     def parse_tensor_literal(self) -> TensorLiteralExprAST:
-        elements = []
-        self.eat("SQUARE_BRACKET_OPEN")
-
-        while self.current_token().type == "SQUARE_BRACKET_OPEN":
-            row = []
-            self.eat("SQUARE_BRACKET_OPEN")
-            while self.current_token().type == "NUMBER":
-                num_tok = self.eat("NUMBER")
-                row.append(float(num_tok.value))
-            self.eat("SQUARE_BRACKET_CLOSE")
-            elements.append(row)
+        # Imported on the first tensor literal rather than with the parser,
+        # so a program without one starts without NumPy
+        import numpy as np
+
+        open_tok = self.current_token()
+        # Elements are collected as raw doubles and become the ndarray's buffer without a copy
+        values = array("d")
+        dims = []
+        rank = self.parse_tensor_level(0, dims, values)
+
+        elements = np.frombuffer(values, dtype=np.float64).reshape(dims[:rank])
+        tensor_type = TensorVarType(shape=list(elements.shape))
+        return TensorLiteralExprAST(loc=self.get_loc(open_tok), elements=elements, tensor_type=tensor_type)
+
+    def parse_tensor_level(self, depth: int, dims: list, values: array) -> int:
+        # Parses one bracketed level and returns the rank of the innermost level
+        # below it; dims[d] holds the length every level at depth d must have
+        open_tok = self.eat("SQUARE_BRACKET_OPEN")
+        tok = self.current_token()
+        count = 0
+
+        if tok is not None and tok.type == "SQUARE_BRACKET_OPEN":
+            rank = None
+            while tok is not None and tok.type == "SQUARE_BRACKET_OPEN":
+                sub_rank = self.parse_tensor_level(depth + 1, dims, values)
+                if rank is not None and sub_rank != rank:
+                    raise self.syntax_error(tok, "ragged tensor literal: nesting depth differs between elements")
+                rank = sub_rank
+                count += 1
+                tok = self.current_token()
+        else:
+            rank = depth + 1
+            while tok is not None and tok.type == "NUMBER":
+                values.append(float(self.eat("NUMBER").value))
+                count += 1
+                tok = self.current_token()
 
         self.eat("SQUARE_BRACKET_CLOSE")
-        shape = [len(elements), len(elements[0]) if elements else 0]
-        tensor_type = TensorVarType(shape=shape)
-        return TensorLiteralExprAST(loc=self.get_loc(self.current_token()), elements=elements, tensor_type=tensor_type)
+
+        # Inner levels close first, so dims can be shorter than depth here
+        if depth >= len(dims):
+            dims.extend([None] * (depth + 1 - len(dims)))
+        if dims[depth] is None:
+            dims[depth] = count
+        elif dims[depth] != count:
+            raise self.syntax_error(
+                open_tok,
+                f"ragged tensor literal: expected {dims[depth]} elements at depth {depth + 1}, got {count}"
+            )
+        return rank
     
     def parse_tensor_op(self) -> TensorOpExprAST:
         op_tok = self.eat("TENSOR_OP")
@@ -121,6 +185,8 @@ class LispParser:
             rhs=rhs
         )
 
+    def syntax_error(self, token, message: str) -> SyntaxError:
+        return SyntaxError(f"{self.get_loc(token)}: {message}")
+
     def get_loc(self, token):
-        # Simplified: might want to integrate actual location tracking
-        return Location(file=self.file_name, line=1, col=1)
+        return self.line_index.location(self.file_name, token.lexpos)
@@ -0,0 +1,85 @@
+"""
+resolver.py: resolve variable names to frame slots
+
+A program's variables all live in one flat scope: (set ...) only appears
+in top-level forms or nested in their expressions, and a name set twice is
+the same variable. The Resolver interns every name, gives it a dense slot
+index the first time it is seen, and stores that index in the slot field
+of every VariableExprAST and VarDeclExprAST, so an execution engine can
+keep the variables in a list indexed by slot instead of a dict keyed by
+name.
+
+Forms are resolved in evaluation order, so a read of a name that no
+earlier (set ...) binds is a read of a program input. With the inputs
+given up front, any other such read is an undefined variable, reported at
+its Location; without them, every such name becomes an input, listed in
+Resolver.inputs with its first reference for the engine to check when it
+binds the inputs.
+"""
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from .lisp_ast import *
+from .location import Location
+
+
+class Resolver:
+    def __init__(self, inputs: Optional[Iterable[str]] = None):
+        """
+        Args:
+            inputs: Names of the program inputs; a read of any other name
+                before it is set is an error. By default every such name
+                is an input.
+        """
+        # Name of every slot, and the slot of every name
+        self.names: List[str] = []
+        self.slots: Dict[str, int] = {}
+        # Inputs the program reads, each with its first reference
+        self.inputs: Dict[str, Location] = {}
+        self.declared = None if inputs is None else frozenset(inputs)
+        # Slots that hold a value at the current point of evaluation
+        self._bound = set()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def slot(self, name: str) -> int:
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[sys.intern(name)] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def resolve_program(self, program: Iterable[ExprAST]) -> List[ExprAST]:
+        """
+        Resolves the top-level forms up to the first top-level return,
+        after which nothing runs, and returns them.
+        """
+        forms = []
+        for form in program:
+            self.resolve(form)
+            forms.append(form)
+            if isinstance(form, ReturnExprAST):
+                break
+        return forms
+
+    def resolve(self, expr: ExprAST) -> None:
+        kind = expr.kind
+        if kind is ExprASTKind.Var:
+            expr.slot = self.slot(expr.name)
+            if expr.slot not in self._bound:
+                if self.declared is not None and expr.name not in self.declared:
+                    raise NameError(f"{expr.loc}: undefined variable '{expr.name}'")
+                self.inputs[self.names[expr.slot]] = expr.loc
+                # Reads after this one find the input bound
+                self._bound.add(expr.slot)
+        elif kind is ExprASTKind.VarDecl:
+            # The value is evaluated before the name is bound
+            self.resolve(expr.expr)
+            expr.slot = self.slot(expr.name)
+            self._bound.add(expr.slot)
+        elif kind is ExprASTKind.Return:
+            self.resolve(expr.expr)
+        elif kind is ExprASTKind.BinOp or kind is ExprASTKind.TensorOp:
+            self.resolve(expr.lhs)
+            self.resolve(expr.rhs)
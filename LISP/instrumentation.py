@@ -0,0 +1,313 @@
+"""
+instrumentation.py: opt-in timing and memory accounting of the pipeline stages
+
+While an Instrumentation is enabled, the entry points of every stage, from
+LispLexer.token through the passes to the emulator, are replaced on their
+classes by wrappers that time them; disabling puts the original functions
+back, so instrumentation costs nothing at all when it is off. For every
+stage it records:
+
+- calls and wall time, inclusive and exclusive of the stages it calls, so
+  the lexing done on demand by the parser is not counted as parsing
+- the items the stage produced: tokens, AST nodes, ops or instructions
+- with memory=True, the tracemalloc peak of a call above what was live
+  when it started
+
+Fine-grained stages, called once per token or location, only count and
+time; the others also become complete events of a trace in the Trace Event
+Format, which chrome://tracing and Perfetto open. span() times any other
+code as a stage of its own.
+
+    with Instrumentation(memory=True) as instrumentation:
+        compile_source(text)
+    print(instrumentation.report())
+    instrumentation.write_trace("compile.json")
+"""
+import functools
+import importlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from .frontend.lisp_ast import ExprAST
+
+
+def count_nodes(expr: ExprAST) -> int:
+    """
+    Returns the number of AST nodes of expr, itself included.
+    """
+    count = 1
+    for field in ("expr", "lhs", "rhs"):
+        child = getattr(expr, field, None)
+        if isinstance(child, ExprAST):
+            count += count_nodes(child)
+    return count
+
+
+def _count_ops(module) -> int:
+    return sum(1 for _ in module.walk())
+
+
+class Hook(NamedTuple):
+    stage: str
+    module: str
+    # "Class.method", or a function of the module
+    attribute: str
+    # Items produced by a call, from its result and arguments
+    items: Optional[Callable[[Any, tuple], int]] = None
+    # Called too often to trace: only counted and timed
+    fine: bool = False
+
+
+HOOKS = (
+    Hook("lex", "LISP.frontend.lexer", "LispLexer.token", lambda token, args: token is not None, fine=True),
+    Hook("parse", "LISP.frontend.parser", "LispParser.parse", lambda form, args: count_nodes(form)),
+    Hook("location", "LISP.frontend.location", "LineIndex.location", lambda location, args: 1, fine=True),
+    Hook("location.index", "LISP.frontend.location", "LineIndex.__init__", lambda _, args: len(args[0].line_starts)),
+    Hook("ast_table", "LISP.frontend.ast_table", "ASTTable.from_forms", lambda table, args: len(table)),
+    Hook("ir_gen", "LISP.frontend.ir_gen", "IRGen.ir_gen_module", lambda module, args: _count_ops(module)),
+    Hook("optimize", "LISP.passes.optimization", "LispOptimizationPass.apply", lambda _, args: _count_ops(args[2])),
+    Hook("fuse", "LISP.passes.fusion", "LispFusionPass.apply", lambda _, args: _count_ops(args[2])),
+    Hook("lower", "LISP.passes.lowering", "LispToStandard.lower_module", lambda ops, args: len(ops)),
+    Hook("print", "LISP.compiler", "_print"),
+    Hook("interpret", "LISP.interpreter", "LispInterpreter.run"),
+    Hook("codegen", "LISP.emulator.codegen", "RISCVCodegen.generate", lambda machine, args: len(machine.program.text) // 4),
+    Hook("emulate", "LISP.emulator.emulator", "Emulator.run", lambda retired, args: retired),
+)
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    # Wall time of all calls, and the part of it not spent in other stages
+    seconds: float = 0.0
+    self_seconds: float = 0.0
+    items: int = 0
+    # Largest tracemalloc peak of one call, in bytes above its start
+    peak_bytes: int = 0
+
+
+class _Frame:
+    __slots__ = ("stage", "start", "child_seconds", "memory_start", "memory_peak")
+
+    def __init__(self, stage: str, start: float):
+        self.stage = stage
+        self.start = start
+        self.child_seconds = 0.0
+        self.memory_start = self.memory_peak = 0
+
+
+# The enabled Instrumentation, if any
+_active: Optional["Instrumentation"] = None
+
+
+def active() -> Optional["Instrumentation"]:
+    return _active
+
+
+def span(stage: str):
+    """
+    Returns a context manager that times its body as a stage of the
+    enabled Instrumentation, or does nothing when none is.
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.span(stage)
+
+
+class Instrumentation:
+    def __init__(self, memory: bool = False, stages: Optional[Sequence[str]] = None, max_events: int = 1_000_000):
+        """
+        Args:
+            memory: Record tracemalloc peaks, which slows every allocation
+                down while enabled.
+            stages: Names of the HOOKS to install; all of them by default.
+            max_events: Most trace events kept; later ones are dropped.
+        """
+        self.memory = memory
+        self.hooks = [hook for hook in HOOKS if stages is None or hook.stage in stages]
+        self.max_events = max_events
+
+        self.stats: Dict[str, StageStats] = {}
+        self.events: List[dict] = []
+        self.dropped_events = 0
+
+        self._originals: List[tuple] = []
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    # Enabling
+
+    def enable(self) -> None:
+        global _active
+        if _active is not None:
+            raise RuntimeError("another Instrumentation is already enabled")
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        for hook in self.hooks:
+            owner, name = self._resolve(hook)
+            # The class's own attribute, not an inherited one, is put back
+            original = owner.__dict__[name]
+            self._originals.append((owner, name, original))
+            setattr(owner, name, self._wrap(original, hook))
+        _active = self
+
+    def disable(self) -> None:
+        global _active
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals.clear()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if _active is self:
+            _active = None
+
+    def __enter__(self) -> "Instrumentation":
+        self.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.disable()
+
+    @staticmethod
+    def _resolve(hook: Hook):
+        owner = importlib.import_module(hook.module)
+        *path, name = hook.attribute.split(".")
+        for part in path:
+            owner = getattr(owner, part)
+        return owner, name
+
+    def _wrap(self, function: Callable, hook: Hook) -> Callable:
+        if isinstance(function, (classmethod, staticmethod)):
+            return type(function)(self._wrap(function.__func__, hook))
+        stage, items, fine = hook.stage, hook.items, hook.fine
+        enter, exit = self._enter, self._exit
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            frame = enter(stage, fine)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                exit(frame, time.perf_counter(), fine, 0)
+                raise
+            # Counting the items is not part of the stage
+            end = time.perf_counter()
+            exit(frame, end, fine, items(result, args) if items is not None else 0)
+            return result
+        return wrapper
+
+    # Accounting
+
+    def _stack(self) -> List[_Frame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, stage: str, fine: bool) -> _Frame:
+        stack = self._stack()
+        frame = _Frame(stage, time.perf_counter())
+        if self.memory and not fine:
+            current, peak = tracemalloc.get_traced_memory()
+            # The caller's peak so far survives the reset in its frame
+            if stack:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+            tracemalloc.reset_peak()
+            frame.memory_start = frame.memory_peak = current
+        stack.append(frame)
+        return frame
+
+    def _exit(self, frame: _Frame, end: float, fine: bool, items: int) -> None:
+        stack = self._stack()
+        stack.pop()
+        elapsed = end - frame.start
+
+        stats = self.stats.get(frame.stage)
+        if stats is None:
+            stats = self.stats[frame.stage] = StageStats()
+        stats.calls += 1
+        stats.seconds += elapsed
+        stats.self_seconds += elapsed - frame.child_seconds
+        stats.items += items
+        if stack:
+            stack[-1].child_seconds += elapsed
+        if fine:
+            return
+
+        args = {"items": items}
+        if self.memory:
+            peak = max(frame.memory_peak, tracemalloc.get_traced_memory()[1])
+            stats.peak_bytes = max(stats.peak_bytes, peak - frame.memory_start)
+            args["peak_bytes"] = peak - frame.memory_start
+            if stack:
+                stack[-1].memory_peak = max(stack[-1].memory_peak, peak)
+
+        if len(self.events) >= self.max_events:
+            self.dropped_events += 1
+            return
+        self.events.append({
+            "name": frame.stage,
+            "cat": frame.stage.split(".")[0],
+            "ph": "X",
+            "ts": (frame.start - self._origin) * 1e6,
+            "dur": elapsed * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        frame = self._enter(stage, False)
+        try:
+            yield
+        finally:
+            self._exit(frame, time.perf_counter(), False, 0)
+
+    def reset(self) -> None:
+        self.stats.clear()
+        self.events.clear()
+        self.dropped_events = 0
+        self._origin = time.perf_counter()
+
+    # Results
+
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {stage: asdict(stats) for stage, stats in self.stats.items()}
+
+    def trace(self) -> Dict[str, Any]:
+        """
+        Returns the trace in the Trace Event Format, with the totals of
+        every stage, fine-grained ones included, as its metadata.
+        """
+        return {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"stages": self.to_dict(), "dropped_events": self.dropped_events},
+        }
+
+    def write_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.trace(), file)
+
+    def report(self) -> str:
+        """
+        Returns the stages as a table, most exclusive time first.
+        """
+        lines = [f"{'stage':16s} {'calls':>9s} {'total ms':>10s} {'self ms':>10s} {'items':>10s} {'peak KB':>9s}"]
+        for stage, stats in sorted(self.stats.items(), key=lambda item: item[1].self_seconds, reverse=True):
+            peak = f"{stats.peak_bytes / 1024:9.1f}" if self.memory and stats.peak_bytes else f"{'':9s}"
+            lines.append(
+                f"{stage:16s} {stats.calls:9d} {stats.seconds * 1e3:10.2f} {stats.self_seconds * 1e3:10.2f} "
+                f"{stats.items:10d} {peak}"
+            )
+        return "\n".join(lines)
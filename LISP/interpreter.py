@@ -0,0 +1,422 @@
+"""
+interpreter.py: execution engines for lisp_ast programs
+
+LispInterpreter walks the tree on every run. compile_program turns the tree
+into nested Python closures once, for programs that are run many times;
+the Resolver gives every variable a slot first, so the closures keep the
+variables in a flat list frame instead of a dict.
+BatchInterpreter runs a program once over a whole batch of input records.
+
+Scalars are Python floats and tensors are NumPy arrays. Every operator is a
+single NumPy (or operator module) call, so tensor arithmetic never loops in
+Python and scalars broadcast against tensors.
+"""
+import operator
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .frontend.lexer import LispLexer
+from .frontend.lisp_ast import *
+from .frontend.location import Location
+from .frontend.parser import LispParser
+from .frontend.resolver import Resolver
+
+
+def _matmul(lhs, rhs):
+    # A scalar operand scales the other side, like the elementwise ops
+    if np.ndim(lhs) == 0 or np.ndim(rhs) == 0:
+        return np.multiply(lhs, rhs)
+    return np.matmul(lhs, rhs)
+
+
+# Operators of BinaryExprAST; these also work elementwise on ndarrays
+BINARY_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+# Operations of TensorOpExprAST
+TENSOR_OPS = {
+    "add": np.add,
+    "multiply": np.multiply,
+    "subtract": np.subtract,
+    "matmul": _matmul,
+}
+
+
+class _Return(Exception):
+    # Unwinds a (return ...) nested inside another form
+    def __init__(self, value):
+        self.value = value
+
+
+class LispInterpreter:
+    def __init__(self, bindings: Optional[Dict[str, Any]] = None):
+        # Variables visible to the program: inputs first, then every (set ...)
+        self.env: Dict[str, Any] = dict(bindings) if bindings else {}
+        self._dispatch = {
+            ExprASTKind.VarDecl: self.eval_var_decl,
+            ExprASTKind.Return: self.eval_return,
+            ExprASTKind.Num: self.eval_number,
+            ExprASTKind.Var: self.eval_variable,
+            ExprASTKind.BinOp: self.eval_binary,
+            ExprASTKind.TensorLiteral: self.eval_tensor_literal,
+            ExprASTKind.TensorOp: self.eval_tensor_op,
+        }
+
+    def run(self, program: Iterable[ExprAST]) -> Any:
+        """
+        Evaluates the top-level forms in order.
+
+        Returns:
+            The value of the first (return ...), or of the last form if
+            the program never returns.
+        """
+        result = None
+        try:
+            for form in program:
+                if isinstance(form, ReturnExprAST):
+                    return self.evaluate(form.expr)
+                result = self.evaluate(form)
+        except _Return as ret:
+            return ret.value
+        return result
+
+    def evaluate(self, expr: ExprAST) -> Any:
+        return self._dispatch[expr.kind](expr)
+
+    def eval_var_decl(self, expr: VarDeclExprAST):
+        value = self.evaluate(expr.expr)
+        self.env[expr.name] = value
+        return value
+
+    def eval_return(self, expr: ReturnExprAST):
+        raise _Return(self.evaluate(expr.expr))
+
+    def eval_number(self, expr: NumberExprAST):
+        return expr.val
+
+    def eval_variable(self, expr: VariableExprAST):
+        try:
+            return self.env[expr.name]
+        except KeyError:
+            raise NameError(f"{expr.loc}: undefined variable '{expr.name}'") from None
+
+    def eval_binary(self, expr: BinaryExprAST):
+        op = BINARY_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"{expr.loc}: unknown operator '{expr.op}'")
+        return op(self.evaluate(expr.lhs), self.evaluate(expr.rhs))
+
+    def eval_tensor_literal(self, expr: TensorLiteralExprAST):
+        return expr.elements
+
+    def eval_tensor_op(self, expr: TensorOpExprAST):
+        op = TENSOR_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"{expr.loc}: unknown tensor operation '{expr.op}'")
+        lhs = self.evaluate(expr.lhs)
+        rhs = self.evaluate(expr.rhs)
+        try:
+            return op(lhs, rhs)
+        except ValueError as err:
+            # Shape mismatches from NumPy, pinned to the operation
+            raise ValueError(f"{expr.loc}: {expr.op}: {err}") from None
+
+
+def _per_record_rank(value, batched: bool) -> int:
+    return np.ndim(value) - 1 if batched else np.ndim(value)
+
+
+def _align(value, batched: bool, rank: int):
+    # Pads a batched value with unit axes after the batch axis so it has
+    # rank per-record axes; unbatched values already broadcast from the right
+    if not batched:
+        return value
+    missing = rank - (value.ndim - 1)
+    if missing <= 0:
+        return value
+    return value.reshape(value.shape[:1] + (1,) * missing + value.shape[1:])
+
+
+class BatchInterpreter(LispInterpreter):
+    """
+    Evaluates a program once over a batch of input records instead of once
+    per record.
+
+    Every input column is an array whose first axis is the batch; values
+    that do not depend on an input (literals, constants) stay unbatched and
+    broadcast. Each value is held as a (value, batched) pair.
+    """
+
+    def __init__(self, columns: Dict[str, Any], constants: Optional[Dict[str, Any]] = None):
+        env = {name: (value, False) for name, value in (constants or {}).items()}
+        sizes = set()
+        for name, column in columns.items():
+            column = np.asarray(column, dtype=np.float64)
+            if column.ndim == 0:
+                raise ValueError(f"input column '{name}' has no batch axis")
+            sizes.add(column.shape[0])
+            env[name] = (column, True)
+        if len(sizes) > 1:
+            raise ValueError(f"input columns have different batch sizes: {sorted(sizes)}")
+        self.batch_size = sizes.pop() if sizes else 1
+        super().__init__(env)
+
+    def run(self, program: Iterable[ExprAST]) -> Any:
+        """
+        Returns:
+            The result for every record, stacked along a leading batch axis.
+            Results that do not depend on the inputs are broadcast views.
+        """
+        result = super().run(program)
+        if result is None:
+            return None
+        value, batched = result
+        if batched:
+            return value
+        value = np.asarray(value)
+        return np.broadcast_to(value, (self.batch_size,) + value.shape)
+
+    def eval_number(self, expr: NumberExprAST):
+        return expr.val, False
+
+    def eval_tensor_literal(self, expr: TensorLiteralExprAST):
+        return expr.elements, False
+
+    def eval_binary(self, expr: BinaryExprAST):
+        op = BINARY_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"{expr.loc}: unknown operator '{expr.op}'")
+        return self.elementwise(op, self.evaluate(expr.lhs), self.evaluate(expr.rhs))
+
+    def eval_tensor_op(self, expr: TensorOpExprAST):
+        op = TENSOR_OPS.get(expr.op)
+        if op is None:
+            raise ValueError(f"{expr.loc}: unknown tensor operation '{expr.op}'")
+        lhs = self.evaluate(expr.lhs)
+        rhs = self.evaluate(expr.rhs)
+        try:
+            if op is _matmul:
+                return self.matmul(lhs, rhs)
+            return self.elementwise(op, lhs, rhs)
+        except ValueError as err:
+            raise ValueError(f"{expr.loc}: {expr.op}: {err}") from None
+
+    def elementwise(self, op, lhs, rhs):
+        (lhs, lhs_batched), (rhs, rhs_batched) = lhs, rhs
+        rank = max(_per_record_rank(lhs, lhs_batched), _per_record_rank(rhs, rhs_batched))
+        return op(_align(lhs, lhs_batched, rank), _align(rhs, rhs_batched, rank)), lhs_batched or rhs_batched
+
+    def matmul(self, lhs, rhs):
+        (lhs, lhs_batched), (rhs, rhs_batched) = lhs, rhs
+        lhs_rank = _per_record_rank(lhs, lhs_batched)
+        rhs_rank = _per_record_rank(rhs, rhs_batched)
+        if lhs_rank == 0 or rhs_rank == 0:
+            return self.elementwise(np.multiply, (lhs, lhs_batched), (rhs, rhs_batched))
+
+        # Promote vectors to matrices ourselves, since np.matmul would take
+        # a batched vector for a matrix, then drop the added axes again
+        if lhs_rank == 1:
+            lhs = np.expand_dims(lhs, -2)
+        if rhs_rank == 1:
+            rhs = np.expand_dims(rhs, -1)
+        rank = max(lhs_rank, rhs_rank, 2)
+        result = np.matmul(_align(lhs, lhs_batched, rank), _align(rhs, rhs_batched, rank))
+        if rhs_rank == 1:
+            result = result[..., 0]
+        if lhs_rank == 1:
+            result = result[..., 0, :] if rhs_rank != 1 else result[..., 0]
+        return result, lhs_batched or rhs_batched
+
+
+def evaluate_batch(
+    program: Iterable[ExprAST],
+    columns: Dict[str, Any],
+    constants: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """
+    Runs program over every record of columns at once.
+
+    Args:
+        program: The parsed top-level forms.
+        columns: Input variables, each an array with the batch on axis 0.
+        constants: Input variables shared by every record.
+
+    Returns:
+        The program's result for every record, with the batch on axis 0.
+    """
+    return BatchInterpreter(columns, constants).run(program)
+
+
+# A compiled expression: takes the frame, the value of every variable
+# indexed by its slot, and returns the value
+Closure = Callable[[List[Any]], Any]
+
+
+def _compile_number(expr: NumberExprAST) -> Closure:
+    val = expr.val
+    return lambda frame: val
+
+
+def _slot(expr: Union[VariableExprAST, VarDeclExprAST]) -> int:
+    if expr.slot < 0:
+        raise ValueError(f"{expr.loc}: variable '{expr.name}' was not resolved, see compile_program")
+    return expr.slot
+
+
+def _compile_variable(expr: VariableExprAST) -> Closure:
+    # Every read is bound when it runs: the Resolver ordered the reads and
+    # sets, and CompiledProgram checks the inputs
+    return operator.itemgetter(_slot(expr))
+
+
+def _compile_binary(expr: BinaryExprAST) -> Closure:
+    op = BINARY_OPS.get(expr.op)
+    if op is None:
+        raise ValueError(f"{expr.loc}: unknown operator '{expr.op}'")
+
+    # Constant right operands, as in (+ x 1), are captured directly, and
+    # so is the slot of a variable left operand
+    if isinstance(expr.lhs, VariableExprAST):
+        slot = _slot(expr.lhs)
+        if isinstance(expr.rhs, NumberExprAST):
+            val = expr.rhs.val
+            return lambda frame: op(frame[slot], val)
+        rhs = compile_expr(expr.rhs)
+        return lambda frame: op(frame[slot], rhs(frame))
+    lhs = compile_expr(expr.lhs)
+    if isinstance(expr.rhs, NumberExprAST):
+        val = expr.rhs.val
+        return lambda frame: op(lhs(frame), val)
+    rhs = compile_expr(expr.rhs)
+    return lambda frame: op(lhs(frame), rhs(frame))
+
+
+def _compile_tensor_literal(expr: TensorLiteralExprAST) -> Closure:
+    elements = expr.elements
+    return lambda frame: elements
+
+
+def _compile_tensor_op(expr: TensorOpExprAST) -> Closure:
+    op = TENSOR_OPS.get(expr.op)
+    if op is None:
+        raise ValueError(f"{expr.loc}: unknown tensor operation '{expr.op}'")
+    lhs = compile_expr(expr.lhs)
+    rhs = compile_expr(expr.rhs)
+    name, loc = expr.op, expr.loc
+
+    def tensor_op(frame):
+        try:
+            return op(lhs(frame), rhs(frame))
+        except ValueError as err:
+            raise ValueError(f"{loc}: {name}: {err}") from None
+    return tensor_op
+
+
+def _compile_var_decl(expr: VarDeclExprAST) -> Closure:
+    slot = _slot(expr)
+    value = compile_expr(expr.expr)
+
+    def store(frame):
+        result = frame[slot] = value(frame)
+        return result
+    return store
+
+
+def _compile_return(expr: ReturnExprAST) -> Closure:
+    value = compile_expr(expr.expr)
+
+    def ret(frame):
+        raise _Return(value(frame))
+    return ret
+
+
+_COMPILERS = {
+    ExprASTKind.VarDecl: _compile_var_decl,
+    ExprASTKind.Return: _compile_return,
+    ExprASTKind.Num: _compile_number,
+    ExprASTKind.Var: _compile_variable,
+    ExprASTKind.BinOp: _compile_binary,
+    ExprASTKind.TensorLiteral: _compile_tensor_literal,
+    ExprASTKind.TensorOp: _compile_tensor_op,
+}
+
+
+def compile_expr(expr: ExprAST) -> Closure:
+    # Dispatch on the node kind happens here, once, instead of on every run
+    return _COMPILERS[expr.kind](expr)
+
+
+class CompiledProgram:
+    """
+    A program compiled to closures; call it with the input bindings to run it.
+    """
+
+    def __init__(
+        self,
+        forms: List[Closure],
+        result: Optional[Closure],
+        frame_size: int = 0,
+        inputs: Sequence[Tuple[str, int, Location]] = (),
+    ):
+        self.forms = forms
+        self.result = result
+        self.frame_size = frame_size
+        # (name, slot, first reference) of every input the program reads
+        self.inputs = list(inputs)
+
+    def __call__(self, bindings: Optional[Dict[str, Any]] = None) -> Any:
+        frame = [None] * self.frame_size
+        if self.inputs:
+            bindings = bindings or {}
+            for name, slot, loc in self.inputs:
+                try:
+                    frame[slot] = bindings[name]
+                except KeyError:
+                    raise NameError(f"{loc}: undefined variable '{name}'") from None
+        value = None
+        try:
+            for form in self.forms:
+                value = form(frame)
+            if self.result is not None:
+                return self.result(frame)
+        except _Return as ret:
+            return ret.value
+        return value
+
+
+def compile_program(program: Iterable[ExprAST], inputs: Optional[Iterable[str]] = None) -> CompiledProgram:
+    """
+    Compiles the top-level forms into a reusable CompiledProgram with the
+    same semantics as LispInterpreter.run.
+
+    Args:
+        program: The parsed top-level forms; the Resolver sets the slots of
+            their variables.
+        inputs: Names of the inputs, to report reads of any other undefined
+            variable here rather than when the program runs.
+
+    Raises:
+        NameError: If a variable is neither an input nor set before it is
+            read, with inputs given.
+    """
+    resolver = Resolver(inputs)
+    forms = []
+    result = None
+    for form in resolver.resolve_program(program):
+        if isinstance(form, ReturnExprAST):
+            # Nothing after the first top-level return can run
+            result = compile_expr(form.expr)
+        else:
+            forms.append(compile_expr(form))
+    program_inputs = [(name, resolver.slots[name], loc) for name, loc in resolver.inputs.items()]
+    return CompiledProgram(forms, result, len(resolver), program_inputs)
+
+
+def run_source(text: str, bindings: Optional[Dict[str, Any]] = None, file_name: str = "<stdin>") -> Any:
+    parser = LispParser(LispLexer(text), file_name)
+    return LispInterpreter(bindings).run(parser.parse_program())
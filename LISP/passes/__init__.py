@@ -0,0 +1,4 @@
+# Matmul tile sizes (tm, tn, tk) of the lowering; here rather than in
+# lowering.py so that CompileOptions can default to them without importing
+# xDSL
+DEFAULT_TILE_SIZES = (32, 32, 32)
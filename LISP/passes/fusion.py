@@ -0,0 +1,290 @@
+"""
+fusion.py: fuse chains of elementwise tensor ops
+
+(add (multiply A B) C) computes A * B into a temporary the size of the
+result and then reads it back. LispFusionPass merges such chains, and a
+matmul followed by elementwise ops, into one lisp.fused_elementwise or
+lisp.fused_matmul op, and FusedKernel evaluates those ops block by block
+so the intermediates stay small enough to live in cache.
+
+Only values with a single use are fused, so nothing is computed twice.
+Run it after LispOptimizationPass, whose CSE exposes the shared values.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from xdsl.context import Context
+from xdsl.dialects.builtin import ModuleOp, TensorType
+from xdsl.ir import Operation, SSAValue
+from xdsl.passes import ModulePass
+from xdsl.pattern_rewriter import (
+    PatternRewriter,
+    PatternRewriteWalker,
+    RewritePattern,
+    op_type_rewrite_pattern,
+)
+
+from ..dialects import lisp
+
+# Kernel name of each fusable op
+_KERNEL_NAMES = {op_class: name for name, op_class in lisp.KERNEL_OPS.items()}
+
+# NumPy implementation of each kernel op
+KERNEL_UFUNCS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "div": np.true_divide,
+}
+
+# Longest kernel, in tokens, the pass builds. Without a limit an
+# accumulation like (set acc (add acc ...)) repeated n times would fuse
+# into one kernel of size O(n), built in O(n^2)
+MAX_KERNEL_SIZE = 64
+
+# Elements per block of FusedKernel: 64 KiB of f64, which fits in L2
+BLOCK_ELEMENTS = 8192
+
+
+def _is_tensor(value: SSAValue) -> bool:
+    return isinstance(value.type, TensorType)
+
+
+def _single_use_producer(value: SSAValue) -> Tuple[Optional[Operation], List[Operation]]:
+    """
+    Returns the op computing value, looking through (set ...) ops, if value
+    is used only once along the way, together with the sets in between.
+    """
+    sets = []
+    while value.has_one_use() and isinstance(value.owner, lisp.SetOp):
+        sets.append(value.owner)
+        value = value.owner.value
+    if not value.has_one_use() or not isinstance(value.owner, Operation):
+        return None, []
+    return value.owner, sets
+
+
+class _KernelBuilder:
+    """
+    Builds the postfix kernel of one fused op, absorbing the single-use
+    producers of its operands.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.inputs: List[SSAValue] = []
+        self._input_index: Dict[SSAValue, int] = {}
+        self.tokens: List[str] = []
+        # Fused ops, each listed after its users
+        self.absorbed: List[Operation] = []
+        self.matmul: Optional[Operation] = None
+
+    def push_input(self, value: SSAValue) -> None:
+        index = self._input_index.get(value)
+        if index is None:
+            index = self._input_index[value] = len(self.inputs)
+            self.inputs.append(value)
+        # "$0" is reserved for the product once a matmul has been absorbed,
+        # so input references are renumbered by finish()
+        self.tokens.append(("input", index))
+
+    def expand(self, value: SSAValue, reserve: int) -> None:
+        # reserve is the number of tokens the kernel needs after this value
+        producer, sets = _single_use_producer(value)
+
+        if producer is None or not self._fits(producer, reserve):
+            self.push_input(value)
+        elif type(producer) in _KERNEL_NAMES and _is_tensor(producer.result):
+            self.absorbed += sets + [producer]
+            self.expand(producer.lhs, reserve + 2)
+            self.expand(producer.rhs, reserve + 1)
+            self.tokens.append(_KERNEL_NAMES[type(producer)])
+        elif isinstance(producer, lisp.FusedElementwiseOp):
+            self.absorbed += sets + [producer]
+            self._inline(producer, list(producer.inputs))
+        elif self.matmul is None and self._is_fusable_matmul(producer):
+            self.absorbed += sets + [producer]
+            self.matmul = producer
+            if isinstance(producer, lisp.FusedMatmulOp):
+                self._inline(producer, [None] + list(producer.inputs))
+            else:
+                self.tokens.append(("product",))
+        else:
+            self.push_input(value)
+
+    def _inline(self, op: lisp.FusedOperation, args: Sequence[Optional[SSAValue]]) -> None:
+        # The inputs of an already fused op are leaves: anything fusable
+        # into them was fused when that op was built
+        for token in op.kernel_tokens():
+            if token.startswith("$"):
+                arg = args[int(token[1:])]
+                if arg is None:
+                    self.tokens.append(("product",))
+                else:
+                    self.push_input(arg)
+            else:
+                self.tokens.append(token)
+
+    def _fits(self, producer: Operation, reserve: int) -> bool:
+        # An elementwise op adds at least its two operands and itself
+        size = len(producer.kernel.data) if isinstance(producer, lisp.FusedOperation) else 3
+        return len(self.tokens) + size + reserve <= self.max_size
+
+    @staticmethod
+    def _is_fusable_matmul(op: Optional[Operation]) -> bool:
+        if isinstance(op, lisp.FusedMatmulOp):
+            return True
+        # A matmul with a scalar operand is an elementwise multiply
+        return isinstance(op, lisp.MatmulOp) and _is_tensor(op.lhs) and _is_tensor(op.rhs)
+
+    def finish(self, result_type) -> Operation:
+        offset = 0 if self.matmul is None else 1
+        kernel = []
+        for token in self.tokens:
+            if isinstance(token, str):
+                kernel.append(token)
+            elif token[0] == "product":
+                kernel.append("$0")
+            else:
+                kernel.append(f"${token[1] + offset}")
+
+        if self.matmul is None:
+            return lisp.FusedElementwiseOp(self.inputs, kernel, result_type)
+        return lisp.FusedMatmulOp(self.matmul.lhs, self.matmul.rhs, self.inputs, kernel, result_type)
+
+
+class FuseElementwiseOps(RewritePattern):
+    """
+    Replaces an elementwise tensor op and its single-use elementwise (or
+    matmul) producers by one fused op.
+    """
+
+    def __init__(self, max_kernel_size: int = MAX_KERNEL_SIZE):
+        self.max_kernel_size = max_kernel_size
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: lisp.BinaryOperation, rewriter: PatternRewriter):
+        name = _KERNEL_NAMES.get(type(op))
+        if name is None or not _is_tensor(op.result):
+            return
+
+        builder = _KernelBuilder(self.max_kernel_size)
+        builder.expand(op.lhs, 2)
+        builder.expand(op.rhs, 1)
+        if not builder.absorbed:
+            return
+        builder.tokens.append(name)
+
+        fused = builder.finish(op.result.type)
+        lisp.set_location(fused, lisp.get_location(op))
+        rewriter.replace(op, fused)
+        for absorbed in builder.absorbed:
+            rewriter.erase(absorbed)
+
+
+@dataclass(frozen=True)
+class LispFusionPass(ModulePass):
+    """
+    Fuses elementwise tensor ops into lisp.fused_elementwise and
+    lisp.fused_matmul.
+    """
+
+    name = "lisp-fuse"
+
+    # Longest kernel, in tokens, of a fused op
+    max_kernel_size: int = MAX_KERNEL_SIZE
+
+    def apply(self, ctx: Context, op: ModuleOp) -> None:
+        # Walking forward, a chain is fused into its first op and grows one
+        # op at a time, so every op is visited once
+        PatternRewriteWalker(
+            FuseElementwiseOps(self.max_kernel_size),
+            apply_recursively=False
+        ).rewrite_module(op)
+
+
+def fuse(module: ModuleOp, max_kernel_size: int = MAX_KERNEL_SIZE) -> ModuleOp:
+    """
+    Runs LispFusionPass on module in place and returns it.
+    """
+    LispFusionPass(max_kernel_size).apply(Context(), module)
+    return module
+
+
+def _block(arg, ndim: int, start: int, stop: int):
+    # The rows start:stop of arg as broadcast against the result; an
+    # argument with fewer dimensions or a single row broadcasts whole
+    shape = np.shape(arg)
+    if len(shape) < ndim or shape[0] == 1:
+        return arg
+    return arg[start:stop]
+
+
+class FusedKernel:
+    """
+    NumPy evaluation of a fused kernel. The result is computed a block of
+    rows at a time, so each intermediate is a block-sized temporary reused
+    across the ops of the kernel instead of a full-size tensor.
+    """
+
+    def __init__(self, kernel: Sequence[str]):
+        # Decode the tokens once: argument indices, or ufuncs
+        self.program = [
+            int(token[1:]) if token.startswith("$") else KERNEL_UFUNCS[token]
+            for token in kernel
+        ]
+
+    @classmethod
+    def for_op(cls, op: lisp.FusedOperation) -> "FusedKernel":
+        return cls(op.kernel_tokens())
+
+    def __call__(self, *args, out: Optional[np.ndarray] = None) -> np.ndarray:
+        shape = np.broadcast_shapes(*(np.shape(arg) for arg in args))
+        if out is None:
+            out = np.empty(shape)
+        if not shape:
+            self._evaluate(args, out)
+            return out
+
+        row_size = int(np.prod(shape[1:]))
+        rows = max(1, BLOCK_ELEMENTS // max(row_size, 1))
+        for start in range(0, shape[0], rows):
+            stop = min(start + rows, shape[0])
+            blocks = [_block(arg, len(shape), start, stop) for arg in args]
+            self._evaluate(blocks, out[start:stop])
+        return out
+
+    def matmul(self, lhs: np.ndarray, rhs: np.ndarray, *inputs, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Evaluates a lisp.fused_matmul kernel. The product is the only
+        full-size temporary, and the epilogue overwrites it when the shapes
+        allow.
+        """
+        product = np.matmul(lhs, rhs)
+        if out is None:
+            shape = np.broadcast_shapes(product.shape, *(np.shape(arg) for arg in inputs))
+            if shape == product.shape:
+                out = product
+        return self(product, *inputs, out=out)
+
+    def _evaluate(self, args, out: np.ndarray) -> None:
+        # Entries are (value, owned): owned values are temporaries of this
+        # evaluation that later steps may overwrite
+        stack = []
+        last = len(self.program) - 1
+        for position, step in enumerate(self.program):
+            if isinstance(step, int):
+                stack.append((args[step], False))
+                continue
+            rhs, rhs_owned = stack.pop()
+            lhs, lhs_owned = stack.pop()
+            if position == last:
+                target = out
+            elif lhs_owned and lhs.shape == out.shape:
+                target = lhs
+            elif rhs_owned and rhs.shape == out.shape:
+                target = rhs
+            else:
+                target = None
+            stack.append((step(lhs, rhs, out=target), True))
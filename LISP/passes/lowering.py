@@ -1 +1,463 @@
-# lowering.py: Convert lisp.* ops into standard xDSL dialects (arith, func, cf)
\ No newline at end of file
+"""
+lowering.py: Convert lisp.* ops into standard xDSL dialects (arith, func, scf, memref)
+
+The program becomes func.func @main. Its inputs (lisp.var) are the
+function arguments and the value of lisp.return is its result. Scalars are
+f64 values and arithmetic on them is a single arith op; tensors are
+memrefs, tensor literals are constant memref.globals, and every tensor op
+is a loop nest of scf.for over the result:
+
+- elementwise ops and the fused ops of fusion.py store one element per
+  iteration of a single loop nest, loading each operand with NumPy
+  broadcasting rules
+- matmul is tiled: with tile sizes (tm, tn, tk) the loops run over tiles
+  of the i, j and k dimensions and then over the elements of each tile,
+  in i, k, j order so the innermost loop walks rows of the rhs and the
+  result contiguously
+
+With accelerate set, matmuls and the elementwise add, subtract and
+multiply of two tensors of the result's shape are not loops but calls to
+the lisp accelerator's functions, func.call @lisp_accel_<op>(dst, lhs,
+rhs, rows, cols[, depth]) on unranked memrefs, which the RISC-V code
+generator turns into the accelerator's instructions. Fused kernels stay
+loops, apart from the product of a fused matmul.
+
+LoweringStatistics counts the loops, allocations and matmul tiles emitted,
+for tuning the tile sizes.
+"""
+from dataclasses import asdict, dataclass, field
+from math import ceil, prod
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from xdsl.context import Context
+from xdsl.dialects import arith, func, memref, scf
+from xdsl.dialects.builtin import (
+    FloatAttr,
+    IndexType,
+    MemRefType,
+    ModuleOp,
+    StringAttr,
+    TensorType,
+    UnitAttr,
+    UnrankedMemRefType,
+    f64,
+)
+from xdsl.ir import Attribute, Block, Operation, Region, SSAValue
+from xdsl.passes import ModulePass
+
+from ..dialects import lisp
+from . import DEFAULT_TILE_SIZES
+
+# Scalar arith op of each lisp op and kernel token
+ARITH_OPS = {
+    lisp.AddOp: arith.AddfOp,
+    lisp.SubOp: arith.SubfOp,
+    lisp.MulOp: arith.MulfOp,
+    lisp.DivOp: arith.DivfOp,
+}
+KERNEL_ARITH_OPS = {name: ARITH_OPS[op_class] for name, op_class in lisp.KERNEL_OPS.items()}
+
+# Callees of the accelerator's functions are this prefix and the op name
+ACCELERATOR_PREFIX = "lisp_accel_"
+ACCELERATED_OPS = {lisp.AddOp: "add", lisp.SubOp: "subtract", lisp.MulOp: "multiply"}
+
+
+class LoweringError(Exception):
+    pass
+
+
+@dataclass
+class LoweringStatistics:
+    # Loop nests and scf.for loops emitted, and the deepest nest
+    loop_nests: int = 0
+    loops: int = 0
+    max_depth: int = 0
+    # Tensor buffers allocated by main
+    allocations: int = 0
+    allocated_bytes: int = 0
+    # Matmuls, and the tiles their loops visit in total
+    matmuls: int = 0
+    tiles: int = 0
+    # Tile sizes (tm, tn, tk) used for each matmul of shape (M, N, K)
+    matmul_tiles: List[Tuple[Tuple[int, int, int], Tuple[int, int, int]]] = field(default_factory=list)
+    # Tensor ops lowered to calls to the accelerator
+    accelerator_calls: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def memref_type(type: Attribute) -> Attribute:
+    # Lowered type of a lisp value
+    if isinstance(type, TensorType):
+        return MemRefType(f64, type.get_shape())
+    return type
+
+
+def _tile_loops(extent: int, tile: int) -> Tuple[int, int]:
+    # (tile size, number of tiles) of one matmul dimension; a tile size of
+    # 0 or at least the extent leaves the dimension untiled
+    if tile <= 0 or tile >= extent:
+        return extent, 1
+    return tile, ceil(extent / tile)
+
+
+class LispToStandard:
+    """
+    Emits the body of @main from a lisp module, one lisp op at a time.
+    """
+
+    def __init__(self, tile_sizes: Sequence[int] = DEFAULT_TILE_SIZES, accelerate: bool = False):
+        if len(tile_sizes) != 3:
+            raise LoweringError(f"tile_sizes must be (tm, tn, tk), got {tuple(tile_sizes)}")
+        self.tile_sizes = tuple(tile_sizes)
+        self.accelerate = accelerate
+        self.statistics = LoweringStatistics()
+        self.globals: List[Operation] = []
+        # Lowered value of every lisp value
+        self.values: Dict[SSAValue, SSAValue] = {}
+        self.entry: Optional[Block] = None
+        self.block: Optional[Block] = None
+        self._index_constants: Dict[int, SSAValue] = {}
+        self._last_index_constant: Optional[Operation] = None
+
+    def lower_module(self, module: ModuleOp) -> List[Operation]:
+        """
+        Returns the ops of the lowered module: the constant globals, then
+        func.func @main.
+        """
+        ops = list(module.body.block.ops)
+        inputs = [op for op in ops if isinstance(op, lisp.VarOp)]
+        self.entry = self.block = Block(arg_types=[memref_type(op.result.type) for op in inputs])
+        for op, arg in zip(inputs, self.entry.args):
+            arg.name_hint = op.var_name.data
+            self.values[op.result] = arg
+
+        result_types = []
+        for op in ops:
+            if isinstance(op, lisp.ReturnOp):
+                value = self.values[op.value]
+                result_types.append(value.type)
+                ret = func.ReturnOp(value)
+                lisp.set_location(ret, lisp.get_location(op))
+                self.emit(ret)
+                break
+            if not isinstance(op, lisp.VarOp):
+                self.lower_op(op)
+        else:
+            self.emit(func.ReturnOp())
+
+        arg_types = [arg.type for arg in self.entry.args]
+        main = func.FuncOp("main", (arg_types, result_types), Region(self.entry))
+        return self.globals + [main]
+
+    def emit(self, op: Operation) -> Optional[SSAValue]:
+        self.block.add_op(op)
+        return op.results[0] if op.results else None
+
+    def index(self, value: int) -> SSAValue:
+        # Index constants are shared, at the top of @main so they dominate
+        # every loop
+        constant = self._index_constants.get(value)
+        if constant is None:
+            op = arith.ConstantOp.from_int_and_width(value, IndexType())
+            if self._last_index_constant is not None:
+                self.entry.insert_op_after(op, self._last_index_constant)
+            elif self.entry.first_op is not None:
+                self.entry.insert_op_before(op, self.entry.first_op)
+            else:
+                self.entry.add_op(op)
+            self._last_index_constant = op
+            constant = self._index_constants[value] = op.result
+        return constant
+
+    def lower_op(self, op: Operation) -> None:
+        last = self.block.last_op
+        if isinstance(op, lisp.ConstantOp):
+            result = self.lower_constant(op)
+        elif isinstance(op, lisp.SetOp):
+            result = self.values[op.value]
+        elif isinstance(op, lisp.MatmulOp):
+            result = self.lower_matmul(op)
+        elif isinstance(op, lisp.BinaryOperation):
+            result = self.lower_elementwise(op)
+        elif isinstance(op, lisp.FusedElementwiseOp):
+            result = self.lower_fused(op, op.result.type, list(op.inputs))
+        elif isinstance(op, lisp.FusedMatmulOp):
+            result = self.lower_fused_matmul(op)
+        else:
+            raise LoweringError(f"cannot lower {op.name}")
+        self.values[op.result] = result
+
+        location = lisp.get_location(op)
+        if location is not None:
+            # The ops in loops inherit it from the loop
+            emitted = self.block.first_op if last is None else last.next_op
+            while emitted is not None:
+                lisp.set_location(emitted, location)
+                emitted = emitted.next_op
+
+    def lower_constant(self, op: lisp.ConstantOp) -> SSAValue:
+        if isinstance(op.value, FloatAttr):
+            return self.emit(arith.ConstantOp(op.value))
+        type = memref_type(op.result.type)
+        name = f"__constant_{len(self.globals)}"
+        self.globals.append(memref.GlobalOp.get(StringAttr(name), type, op.value, constant=UnitAttr()))
+        return self.emit(memref.GetGlobalOp(name, type))
+
+    def alloc(self, type: Attribute) -> SSAValue:
+        shape = type.get_shape()
+        self.statistics.allocations += 1
+        self.statistics.allocated_bytes += 8 * prod(shape)
+        return self.emit(memref.AllocOp.get(f64, shape=shape))
+
+    def load(self, value: SSAValue, ivs: Sequence[SSAValue], shape: Sequence[int]) -> SSAValue:
+        """
+        Loads the element of value at ivs, an index into a result of the
+        given shape, broadcasting value like NumPy. Scalars are returned as is.
+        """
+        if not isinstance(value.type, MemRefType):
+            return value
+        value_shape = value.type.get_shape()
+        offset = len(shape) - len(value_shape)
+        indices = [
+            self.index(0) if size == 1 and shape[offset + dim] != 1 else ivs[offset + dim]
+            for dim, size in enumerate(value_shape)
+        ]
+        return self.emit(memref.LoadOp.get(value, indices))
+
+    def emit_loop(self, lower: SSAValue, upper: SSAValue, body: Callable[[SSAValue], None], step: int = 1) -> None:
+        # scf.for from lower to upper; body emits into the loop block
+        block = Block(arg_types=[IndexType()])
+        parent, self.block = self.block, block
+        body(block.args[0])
+        self.emit(scf.YieldOp())
+        self.block = parent
+        self.emit(scf.ForOp(lower, upper, self.index(step), [], block))
+        self.statistics.loops += 1
+
+    def emit_loop_nest(self, shape: Sequence[int], body: Callable[[List[SSAValue]], None]) -> None:
+        # One loop per dimension of shape; body gets the induction variables
+        self.statistics.loop_nests += 1
+        self.statistics.max_depth = max(self.statistics.max_depth, len(shape))
+
+        def level(dim: int, ivs: List[SSAValue]) -> None:
+            if dim == len(shape):
+                body(ivs)
+            else:
+                self.emit_loop(self.index(0), self.index(shape[dim]), lambda iv: level(dim + 1, ivs + [iv]))
+
+        level(0, [])
+
+    def emit_accelerator_call(self, name: str, operands: Sequence[SSAValue], sizes: Sequence[int]) -> None:
+        # func.call @lisp_accel_<name>(dst, lhs, rhs, *sizes), declaring the
+        # callee the first time
+        callee = ACCELERATOR_PREFIX + name
+        unranked = UnrankedMemRefType.from_type(f64)
+        if not any(isinstance(op, func.FuncOp) and op.sym_name.data == callee for op in self.globals):
+            self.globals.append(func.FuncOp.external(callee, [unranked] * 3 + [IndexType()] * len(sizes), []))
+        args = [self.emit(memref.CastOp.get(operand, unranked)) for operand in operands]
+        self.emit(func.CallOp(callee, args + [self.index(size) for size in sizes], []))
+        self.statistics.accelerator_calls += 1
+
+    def lower_elementwise(self, op: lisp.BinaryOperation) -> SSAValue:
+        lhs, rhs = self.values[op.lhs], self.values[op.rhs]
+        arith_op = ARITH_OPS[type(op)]
+        if not isinstance(op.result.type, TensorType):
+            return self.emit(arith_op(lhs, rhs))
+
+        shape = op.result.type.get_shape()
+        result = self.alloc(op.result.type)
+        if self.accelerate and type(op) in ACCELERATED_OPS and lhs.type == rhs.type == result.type:
+            # Without broadcasting the tensors are one row of elements
+            self.emit_accelerator_call(ACCELERATED_OPS[type(op)], [result, lhs, rhs], [1, prod(shape)])
+            return result
+
+        def body(ivs):
+            value = self.emit(arith_op(self.load(lhs, ivs, shape), self.load(rhs, ivs, shape)))
+            self.emit(memref.StoreOp.get(value, result, ivs))
+
+        self.emit_loop_nest(shape, body)
+        return result
+
+    def lower_fused(
+        self,
+        op: lisp.FusedOperation,
+        result_type: Attribute,
+        args: Sequence[SSAValue],
+        result: Optional[SSAValue] = None,
+    ) -> SSAValue:
+        """
+        Emits one loop nest evaluating the kernel of op on args, which are
+        lisp values or already lowered memrefs.
+        """
+        args = [self.values.get(arg, arg) for arg in args]
+        kernel = op.kernel_tokens()
+        shape = result_type.get_shape()
+        if result is None:
+            result = self.alloc(result_type)
+
+        def body(ivs):
+            # Each argument is loaded once per element, however often the kernel reads it
+            loaded = {}
+            stack = []
+            for token in kernel:
+                if token.startswith("$"):
+                    index = int(token[1:])
+                    if index not in loaded:
+                        loaded[index] = self.load(args[index], ivs, shape)
+                    stack.append(loaded[index])
+                else:
+                    rhs = stack.pop()
+                    stack.append(self.emit(KERNEL_ARITH_OPS[token](stack.pop(), rhs)))
+            self.emit(memref.StoreOp.get(stack[0], result, ivs))
+
+        self.emit_loop_nest(shape, body)
+        return result
+
+    def lower_matmul(self, op: lisp.MatmulOp) -> SSAValue:
+        lhs, rhs = self.values[op.lhs], self.values[op.rhs]
+        if not isinstance(lhs.type, MemRefType) or not isinstance(rhs.type, MemRefType):
+            # A scalar operand scales the other one
+            if not isinstance(op.result.type, TensorType):
+                return self.emit(arith.MulfOp(lhs, rhs))
+            shape = op.result.type.get_shape()
+            result = self.alloc(op.result.type)
+
+            def body(ivs):
+                value = self.emit(arith.MulfOp(self.load(lhs, ivs, shape), self.load(rhs, ivs, shape)))
+                self.emit(memref.StoreOp.get(value, result, ivs))
+
+            self.emit_loop_nest(shape, body)
+            return result
+
+        product = self.emit_matmul(lhs, rhs)
+        if not isinstance(op.result.type, TensorType):
+            # vector . vector: the product is a 0-d memref
+            return self.emit(memref.LoadOp.get(product, []))
+        return product
+
+    def lower_fused_matmul(self, op: lisp.FusedMatmulOp) -> SSAValue:
+        lhs, rhs = self.values[op.lhs], self.values[op.rhs]
+        if not isinstance(lhs.type, MemRefType) or not isinstance(rhs.type, MemRefType):
+            raise LoweringError("lisp.fused_matmul operands must be tensors")
+        product = self.emit_matmul(lhs, rhs)
+        if product.type.get_shape() == () or not isinstance(op.result.type, TensorType):
+            raise LoweringError("lisp.fused_matmul of two vectors is not supported")
+        # Like FusedKernel.matmul, the epilogue overwrites the product when the shapes allow
+        in_place = product if product.type.get_shape() == op.result.type.get_shape() else None
+        return self.lower_fused(op, op.result.type, [product] + list(op.inputs), in_place)
+
+    def emit_matmul(self, lhs: SSAValue, rhs: SSAValue) -> SSAValue:
+        """
+        Emits the tiled loops of lhs @ rhs for 1-d and 2-d memrefs, and
+        returns the product (a 0-d memref when both are vectors).
+        """
+        lhs_shape, rhs_shape = lhs.type.get_shape(), rhs.type.get_shape()
+        if len(lhs_shape) > 2 or len(rhs_shape) > 2:
+            raise LoweringError(f"matmul of rank {len(lhs_shape)} and {len(rhs_shape)} operands is not supported")
+        M = lhs_shape[0] if len(lhs_shape) == 2 else 1
+        K = lhs_shape[-1]
+        N = rhs_shape[1] if len(rhs_shape) == 2 else 1
+
+        # Index lists of each operand, given the i, j and k induction variables
+        def lhs_index(i, k):
+            return [i, k] if len(lhs_shape) == 2 else [k]
+
+        def rhs_index(k, j):
+            return [k, j] if len(rhs_shape) == 2 else [k]
+
+        def result_index(i, j):
+            return lhs_index(i, j)[:-1] + ([j] if len(rhs_shape) == 2 else [])
+
+        result_shape = tuple(result_index(M, N))
+        result = self.alloc(MemRefType(f64, result_shape))
+        if self.accelerate:
+            self.statistics.matmuls += 1
+            self.emit_accelerator_call("matmul", [result, lhs, rhs], [M, N, K])
+            return result
+        zero = self.emit(arith.ConstantOp(FloatAttr(0.0, f64)))
+        self.emit_loop_nest(result_shape, lambda ivs: self.emit(memref.StoreOp.get(zero, result, ivs)))
+
+        tiles = [_tile_loops(extent, tile) for extent, tile in zip((M, N, K), self.tile_sizes)]
+        stats = self.statistics
+        stats.matmuls += 1
+        stats.tiles += prod(count for _, count in tiles)
+        stats.matmul_tiles.append(((M, N, K), tuple(size for size, _ in tiles)))
+        stats.loop_nests += 1
+        depth = sum(2 if count > 1 else 1 for _, count in tiles)
+        stats.max_depth = max(stats.max_depth, depth)
+
+        def element(i, j, k):
+            a = self.emit(memref.LoadOp.get(lhs, lhs_index(i, k)))
+            b = self.emit(memref.LoadOp.get(rhs, rhs_index(k, j)))
+            c = self.emit(memref.LoadOp.get(result, result_index(i, j)))
+            total = self.emit(arith.AddfOp(c, self.emit(arith.MulfOp(a, b))))
+            self.emit(memref.StoreOp.get(total, result, result_index(i, j)))
+
+        def tile_bounds(dim: int, start: Optional[SSAValue]) -> Tuple[SSAValue, SSAValue]:
+            # Bounds of the elements of the tile at start, or of the whole dimension
+            extent = (M, N, K)[dim]
+            size, count = tiles[dim]
+            if count == 1:
+                return self.index(0), self.index(extent)
+            stop = self.emit(arith.AddiOp(start, self.index(size)))
+            if extent % size:
+                # The last tile is partial
+                stop = self.emit(arith.MinSIOp(stop, self.index(extent)))
+            return start, stop
+
+        def tile_loop(dim: int, then: Callable[[Optional[SSAValue]], None]) -> None:
+            size, count = tiles[dim]
+            if count == 1:
+                then(None)
+            else:
+                self.emit_loop(self.index(0), self.index((M, N, K)[dim]), then, step=size)
+
+        def tile(i0, j0, k0):
+            i_bounds, j_bounds, k_bounds = [tile_bounds(dim, start) for dim, start in enumerate((i0, j0, k0))]
+            self.emit_loop(*i_bounds, lambda i: self.emit_loop(
+                *k_bounds, lambda k: self.emit_loop(
+                    *j_bounds, lambda j: element(i, j, k))))
+
+        # for i0, j0, k0 over tiles: for i, k, j within the tile
+        tile_loop(0, lambda i0: tile_loop(1, lambda j0: tile_loop(2, lambda k0: tile(i0, j0, k0))))
+        return result
+
+
+@dataclass(frozen=True)
+class LispLoweringPass(ModulePass):
+    """
+    Lowers a lisp module to func, arith, scf and memref.
+    """
+
+    name = "lisp-lower"
+
+    # Matmul tile sizes (tm, tn, tk); 0 leaves a dimension untiled
+    tile_sizes: tuple[int, ...] = DEFAULT_TILE_SIZES
+    # Lower tensor ops to calls to the accelerator where it can run them
+    accelerate: bool = False
+
+    def apply(self, ctx: Context, op: ModuleOp) -> None:
+        lower(op, self.tile_sizes, self.accelerate)
+
+
+def lower(
+    module: ModuleOp,
+    tile_sizes: Sequence[int] = DEFAULT_TILE_SIZES,
+    accelerate: bool = False,
+) -> LoweringStatistics:
+    """
+    Lowers module in place.
+
+    Returns:
+        Statistics of the loops and tiles emitted.
+    """
+    lowering = LispToStandard(tile_sizes, accelerate)
+    ops = lowering.lower_module(module)
+
+    block = module.body.block
+    for op in reversed(list(block.ops)):
+        block.erase_op(op)
+    block.add_ops(ops)
+    return lowering.statistics
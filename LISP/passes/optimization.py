@@ -1,4 +1,117 @@
 """
-OPTIONAL FILE I THINK I DONT NEED. LISP NEEDS MINIMAL OPTIMIZATIONS. (maybe something like Inlining, dead code elimination, constant folding)
-optimizations.py: Implement constant folding, inlining, etc.
-"""
\ No newline at end of file
+optimization.py: constant folding, common subexpression elimination and
+dead (set ...) removal for the lisp dialect
+
+Folding evaluates an op whose operands are all constants with the same
+operator functions as the interpreter, so a folded program computes exactly
+what the interpreter would, matmul of literal tensors included. CSE and DCE
+are xDSL's own; they apply because every lisp op except lisp.return is Pure.
+"""
+import operator
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+from xdsl.context import Context
+from xdsl.dialects.builtin import FloatAttr, ModuleOp, f64
+from xdsl.ir import SSAValue
+from xdsl.passes import ModulePass
+from xdsl.pattern_rewriter import (
+    PatternRewriter,
+    PatternRewriteWalker,
+    RewritePattern,
+    op_type_rewrite_pattern,
+)
+from xdsl.transforms.common_subexpression_elimination import cse
+from xdsl.transforms.dead_code_elimination import dce
+
+from ..dialects import lisp
+from ..interpreter import TENSOR_OPS
+
+# The interpreter's implementation of each op
+FOLDERS = {
+    lisp.AddOp: operator.add,
+    lisp.SubOp: operator.sub,
+    lisp.MulOp: operator.mul,
+    lisp.DivOp: operator.truediv,
+    lisp.MatmulOp: TENSOR_OPS["matmul"],
+}
+
+
+def constant_value(value: SSAValue) -> Optional[Union[float, np.ndarray]]:
+    """
+    Returns the compile-time value of an SSA value, looking through the
+    (set ...) ops that name it, or None if it is not a constant.
+    """
+    owner = value.owner
+    while isinstance(owner, lisp.SetOp):
+        owner = owner.value.owner
+    if isinstance(owner, lisp.ConstantOp):
+        return owner.get_value()
+    return None
+
+
+class FoldConstantBinaryOp(RewritePattern):
+    """
+    Replaces a binary op with constant operands by a lisp.constant holding
+    its result.
+    """
+
+    def __init__(self, max_elements: int):
+        # Bigger results stay as ops rather than growing the module
+        self.max_elements = max_elements
+
+    @op_type_rewrite_pattern
+    def match_and_rewrite(self, op: lisp.BinaryOperation, rewriter: PatternRewriter):
+        lhs = constant_value(op.lhs)
+        if lhs is None:
+            return
+        rhs = constant_value(op.rhs)
+        if rhs is None:
+            return
+
+        if isinstance(op, lisp.DivOp) and not np.all(rhs):
+            # Leave division by zero to fail (or not) at run time
+            return
+        shape = lisp.shape_of(op.result.type)
+        if int(np.prod(shape)) > self.max_elements:
+            return
+
+        result = FOLDERS[type(op)](lhs, rhs)
+        if shape:
+            folded = lisp.ConstantOp(np.asarray(result))
+        else:
+            value = FloatAttr(float(result), f64)
+            folded = lisp.ConstantOp.create(result_types=[f64], properties={"value": value})
+        rewriter.replace(op, folded)
+
+
+@dataclass(frozen=True)
+class LispOptimizationPass(ModulePass):
+    """
+    Folds constants, then merges identical ops, then drops ops whose value
+    is never used, such as (set ...) bindings that are never read.
+    """
+
+    name = "lisp-optimize"
+
+    # Largest tensor, in elements, that folding may create
+    max_fold_elements: int = 1 << 20
+
+    def apply(self, ctx: Context, op: ModuleOp) -> None:
+        # The module is one block in program order, so a single forward walk
+        # folds every operand before its users are visited
+        PatternRewriteWalker(
+            FoldConstantBinaryOp(self.max_fold_elements),
+            apply_recursively=False
+        ).rewrite_module(op)
+        cse(op)
+        dce(op)
+
+
+def optimize(module: ModuleOp, max_fold_elements: int = 1 << 20) -> ModuleOp:
+    """
+    Runs LispOptimizationPass on module in place and returns it.
+    """
+    LispOptimizationPass(max_fold_elements).apply(Context(), module)
+    return module
@@ -0,0 +1,126 @@
+from LISP.compiler import CompileOptions
+from LISP.emulator.assembler import assemble
+from LISP.emulator.emulator import Emulator, EmulatorError, MemoryFault
+from LISP.emulator.lisp_accelerator_instruction_functions import Accelerator, AcceleratorCostModel
+from LISP.emulator.runner import build_program, new_emulator, run_program
+from LISP.interpreter import run_source as interpret
+import numpy as np
+import unittest
+
+# a0 = a1 @ a2 (a3 x a5 times a5 x a4), then a6 = a0 - a0 * a0
+SOURCE = """
+main:
+    lacc.shape a5, a3, a4
+    lacc.matmul a0, a1, a2
+    li t0, 1
+    mul t1, a3, a4
+    lacc.shape zero, t0, t1
+    lacc.multiply a6, a0, a0
+    lacc.subtract a6, a0, a6
+    ret
+"""
+
+class TestAccelerator(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.A = rng.standard_normal((6, 5))
+        self.B = rng.standard_normal((5, 7))
+
+    def test_instructions(self):
+        program = assemble(SOURCE)
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        A, B = emulator.array(0x8000, (6, 5)), emulator.array(0x9000, (5, 7))
+        C, D = emulator.array(0xa000, (6, 7)), emulator.array(0xb000, (6, 7))
+        A[...], B[...] = self.A, self.B
+        emulator.call(program.symbols["main"], [0xa000, 0x8000, 0x9000, 6, 7, 5, 0xb000])
+
+        product = self.A @ self.B
+        self.assertTrue(np.allclose(C, product))
+        self.assertTrue(np.allclose(D, product - product * product))
+        accelerator = emulator.accelerator
+        self.assertEqual(accelerator.operations, {"lacc.matmul": 1, "lacc.add": 0, "lacc.subtract": 1, "lacc.multiply": 1})
+        self.assertEqual(accelerator.flops, 2 * 6 * 7 * 5 + 2 * 42)
+
+        costs = accelerator.cost_model
+        self.assertEqual(accelerator.cycles, 2 * costs.configure + costs.matmul(6, 7, 5) + 2 * costs.elementwise(1, 42))
+
+    def test_strides(self):
+        # The 2x3 tile at row 1, column 2 of an 4x8 matrix, times a 3x2 tile
+        # at row 0, column 1 of a 3x4 one, into rows 0-1, columns 1-2 of 2x4
+        source = """
+        main:
+            li t0, 2
+            li t1, 3
+            lacc.shape t1, t0, t0
+            li t0, 4
+            li t1, 8
+            lacc.stride t0, t1, t0
+            lacc.matmul a0, a1, a2
+            ret
+        """
+        program = assemble(source)
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        lhs, rhs, out = emulator.array(0x8000, (4, 8)), emulator.array(0x9000, (3, 4)), emulator.array(0xa000, (2, 4))
+        lhs[...] = np.arange(32).reshape(4, 8)
+        rhs[...] = np.arange(12).reshape(3, 4)
+        emulator.call(program.symbols["main"], [0xa000 + 8, 0x8000 + 8 * 8 + 16, 0x9000 + 8])
+
+        expected = np.zeros((2, 4))
+        expected[:, 1:3] = lhs[1:3, 2:5] @ rhs[:, 1:3]
+        self.assertTrue(np.array_equal(out, expected))
+
+    def test_cost_model(self):
+        costs = AcceleratorCostModel(tile_rows=4, tile_cols=4, setup=0, bytes_per_cycle=1 << 20)
+        # 2 x 2 tiles of the array, each streaming the depth of 100 plus 8 to fill and drain
+        self.assertEqual(costs.matmul(8, 8, 100), 4 * 108)
+        self.assertEqual(AcceleratorCostModel(setup=0, lanes=16, bytes_per_cycle=8).elementwise(4, 8), 96)
+
+        program = assemble(SOURCE)
+        cycles = []
+        for costs in (AcceleratorCostModel(), AcceleratorCostModel(tile_rows=2, tile_cols=2)):
+            emulator = Emulator(1 << 20, accelerator=Accelerator(costs))
+            emulator.load(program)
+            emulator.call(program.symbols["main"], [0xa000, 0x8000, 0x9000, 6, 7, 5, 0xb000])
+            cycles.append(emulator.accelerator.cycles)
+        self.assertLess(cycles[0], cycles[1])
+
+    def test_errors(self):
+        program = assemble(SOURCE)
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        with self.assertRaises(MemoryFault):
+            emulator.call(program.symbols["main"], [0xa000, 0x8000, 0xffff0, 6, 7, 5, 0xb000])
+        with self.assertRaises(EmulatorError):
+            emulator.call(program.symbols["main"], [0xa000, 0x8000, 0x9000, 6, 7, -1, 0xb000])
+
+    def test_compiled_programs(self):
+        values = {"A": self.A, "B": self.B, "C": self.B[0], "D": np.ones((6, 7)), "x": 0.5}
+        shapes = {name: value.shape for name, value in values.items() if name != "x"}
+        for code in (
+            "(return (matmul A B))",
+            "(return (add (matmul A B) C))",
+            "(return (subtract (multiply (matmul A B) D) (multiply D x)))",
+            "(return (matmul (matmul A B) C))",
+        ):
+            for fuse in (True, False):
+                machine = build_program(code, CompileOptions.create(shapes, accelerate=True, fuse=fuse))
+                emulator = new_emulator(machine)
+                self.assertTrue(np.allclose(run_program(machine, values, emulator), interpret(code, values)), code)
+                self.assertGreater(emulator.accelerator.operations["lacc.matmul"], 0)
+
+        # The scalar code of a matmul runs every multiply-add; the accelerator one instruction
+        code = "(return (matmul A B))"
+        instructions = []
+        for accelerate in (False, True):
+            machine = build_program(code, CompileOptions.create(shapes, accelerate=accelerate))
+            emulator = new_emulator(machine)
+            run_program(machine, values, emulator)
+            instructions.append(emulator.instret)
+        self.assertGreater(instructions[0], 6 * 7 * 5)
+        self.assertLess(instructions[1], 20)
+
+if __name__ == '__main__':
+    unittest.main()
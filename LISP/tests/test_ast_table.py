@@ -0,0 +1,52 @@
+from LISP.frontend.ast_table import ASTTable
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.lisp_ast import *
+from LISP.frontend.parser import LispParser
+import unittest
+
+class TestASTTable(unittest.TestCase):
+    def setUp(self):
+        self.file_name = "<test_file>"
+        self.code = (
+            "(set A ([[1 2] [3 4]]))\n"
+            "(set x (+ 2 (* y 3)))\n"
+            "(set C (matmul A A))\n"
+            "(return (subtract C x))"
+        )
+
+    def parse(self, code):
+        parser = LispParser(LispLexer(code), self.file_name)
+        return list(parser.parse_program())
+
+    def test_round_trip(self):
+        forms = self.parse(self.code)
+        table = ASTTable.from_forms(forms, self.file_name)
+
+        # The node classes come back unchanged, locations included
+        self.assertEqual(list(table.forms()), forms)
+        self.assertEqual(len(table.roots), 4)
+
+    def test_parse(self):
+        table = ASTTable.parse(self.code, self.file_name)
+        self.assertEqual(list(table.forms()), self.parse(self.code))
+
+    def test_columns(self):
+        table = ASTTable.parse("(set x (+ y y))", self.file_name)
+
+        # Children are stored before their parents
+        self.assertEqual(
+            [table.kind(i) for i in range(len(table))],
+            [ExprASTKind.Var, ExprASTKind.Var, ExprASTKind.BinOp, ExprASTKind.VarDecl]
+        )
+        self.assertEqual((table.lhs[2], table.rhs[2]), (0, 1))
+        # Repeated names share one string
+        self.assertEqual(table.names[0], table.names[1])
+        self.assertEqual(table.location(2), Location(self.file_name, 1, 9))
+
+    def test_nodes_have_no_dict(self):
+        node = self.parse("(+ 1 2)")[0]
+        self.assertFalse(hasattr(node, "__dict__"))
+        self.assertFalse(hasattr(node.loc, "__dict__"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+from LISP.benchmarks import suite
+from LISP.benchmarks.generators import deep_nesting, many_forms, tensor_literal
+from LISP.interpreter import run_source
+from unittest import mock
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import tempfile
+import unittest
+
+def results(**values):
+    metrics = {
+        name: {"value": value, "unit": "bytes" if "memory" in name else "nodes/s", "higher_is_better": "memory" not in name}
+        for name, value in values.items()
+    }
+    return suite.results(metrics, 1.0, 0)
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_generators(self):
+        for generate, args in ((deep_nesting, (50,)), (many_forms, (200,)), (tensor_literal, (20, 30))):
+            # Seeded: the same text every time, and another for another seed
+            self.assertEqual(generate(*args, seed=1), generate(*args, seed=1))
+            self.assertNotEqual(generate(*args, seed=1), generate(*args, seed=2))
+            for seed in range(3):
+                value = run_source(generate(*args, seed=seed), suite.INPUTS)
+                self.assertTrue(np.all(np.isfinite(value)))
+
+    def test_compare(self):
+        baseline = results(parse=100.0, lex=100.0, parse_memory=1000, lex_memory=1000, removed=1.0)
+        current = results(parse=85.0, lex=95.0, parse_memory=1200, lex_memory=900, added=1.0)
+
+        regressions = suite.compare(baseline, current, threshold=0.1)
+        self.assertEqual([regression.name for regression in regressions], ["parse_memory", "parse"])
+        self.assertAlmostEqual(regressions[0].change, 0.2)
+        self.assertAlmostEqual(regressions[1].change, 0.15)
+        self.assertEqual(suite.compare(baseline, current, threshold=0.25), [])
+
+    @mock.patch.object(suite, "MIN_SAMPLE_TIME", 0)
+    def test_run_and_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results.json")
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(suite.main(["run", "--scale", "0.02", "--repeat", "1", "-o", path]), 0)
+            with open(path) as file:
+                data = json.load(file)
+
+            for program in ("deep_nesting", "many_forms", "tensor_literal"):
+                self.assertGreater(data["metrics"][f"lexer.{program}.tokens_per_second"]["value"], 0)
+                for stage in ("parser", "interpreter", "compiled"):
+                    self.assertGreater(data["metrics"][f"{stage}.{program}.nodes_per_second"]["value"], 0)
+            self.assertFalse(data["metrics"]["parser.many_forms.peak_memory"]["higher_is_better"])
+
+            # A slower run regresses against it
+            for entry in data["metrics"].values():
+                entry["value"] *= 2 if entry["higher_is_better"] else 0.5
+            faster = os.path.join(directory, "faster.json")
+            with open(faster, "w") as file:
+                json.dump(data, file)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(suite.main(["compare", faster, path]), 1)
+                self.assertEqual(suite.main(["compare", path, faster]), 0)
+            self.assertIn("REGRESSION lexer.many_forms.tokens_per_second", output.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
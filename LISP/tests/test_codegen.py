@@ -0,0 +1,107 @@
+from LISP.compiler import CompileOptions
+from LISP.emulator.codegen import CodegenError
+from LISP.emulator.runner import build_program, input_arrays, new_emulator, run_program, run_source
+from LISP.interpreter import run_source as interpret
+import numpy as np
+import unittest
+
+class TestCodegen(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = {
+            "A": rng.standard_normal((5, 3)),
+            "B": rng.standard_normal((3, 4)),
+            "C": rng.standard_normal(4),
+            "v": rng.standard_normal(3),
+            "x": 1.5,
+        }
+
+    def check(self, code):
+        self.assertTrue(np.allclose(run_source(code, self.values), interpret(code, self.values)), code)
+
+    def test_scalar_program(self):
+        self.check("(set y (* (+ x 1) 2)) (return (/ y 4))")
+
+    def test_tensor_programs(self):
+        for code in (
+            "(return (matmul A B))",
+            "(return (subtract (multiply (matmul A B) C) ([[1] [2] [3] [4] [5]])))",
+            "(set W ([[1 2] [3 4] [5 6]])) (return (matmul A W))",
+            "(return (add (matmul A B) C))",
+            "(set P (multiply A A)) (return (subtract (add P x) (/ A 2)))",
+        ):
+            self.check(code)
+
+    def test_vector_matmul(self):
+        for code in ("(return (matmul A v))", "(return (matmul v B))", "(return (matmul v v))"):
+            self.check(code)
+
+    def test_tiling_and_passes(self):
+        code = "(return (add (matmul A B) C))"
+        expected = interpret(code, self.values)
+        shapes = {"A": (5, 3), "B": (3, 4), "C": (4,)}
+        for options in (
+            CompileOptions.create(shapes, tile_sizes=(2, 3, 2)),
+            CompileOptions.create(shapes, tile_sizes=(0, 0, 0)),
+            CompileOptions.create(shapes, optimize=False, fuse=False),
+        ):
+            machine = build_program(code, options)
+            self.assertTrue(np.allclose(run_program(machine, self.values), expected))
+
+    def test_spills(self):
+        # More values live at once than there are floating-point registers
+        code = "".join(f"(set y{i} (+ x {i}))" for i in range(40))
+        product = "y0"
+        for i in range(1, 40):
+            product = f"(* {product} (/ y{i} y{40 - i}))"
+        self.check(code + f"(return {product})")
+
+    def test_values_live_across_loops(self):
+        # The constants 1..10 are defined before the loop of their multiply
+        # and read on every iteration, so their registers must not be reused
+        # inside it
+        code = "".join(f"(set T{i} (multiply A {i + 1}))" for i in range(10))
+        total = "T0"
+        for i in range(1, 10):
+            total = f"(add {total} T{i})"
+        self.check(code + f"(set s (* x 3)) (return (subtract {total} (multiply A s)))")
+
+    def test_repeated_runs(self):
+        machine = build_program("(return (multiply A 2))", CompileOptions.create({"A": (5, 3)}))
+        emulator = new_emulator(machine)
+        A = self.values["A"]
+        self.assertTrue(np.allclose(run_program(machine, {"A": A}, emulator), A * 2))
+        translations = emulator.translations
+
+        # The second run reuses every decoded block
+        self.assertTrue(np.allclose(run_program(machine, {"A": A + 1}, emulator), (A + 1) * 2))
+        self.assertEqual(emulator.translations, translations)
+
+    def test_zero_copy(self):
+        machine = build_program("(return (add (matmul A B) C))", CompileOptions.create({"A": (5, 3), "B": (3, 4), "C": (4,)}))
+        emulator = new_emulator(machine)
+        arrays = input_arrays(machine, emulator)
+        for name, array in arrays.items():
+            array[...] = self.values[name]
+        expected = self.values["A"] @ self.values["B"] + self.values["C"]
+
+        result = run_program(machine, arrays, emulator)
+        self.assertTrue(np.allclose(result, expected))
+        # The result lives in guest memory
+        self.assertGreaterEqual(emulator.memory.address_of(result), 0)
+
+        # Inputs updated in place are seen by the next run
+        arrays["C"] += 1
+        run_program(machine, arrays, emulator)
+        self.assertTrue(np.allclose(result, expected + 1))
+
+    def test_too_many_inputs(self):
+        # Tensor inputs are passed in a0-a7 only
+        code = "(return " + "".join(f"(add x{i} " for i in range(8)) + "x8" + ")" * 9
+        options = CompileOptions.create({f"x{i}": (2,) for i in range(9)})
+        with self.assertRaises(CodegenError):
+            build_program(code, options)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,235 @@
+from LISP.compiler import CompileCache, CompileOptions, cache_key, collect_sources, compile_files, compile_source, main
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+import json
+import os
+import pickle
+import tempfile
+import unittest
+
+CODE = "(set A ([[1 2] [3 4]])) (set y (* x 2)) (return (add (matmul W A) y))"
+OPTIONS = CompileOptions.create({"W": (3, 2)})
+
+class TestCompiler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_compile_source(self):
+        result = compile_source(CODE, OPTIONS)
+
+        self.assertEqual(len(result.forms), 3)
+        self.assertIn("lisp.fused_matmul", result.optimized_ir)
+        self.assertIn("func.func", result.lowered_ir)
+        result.optimized_module().verify()
+        result.lowered_module().verify()
+        self.assertEqual(result.statistics["matmuls"], 1)
+
+    def test_cache_key(self):
+        key = cache_key(CODE, OPTIONS)
+        self.assertEqual(key, cache_key(CODE, CompileOptions.create({"W": [3, 2]})))
+
+        self.assertNotEqual(key, cache_key(CODE + " ", OPTIONS))
+        self.assertNotEqual(key, cache_key(CODE, OPTIONS, "other.lisp"))
+        self.assertNotEqual(key, cache_key(CODE, CompileOptions.create({"W": (3, 2)}, tile_sizes=(8, 8, 8))))
+        self.assertNotEqual(key, cache_key(CODE, CompileOptions.create({"W": (3, 2)}, fuse=False)))
+
+    def test_hits_and_misses(self):
+        cache = CompileCache(self.directory)
+        first = cache.compile(CODE, OPTIONS)
+        second = cache.compile(CODE, OPTIONS)
+        cache.compile(CODE, CompileOptions.create({"W": (5, 2)}))
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "evictions": 0})
+        self.assertEqual(second.forms, first.forms)
+        self.assertEqual(second.lowered_ir, first.lowered_ir)
+
+        # Another instance (or process) sees the same entries
+        other = CompileCache(self.directory)
+        other.compile(CODE, OPTIONS)
+        self.assertEqual(other.stats()["hits"], 1)
+
+    def test_lru_eviction(self):
+        cache = CompileCache(self.directory)
+        keys = []
+        for i in range(4):
+            keys.append(cache_key(f"(return {i})", OPTIONS))
+            cache.put(keys[-1], compile_source(f"(return {i})", OPTIONS))
+            # Distinct, increasing access times
+            os.utime(cache.path(keys[-1]), (1000 + i, 1000 + i))
+        entry_size = os.path.getsize(cache.path(keys[0]))
+
+        # Reading the oldest entry makes it the most recently used
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.max_bytes = 2 * entry_size + entry_size // 2
+        cache.evict()
+
+        self.assertEqual(cache.evictions, 2)
+        remaining = [key for key in keys if os.path.exists(cache.path(key))]
+        self.assertEqual(remaining, [keys[0], keys[3]])
+        self.assertLessEqual(cache.size(), cache.max_bytes)
+
+    def test_running_size(self):
+        cache = CompileCache(self.directory)
+        scans = []
+        entries = cache.entries
+        cache.entries = lambda: scans.append(None) or entries()
+        for i in range(5):
+            cache.put(cache_key(f"(return {i})", OPTIONS), compile_source(f"(return {i})", OPTIONS))
+        # One scan for the first put, then the total is kept up to date
+        self.assertEqual(len(scans), 1)
+
+        cache.max_bytes = cache.size() - 1
+        cache.put(cache_key("(return 5)", OPTIONS), compile_source("(return 5)", OPTIONS))
+        self.assertEqual(cache.evictions, 2)
+        self.assertLessEqual(cache.size(), cache.max_bytes)
+
+    def test_several_writers(self):
+        result = compile_source("(return 1)", OPTIONS)
+        entry_size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        max_bytes = 8 * entry_size
+        # Two processes' caches, each blind to the other's writes until it scans
+        caches = [CompileCache(self.directory, max_bytes, writers=2) for _ in range(2)]
+        scans = []
+
+        def counted(entries):
+            return lambda: scans.append(None) or entries()
+        for cache in caches:
+            cache.entries = counted(cache.entries)
+
+        for i in range(40):
+            caches[i % 2].put(f"{i:064x}", result)
+            self.assertLessEqual(CompileCache(self.directory).size(), max_bytes)
+        # Each scans once it has written its share, two entries' worth
+        self.assertLessEqual(len(scans), 40 // 2)
+
+    def test_corrupt_entry(self):
+        cache = CompileCache(self.directory)
+        key = cache_key(CODE, OPTIONS)
+        with open(cache.path(key), "wb") as file:
+            file.write(b"not a pickle")
+
+        self.assertIsNone(cache.get(key))
+        self.assertFalse(os.path.exists(cache.path(key)))
+        self.assertEqual(cache.misses, 1)
+
+    def test_concurrent_writers(self):
+        def compile_once(_):
+            return CompileCache(self.directory).compile(CODE, OPTIONS).lowered_ir
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(compile_once, range(8)))
+
+        self.assertEqual(len(set(results)), 1)
+        # One entry and no leftover temporary files
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(CompileCache(self.directory).path(cache_key(CODE, OPTIONS)))])
+
+    def write_sources(self):
+        # Sources in a tree, one of them invalid
+        paths = []
+        for name, code in (("b.lisp", CODE), ("a.lisp", "(return (* x 2))"), ("sub/c.lisp", "(set"), ("sub/d.lisp", CODE)):
+            path = os.path.join(self.directory, "src", name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as file:
+                file.write(code)
+            paths.append(path)
+        with open(os.path.join(self.directory, "src", "notes.txt"), "w") as file:
+            file.write("not a source")
+        return paths
+
+    def test_collect_sources(self):
+        b, a, c, d = self.write_sources()
+        self.assertEqual(collect_sources([os.path.join(self.directory, "src")]), [a, b, c, d])
+        self.assertEqual(collect_sources([d, os.path.join(self.directory, "src", "sub")]), [d, c, d])
+
+    def test_compile_files(self):
+        paths = self.write_sources()
+        expected = [
+            compile_source(CODE, OPTIONS, paths[0]).lowered_ir,
+            compile_source("(return (* x 2))", OPTIONS, paths[1]).lowered_ir,
+            None,
+            compile_source(CODE, OPTIONS, paths[3]).lowered_ir,
+        ]
+
+        # Threads exercise the bounded queue without process start-up cost
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            results = list(compile_files(paths * 3, OPTIONS, executor=pool, max_pending=2))
+        # In input order, whatever order they finished in
+        self.assertEqual([result.path for result in results], paths * 3)
+        for result, lowered_ir in zip(results, expected * 3):
+            if lowered_ir is None:
+                self.assertFalse(result.ok)
+                self.assertIn("SyntaxError", result.error)
+            else:
+                self.assertEqual(result.result.lowered_ir, lowered_ir)
+            self.assertGreater(result.seconds, 0)
+
+    def test_compile_files_processes(self):
+        paths = self.write_sources()
+        serial = list(compile_files(paths, OPTIONS, max_workers=1))
+        parallel = list(compile_files(paths, OPTIONS, max_workers=2))
+        self.assertEqual([result.error for result in parallel], [result.error for result in serial])
+        self.assertEqual(
+            [result.result and result.result.lowered_ir for result in parallel],
+            [result.result and result.result.lowered_ir for result in serial],
+        )
+
+    def test_compile_files_cached(self):
+        paths = self.write_sources()[:2]
+        cache_directory = os.path.join(self.directory, "cache")
+        first = list(compile_files(paths, OPTIONS, max_workers=1, cache_directory=cache_directory))
+        second = list(compile_files(paths, OPTIONS, max_workers=1, cache_directory=cache_directory))
+        self.assertEqual([result.cached for result in first + second], [False, False, True, True])
+
+        # With a zero size limit every entry is evicted as soon as it is written
+        cache_directory = os.path.join(self.directory, "empty_cache")
+        for _ in range(2):
+            results = list(compile_files(paths, OPTIONS, max_workers=1, cache_directory=cache_directory, cache_size=0))
+            self.assertEqual([result.cached for result in results], [False, False])
+        self.assertEqual(os.listdir(cache_directory), [])
+
+    def test_compile_files_cache_size(self):
+        # Every worker writes to the cache at once, and the limit holds for all of them
+        sources = os.path.join(self.directory, "src")
+        os.makedirs(sources)
+        paths = []
+        for i in range(16):
+            paths.append(os.path.join(sources, f"f{i}.lisp"))
+            with open(paths[-1], "w") as file:
+                file.write(f"(return (* x {i}))")
+        cache_directory = os.path.join(self.directory, "cache")
+        entry_size = len(pickle.dumps(compile_source("(return (* x 0))", OPTIONS), protocol=pickle.HIGHEST_PROTOCOL))
+        cache_size = 8 * entry_size
+
+        results = list(compile_files(paths, OPTIONS, max_workers=4, cache_directory=cache_directory, cache_size=cache_size))
+        self.assertTrue(all(result.ok for result in results))
+        self.assertLessEqual(CompileCache(cache_directory).size(), cache_size)
+        self.assertGreater(CompileCache(cache_directory).size(), 0)
+
+    def test_main(self):
+        self.write_sources()
+        output = os.path.join(self.directory, "out")
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            status = main([os.path.join(self.directory, "src"), "-o", output, "-j", "1", "--input", "W=3x2"])
+
+        self.assertEqual(status, 1)
+        self.assertIn("c.lisp: error: SyntaxError", stderr.getvalue())
+        self.assertIn("4 files, 1 failed", stdout.getvalue())
+        self.assertEqual(sorted(os.listdir(output)), ["a.mlir", "b.mlir", "sub"])
+        with open(os.path.join(output, "sub", "d.mlir")) as file:
+            self.assertIn("func.func", file.read())
+
+        trace = os.path.join(self.directory, "trace.json")
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            main([os.path.join(self.directory, "src", "a.lisp"), "--trace", trace])
+        with open(trace) as file:
+            self.assertIn("ir_gen", {event["name"] for event in json.load(file)["traceEvents"]})
+
+if __name__ == '__main__':
+    unittest.main()
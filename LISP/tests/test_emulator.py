@@ -0,0 +1,209 @@
+from LISP.emulator.assembler import AssemblerError, assemble
+from LISP.emulator.emulator import Emulator, EmulatorError, MemoryFault
+from LISP.emulator.isa import INSTRUCTIONS, Instruction, decode, encode
+from LISP.emulator.memory import Memory
+import numpy as np
+import unittest
+
+def run(source, *int_args, float_args=(), memory_size=1 << 20):
+    program = assemble(source)
+    emulator = Emulator(memory_size)
+    emulator.load(program)
+    emulator.call(program.symbols["main"], int_args, float_args)
+    return emulator
+
+class TestEmulator(unittest.TestCase):
+
+    def test_encode_decode(self):
+        for name, spec in INSTRUCTIONS.items():
+            fmt = spec[0]
+            imm = {"I": -7, "S": 40, "B": -16, "U": 0x12345, "J": 2048, "SH": 35, "SHW": 17}.get(fmt, 0)
+            rd = 0 if fmt in ("S", "B", "SYS") or name.startswith("fence") else 5
+            rs1 = 0 if fmt in ("U", "J", "SYS") or name.startswith("fence") else 6
+            rs2 = 7 if fmt in ("R", "S", "B", "FR", "FC") else 0
+            ins = Instruction(name, rd, rs1, rs2, imm)
+            self.assertEqual(decode(encode(ins))[0], ins, name)
+
+        # addi a0, a0, 1 and fadd.d fa0, fa0, fa1 as any assembler encodes them
+        self.assertEqual(encode(Instruction("addi", 10, 10, 0, 1)), 0x00150513)
+        self.assertEqual(decode(0x02b57553)[0], Instruction("fadd.d", 10, 10, 11))
+
+    def test_integer_program(self):
+        source = """
+        main:
+            li t0, 0
+            li t1, 0
+        loop:
+            addi t0, t0, 1
+            add t1, t1, t0
+            blt t0, a0, loop
+            mv a0, t1
+            ret
+        """
+        emulator = run(source, 100)
+        self.assertEqual(emulator.x[10], 5050)
+        self.assertEqual(emulator.instret, 2 + 3 * 100 + 2)
+
+    def test_integer_semantics(self):
+        source = """
+        main:
+            li t0, -1
+            srli a0, t0, 60
+            div a1, t0, zero
+            rem a2, a0, zero
+            li t1, 0x7fffffffffffffff
+            addi a3, t1, 1
+            mulhu a4, t0, t0
+            addiw a5, t1, 0
+            li t2, -7
+            li t3, 2
+            div a6, t2, t3
+            rem a7, t2, t3
+            ret
+        """
+        x = run(source).x
+        self.assertEqual(x[10:18], [15, -1, 15, -(1 << 63), -2, -1, -3, -1])
+
+    def test_floating_point(self):
+        source = """
+        main:
+            la t0, values
+            fld ft0, 0(t0)
+            fld ft1, 8(t0)
+            fdiv.d fa0, ft0, ft1
+            fsqrt.d fa1, ft0
+            fcvt.l.d a0, fa0
+            flt.d a1, ft1, ft0
+            fdiv.d fa2, ft0, ft2
+            fneg.d fa3, ft0
+            fsd fa0, 16(t0)
+            ret
+            .data
+        values:
+            .double 9.0, 4.0, 0.0
+        """
+        program = assemble(source)
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        emulator.call(program.symbols["main"])
+        f, x = emulator.f, emulator.x
+        self.assertEqual(f[10:14], [2.25, 3.0, float("inf"), -9.0])
+        self.assertEqual(x[10:12], [2, 1])
+        self.assertEqual(emulator.read(program.symbols["values"] + 16, 8), bytes.fromhex("0000000000000240"))
+
+    def test_block_cache(self):
+        source = """
+        main:
+            li t0, 1000
+        loop:
+            addi t0, t0, -1
+            bnez t0, loop
+            ret
+        """
+        program = assemble(source)
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        emulator.call(program.symbols["main"])
+        # The entry, the loop body and the return, each decoded once
+        self.assertEqual(emulator.translations, 3)
+        emulator.call(program.symbols["main"])
+        self.assertEqual(emulator.translations, 3)
+        self.assertEqual(emulator.instret, 2 * (1 + 2 * 1000 + 1))
+
+    def test_self_modifying_code(self):
+        source = """
+        main:
+            mv s0, ra
+            call get
+            mv s1, a0
+            la t0, get
+            la t1, patch
+            lw t2, 0(t1)
+            sw t2, 0(t0)
+            call get
+            add a0, a0, s1
+            mv ra, s0
+            ret
+        get:
+            li a0, 1
+            ret
+        patch:
+            li a0, 2
+        """
+        emulator = run(source)
+        # get returned 1, then 2 once its first instruction was rewritten
+        self.assertEqual(emulator.x[10], 3)
+        self.assertGreater(emulator.invalidations, 0)
+
+    def test_host_writes_invalidate(self):
+        program = assemble("main:\n li a0, 1\n ret\npatch:\n li a0, 2\n")
+        emulator = Emulator(1 << 20)
+        emulator.load(program)
+        emulator.call(program.symbols["main"])
+        self.assertEqual(emulator.x[10], 1)
+
+        emulator.write(program.symbols["main"], emulator.read(program.symbols["patch"], 4))
+        emulator.call(program.symbols["main"])
+        self.assertEqual(emulator.x[10], 2)
+
+    def test_errors(self):
+        with self.assertRaises(MemoryFault):
+            run("main:\n li t0, -8\n ld a0, 0(t0)\n ret\n")
+        with self.assertRaises(MemoryFault):
+            run("main:\n li t0, 0x7ffffff0\n sd a0, 0(t0)\n ret\n")
+        with self.assertRaises(EmulatorError):
+            program = assemble("main:\n j main\n")
+            emulator = Emulator(1 << 20)
+            emulator.load(program)
+            emulator.call(program.symbols["main"], max_instructions=1000)
+        with self.assertRaises(AssemblerError):
+            assemble("main:\n addi a0, a0, 5000\n")
+        with self.assertRaises(AssemblerError):
+            assemble("main:\n j nowhere\n")
+
+    def test_memory(self):
+        for use_mmap in (False, True):
+            memory = Memory(1 << 16, use_mmap)
+            array = memory.array(0x100, (2, 3))
+            array[1, 2] = 2.0
+            # Writes through the array are writes to guest memory, and back
+            self.assertEqual(memory.read(0x100 + 40, 8), bytes.fromhex("0000000000000040"))
+            memory.write(0x100, np.array([1.5]))
+            self.assertEqual(array[0, 0], 1.5)
+            self.assertEqual(memory.address_of(array[1]), 0x118)
+            self.assertEqual(memory.address_of(array.copy()), -1)
+            memory.view(0x100, 8)[:] = bytes(8)
+            self.assertEqual(array[0, 0], 0.0)
+            with self.assertRaises(MemoryFault):
+                memory.array(1 << 16, (1,))
+            with self.assertRaises(MemoryFault):
+                memory.read(-8, 8)
+
+    def test_mapped_arrays(self):
+        source = """
+        main:
+            li t0, 3
+        loop:
+            fld ft0, 0(a0)
+            fadd.d ft0, ft0, ft0
+            fsd ft0, 0(a0)
+            addi a0, a0, 8
+            addi t0, t0, -1
+            bnez t0, loop
+            ret
+        """
+        program = assemble(source)
+        for use_mmap in (False, True):
+            emulator = Emulator(1 << 20, use_mmap)
+            emulator.load(program)
+            array = emulator.array(0x8000, (3,))
+            array[:] = [1.0, 2.0, 3.0]
+            emulator.call(program.symbols["main"], [0x8000])
+            self.assertEqual(array.tolist(), [2.0, 4.0, 6.0])
+
+    def test_exit_syscall(self):
+        emulator = run("main:\n li a0, 7\n li a7, 93\n ecall\n li a0, 8\n ret\n")
+        self.assertEqual(emulator.exit_code, 7)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+from LISP.dialects import lisp
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.passes.fusion import FusedKernel, fuse
+from LISP.passes.optimization import optimize
+from xdsl.dialects.builtin import TensorType, f64
+import numpy as np
+import unittest
+
+def fused(code, **input_shapes):
+    input_types = {name: TensorType(f64, list(shape)) for name, shape in input_shapes.items()}
+    module = IRGen(input_types).ir_gen_module(LispParser(LispLexer(code)).parse_program())
+    fuse(optimize(module))
+    module.verify()
+    return list(module.body.block.ops)
+
+def run_fused(op, values):
+    # Evaluates a fused op whose operands are lisp.var or lisp.constant ops
+    def value(ssa):
+        owner = ssa.owner
+        if isinstance(owner, lisp.VarOp):
+            return values[owner.var_name.data]
+        return owner.get_value()
+
+    kernel = FusedKernel.for_op(op)
+    inputs = [value(arg) for arg in op.inputs]
+    if isinstance(op, lisp.FusedMatmulOp):
+        return kernel.matmul(value(op.lhs), value(op.rhs), *inputs)
+    return kernel(*inputs)
+
+class TestFusion(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = {
+            "A": rng.standard_normal((300, 40)),
+            "B": rng.standard_normal((300, 40)),
+            "C": rng.standard_normal((40,)),
+            "W": rng.standard_normal((40, 40)),
+        }
+
+    def test_elementwise_chain(self):
+        code = "(set P (multiply A B)) (return (subtract (add P C) (/ A 2)))"
+        ops = fused(code, A=(300, 40), B=(300, 40), C=(40,))
+        op = ops[-1].value.owner
+        A, B, C = self.values["A"], self.values["B"], self.values["C"]
+
+        self.assertIsInstance(op, lisp.FusedElementwiseOp)
+        self.assertEqual(op.kernel_tokens(), ["$0", "$1", "mul", "$2", "add", "$0", "$3", "div", "sub"])
+        # The set of P was only read once, so it is fused away too
+        self.assertFalse(any(isinstance(other, (lisp.SetOp, lisp.BinaryOperation)) for other in ops))
+        self.assertTrue(np.allclose(run_fused(op, self.values), A * B + C - A / 2))
+
+    def test_matmul_epilogue(self):
+        code = "(return (multiply (add (matmul A W) C) B))"
+        ops = fused(code, A=(300, 40), B=(300, 40), C=(40,), W=(40, 40))
+        op = ops[-1].value.owner
+        A, B, C, W = (self.values[name] for name in "ABCW")
+
+        self.assertIsInstance(op, lisp.FusedMatmulOp)
+        self.assertEqual(op.kernel_tokens(), ["$0", "$1", "add", "$2", "mul"])
+        self.assertTrue(np.allclose(run_fused(op, self.values), (A @ W + C) * B))
+
+    def test_shared_values_are_not_fused(self):
+        code = "(set S (add A B)) (return (multiply (subtract S C) S))"
+        ops = fused(code, A=(300, 40), B=(300, 40), C=(40,))
+
+        self.assertEqual(
+            [op.name for op in ops if not isinstance(op, lisp.VarOp)],
+            ["lisp.add", "lisp.set", "lisp.fused_elementwise", "lisp.return"]
+        )
+
+    def test_scalars_are_not_fused(self):
+        ops = fused("(return (* (+ x 1) y))")
+        self.assertFalse(any(isinstance(op, lisp.FusedOperation) for op in ops))
+
+    def test_single_ops_are_not_fused(self):
+        ops = fused("(return (add (matmul A W) (matmul B W)))", A=(300, 40), B=(300, 40), W=(40, 40))
+        op = ops[-1].value.owner
+
+        # Only one of the products can become the fused matmul
+        self.assertIsInstance(op, lisp.FusedMatmulOp)
+        self.assertIsInstance(op.inputs[0].owner, lisp.MatmulOp)
+
+    def test_kernel_size_limit(self):
+        code = "(set acc A)\n" + "\n".join(f"(set acc (add acc (multiply B {i})))" for i in range(100)) + "\n(return acc)"
+        ops = fused(code, A=(3, 4), B=(3, 4))
+        kernels = [op.kernel_tokens() for op in ops if isinstance(op, lisp.FusedOperation)]
+
+        self.assertGreater(len(kernels), 1)
+        self.assertTrue(all(len(kernel) <= 64 for kernel in kernels))
+
+        # Evaluate the module op by op
+        values = {"A": np.ones((3, 4)), "B": np.full((3, 4), 2.0)}
+        results = {}
+        for op in ops:
+            if isinstance(op, lisp.VarOp):
+                results[op.result] = values[op.var_name.data]
+            elif isinstance(op, lisp.ConstantOp):
+                results[op.result] = op.get_value()
+            elif isinstance(op, lisp.SetOp):
+                results[op.result] = results[op.value]
+            elif isinstance(op, lisp.FusedElementwiseOp):
+                results[op.result] = FusedKernel.for_op(op)(*(results[arg] for arg in op.inputs))
+            elif isinstance(op, lisp.BinaryOperation):
+                kernel = FusedKernel(["$0", "$1", op.name.removeprefix("lisp.")])
+                results[op.result] = kernel(results[op.lhs], results[op.rhs])
+        self.assertTrue(np.allclose(results[ops[-1].value], 1 + 2 * sum(range(100))))
+
+    def test_verify_kernel(self):
+        A = lisp.VarOp("A", TensorType(f64, [2, 2]))
+        for kernel in (["$0", "add"], ["$0", "$1", "add"], ["$0", "$0", "pow"], ["$0", "$0"]):
+            op = lisp.FusedElementwiseOp([A.result], kernel, A.result.type)
+            with self.assertRaises(Exception):
+                op.verify()
+
+    def test_kernel_blocks(self):
+        # More rows than fit in one block, with broadcast operands of both ranks
+        rng = np.random.default_rng(1)
+        A = rng.standard_normal((5000, 7))
+        row, column = rng.standard_normal(7), rng.standard_normal((5000, 1))
+        kernel = FusedKernel(["$0", "$1", "mul", "$2", "sub", "$0", "add", "$3", "div"])
+
+        result = kernel(A, row, column, 4.0)
+        self.assertTrue(np.allclose(result, (A * row - column + A) / 4.0))
+
+if __name__ == '__main__':
+    unittest.main()
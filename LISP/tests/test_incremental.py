@@ -0,0 +1,105 @@
+from LISP.frontend.incremental import IncrementalParse
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+import random
+import unittest
+
+class TestIncrementalParse(unittest.TestCase):
+    def setUp(self):
+        self.file_name = "<test_file>"
+        forms = []
+        for i in range(30):
+            # Mix single-line and multi-line forms, some sharing a line
+            if i % 3 == 0:
+                forms.append(f"(set x{i}\n  (+ {i} (* y 2)))\n")
+            else:
+                forms.append(f"(set x{i} ([[{i} 2] [3 4]])) ")
+        self.code = "".join(forms) + "(return x0)"
+
+    def full_parse(self, code):
+        return list(LispParser(LispLexer(code), self.file_name).parse_program())
+
+    def check_edit(self, parse, start, end, new_text):
+        expected_text = parse.text[:start] + new_text + parse.text[end:]
+        parse.edit(start, end, new_text)
+        self.assertEqual(parse.text, expected_text)
+        self.assertEqual(parse.forms, self.full_parse(expected_text))
+        for index in range(len(parse)):
+            start, end = parse.span(index)
+            self.assertEqual(parse.text[start], "(")
+            self.assertEqual(parse.text[end - 1], ")")
+
+    def test_initial_parse(self):
+        parse = IncrementalParse(self.code, self.file_name)
+        self.assertEqual(parse.forms, self.full_parse(self.code))
+
+    def test_edit_inside_form(self):
+        parse = IncrementalParse(self.code, self.file_name)
+        before = parse.forms
+        start = self.code.index("x4 ") + 1
+        reparsed = parse.edit(start, start + 1, "40")
+
+        self.assertEqual(reparsed, range(4, 5))
+        self.assertEqual(parse.form(4).name, "x40")
+        # Forms away from the edit are reused
+        self.assertIs(parse.form(0), before[0])
+        self.assertIs(parse.form(20), before[20])
+        self.assertEqual(parse.forms, self.full_parse(parse.text))
+
+    def test_line_and_column_shifts(self):
+        parse = IncrementalParse(self.code, self.file_name)
+        # Adds lines before the tail, then widens a line shared by several forms
+        self.check_edit(parse, 0, 0, "(set a 1)\n\n(set b\n 2)\n")
+        position = parse.text.index("(set x2 ")
+        self.check_edit(parse, position, position, "(set c 3)  ")
+        self.check_edit(parse, position, position + 11, "")
+
+    def test_insert_and_remove_forms(self):
+        parse = IncrementalParse(self.code, self.file_name)
+        start, end = parse.span(7)
+        self.check_edit(parse, start, end, "")
+        self.assertEqual(len(parse), 30)
+
+        self.check_edit(parse, len(parse.text), len(parse.text), "\n(return (+ x1 x2))")
+        self.assertEqual(len(parse), 31)
+
+        # Joins two forms into one
+        start, _ = parse.span(1)
+        _, end = parse.span(2)
+        self.check_edit(parse, start, end, "(set z (matmul x1 x2))")
+        self.assertEqual(len(parse), 30)
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        parse = IncrementalParse(self.code, self.file_name)
+        snippets = ["", " ", "\n", "7", "x", "(set q 5)", "(* 2 3)", "\n(set r\n (+ q 1))\n"]
+        for _ in range(200):
+            start = rng.randrange(len(parse.text) + 1)
+            end = min(len(parse.text), start + rng.randrange(4))
+            new_text = rng.choice(snippets)
+            edited = parse.text[:start] + new_text + parse.text[end:]
+            try:
+                expected = self.full_parse(edited)
+            except SyntaxError:
+                continue
+            parse.edit(start, end, new_text)
+            self.assertEqual(parse.forms, expected)
+
+    def test_syntax_error(self):
+        parse = IncrementalParse(self.code, self.file_name)
+        forms = parse.forms
+        start, _ = parse.span(5)
+        with self.assertRaises(SyntaxError):
+            parse.edit(start + 1, start + 1, "(")
+        with self.assertRaises(SyntaxError):
+            parse.edit(start, start + 1, "[")
+
+        # The parse is unchanged
+        self.assertEqual(parse.text, self.code)
+        self.assertEqual(parse.forms, forms)
+
+        with self.assertRaises(ValueError):
+            parse.edit(10, 5, "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+from LISP import instrumentation
+from LISP.compiler import CompileOptions, compile_source
+from LISP.emulator.runner import run_source
+from LISP.frontend.ast_table import ASTTable
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.instrumentation import Instrumentation
+import contextlib
+import json
+import numpy as np
+import unittest
+
+CODE = """
+(set W ([[1 2] [3 4]]))
+(set y (* (+ x 1) 2))
+(return (add (matmul W W) y))
+"""
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_stages(self):
+        with Instrumentation() as recorder:
+            compile_source(CODE, CompileOptions())
+        stats = recorder.stats
+
+        self.assertEqual(stats["lex"].items, len(list(LispLexer(CODE))))
+        nodes = len(ASTTable.parse(CODE))
+        self.assertEqual((stats["parse"].calls, stats["parse"].items), (3, nodes))
+        self.assertEqual(stats["location"].calls, nodes)
+        for stage in ("ir_gen", "optimize", "fuse", "lower", "print", "ast_table"):
+            self.assertGreater(stats[stage].calls, 0, stage)
+
+        # The lexing and locations the parser asks for are its children
+        parse = stats["parse"]
+        self.assertAlmostEqual(
+            parse.seconds - parse.self_seconds, stats["lex"].seconds + stats["location"].seconds, delta=1e-3
+        )
+        self.assertLess(parse.self_seconds, parse.seconds)
+
+    def test_disabled(self):
+        token = LispLexer.token
+        from_forms = ASTTable.__dict__["from_forms"]
+        with Instrumentation() as recorder:
+            self.assertIsNot(LispLexer.token, token)
+            list(LispLexer(CODE))
+            self.assertIs(instrumentation.active(), recorder)
+            with self.assertRaises(RuntimeError):
+                Instrumentation().enable()
+
+        # Every original is back, so nothing is recorded any more
+        self.assertIs(LispLexer.token, token)
+        self.assertIs(ASTTable.__dict__["from_forms"], from_forms)
+        self.assertIsNone(instrumentation.active())
+        calls = recorder.stats["lex"].calls
+        list(LispLexer(CODE))
+        self.assertEqual(recorder.stats["lex"].calls, calls)
+        self.assertIsInstance(instrumentation.span("idle"), contextlib.nullcontext)
+
+    def test_errors(self):
+        with Instrumentation(stages=("parse", "lex")) as recorder:
+            with self.assertRaises(SyntaxError):
+                list(LispParser(LispLexer("(set x 1) (set")).parse_program())
+        self.assertEqual(recorder.stats["parse"].calls, 2)
+        self.assertEqual(set(recorder.stats), {"parse", "lex"})
+
+    def test_memory_and_trace(self):
+        with Instrumentation(memory=True) as recorder:
+            with instrumentation.span("run"):
+                result = run_source("(return (matmul A A))", {"A": np.eye(16)})
+        self.assertTrue(np.allclose(result, np.eye(16)))
+
+        stats = recorder.stats
+        self.assertGreater(stats["ir_gen"].peak_bytes, 0)
+        # A span includes everything under it, memory too
+        self.assertGreaterEqual(stats["run"].peak_bytes, stats["ir_gen"].peak_bytes)
+        self.assertEqual(stats["run"].calls, 1)
+        self.assertGreater(stats["emulate"].items, 1000)
+
+        trace = json.loads(json.dumps(recorder.trace()))
+        names = [event["name"] for event in trace["traceEvents"]]
+        self.assertIn("codegen", names)
+        # Fine-grained stages are only in the totals
+        self.assertNotIn("lex", names)
+        self.assertIn("lex", trace["otherData"]["stages"])
+        run = trace["traceEvents"][names.index("run")]
+        for event in trace["traceEvents"]:
+            self.assertEqual(event["ph"], "X")
+            self.assertGreaterEqual(event["ts"], run["ts"])
+            self.assertLessEqual(event["ts"] + event["dur"], run["ts"] + run["dur"] + 1)
+        self.assertIn("emulate", recorder.report())
+
+if __name__ == '__main__':
+    unittest.main()
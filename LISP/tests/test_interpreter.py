@@ -0,0 +1,137 @@
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import LispInterpreter, compile_program, evaluate_batch, run_source
+import numpy as np
+import unittest
+
+def parse(code):
+    return list(LispParser(LispLexer(code)).parse_program())
+
+class TestLispInterpreter(unittest.TestCase):
+
+    def test_scalar_program(self):
+        code = "(set x 5)\n(set y (* (+ x 1) 2))\n(return (/ y 4))"
+        self.assertEqual(run_source(code), 3.0)
+
+    def test_program_without_return(self):
+        # The value of the last form is the result
+        self.assertEqual(run_source("(set x 2) (- x 7)"), -5.0)
+
+    def test_bindings(self):
+        interpreter = LispInterpreter({"a": 3.0, "b": np.array([1.0, 2.0])})
+        result = interpreter.run(parse("(set c (+ a b)) (return (* c c))"))
+
+        self.assertEqual(result.tolist(), [16.0, 25.0])
+        self.assertEqual(interpreter.env["c"].tolist(), [4.0, 5.0])
+
+    def test_tensor_ops(self):
+        code = (
+            "(set A ([[1 2] [3 4]]))\n"
+            "(set B ([[5 6] [7 8]]))\n"
+            "(set C (matmul A B))\n"
+            "(return (subtract (add C A) (multiply A B)))"
+        )
+        A = np.array([[1.0, 2.0], [3.0, 4.0]])
+        B = np.array([[5.0, 6.0], [7.0, 8.0]])
+        expected = (A @ B + A) - A * B
+
+        result = run_source(code)
+        self.assertIsInstance(result, np.ndarray)
+        self.assertTrue(np.array_equal(result, expected))
+
+    def test_scalar_broadcast(self):
+        code = "(set A ([[1 2] [3 4]])) (return (add (* A 2) (matmul 10 A)))"
+        self.assertEqual(run_source(code).tolist(), [[12.0, 24.0], [36.0, 48.0]])
+
+        # Broadcasting a row across a matrix follows NumPy rules
+        code = "(return (subtract ([[1 2] [3 4]]) ([1 1])))"
+        self.assertEqual(run_source(code).tolist(), [[0.0, 1.0], [2.0, 3.0]])
+
+    def test_errors(self):
+        with self.assertRaises(NameError) as cm:
+            run_source("(set x 1)\n(return (+ x y))", file_name="<test_file>")
+        self.assertIn("<test_file>:2:14", str(cm.exception))
+
+        with self.assertRaises(ValueError) as cm:
+            run_source("(matmul ([[1 2 3]]) ([[1 2 3]]))", file_name="<test_file>")
+        self.assertIn("<test_file>:1:2: matmul", str(cm.exception))
+
+
+class TestCompiledProgram(unittest.TestCase):
+
+    def test_matches_interpreter(self):
+        code = (
+            "(set A ([[1 2] [3 4]]))\n"
+            "(set y (* (+ x 1) 2))\n"
+            "(set C (matmul A (multiply A y)))\n"
+            "(return (subtract C x))"
+        )
+        program = compile_program(parse(code))
+
+        # The compiled program is reusable across inputs
+        for x in (0.0, 1.5, -3.0):
+            expected = LispInterpreter({"x": x}).run(parse(code))
+            self.assertTrue(np.array_equal(program({"x": x}), expected))
+
+    def test_runs_are_independent(self):
+        program = compile_program(parse("(set y (+ x 1)) (set y (* y 2))"))
+        self.assertEqual(program({"x": 1.0}), 4.0)
+        self.assertEqual(program({"x": 1.0}), 4.0)
+
+        # Top-level forms after the first return never run
+        program = compile_program(parse("(return 1) (return undefined)"))
+        self.assertEqual(program(), 1.0)
+
+    def test_errors(self):
+        program = compile_program(parse("(set x 1)\n(return (+ x y))"))
+        with self.assertRaises(NameError) as cm:
+            program()
+        self.assertIn(":2:14", str(cm.exception))
+
+class TestBatchInterpreter(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.batch = 5
+        self.columns = {
+            "x": rng.standard_normal(self.batch),
+            "v": rng.standard_normal((self.batch, 2)),
+            "M": rng.standard_normal((self.batch, 2, 2)),
+        }
+
+    def assert_matches_per_record(self, code):
+        program = parse(code)
+        result = evaluate_batch(program, self.columns)
+
+        self.assertEqual(result.shape[0], self.batch)
+        for i in range(self.batch):
+            record = {name: column[i] for name, column in self.columns.items()}
+            expected = LispInterpreter(record).run(program)
+            np.testing.assert_allclose(result[i], expected)
+
+    def test_scalar_columns(self):
+        self.assert_matches_per_record("(set y (* (+ x 1) x)) (return (/ y 4))")
+
+    def test_broadcast_against_literals(self):
+        # A batched scalar or vector against an unbatched matrix
+        self.assert_matches_per_record("(return (add (multiply x ([[1 2] [3 4]])) v))")
+
+    def test_matmul(self):
+        self.assert_matches_per_record("(return (matmul M ([[1 2] [3 4]])))")
+        self.assert_matches_per_record("(return (matmul ([[1 2] [3 4]]) M))")
+        self.assert_matches_per_record("(return (matmul M M))")
+        self.assert_matches_per_record("(return (matmul M v))")
+        self.assert_matches_per_record("(return (matmul v M))")
+        self.assert_matches_per_record("(return (matmul v v))")
+        self.assert_matches_per_record("(return (matmul x M))")
+
+    def test_constant_result(self):
+        # Results that do not depend on the inputs are still one per record
+        result = evaluate_batch(parse("(return (+ 1 2))"), self.columns)
+        self.assertEqual(result.tolist(), [3.0] * self.batch)
+
+    def test_mismatched_columns(self):
+        with self.assertRaises(ValueError):
+            evaluate_batch(parse("(return x)"), {"x": np.zeros(3), "y": np.zeros(4)})
+
+if __name__ == "__main__":
+    unittest.main()
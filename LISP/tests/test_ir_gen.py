@@ -0,0 +1,121 @@
+from LISP.dialects import lisp
+from LISP.frontend.ir_gen import IRGen, IRGenError
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from xdsl.context import Context
+from xdsl.dialects.builtin import Builtin, TensorType, f64
+from xdsl.parser import Parser
+import math
+import numpy as np
+import unittest
+
+def ir_gen(code, input_types=None):
+    program = LispParser(LispLexer(code)).parse_program()
+    return IRGen(input_types).ir_gen_module(program)
+
+def op_names(module):
+    return [op.name for op in module.body.block.ops]
+
+class TestIRGen(unittest.TestCase):
+
+    def test_scalar_program(self):
+        module = ir_gen("(set x 5)\n(set y (* (+ x 1) 2))\n(return (/ y 4))")
+        module.verify()
+
+        self.assertEqual(op_names(module), [
+            "lisp.constant", "lisp.set",
+            "lisp.constant", "lisp.add", "lisp.constant", "lisp.mul", "lisp.set",
+            "lisp.constant", "lisp.div", "lisp.return",
+        ])
+
+    def test_variables_use_latest_set(self):
+        module = ir_gen("(set x 1) (set x (+ x 2)) (return x)")
+        ops = list(module.body.block.ops)
+
+        first_set, second_set, ret = ops[1], ops[4], ops[5]
+        self.assertIs(ops[3].lhs, first_set.result)
+        self.assertIs(ret.value, second_set.result)
+        self.assertEqual(second_set.var_name.data, "x")
+
+    def test_scalar_constants_are_shared(self):
+        module = ir_gen("(set x (+ 2 2)) (return (* x 2))")
+        constants = [op for op in module.body.block.ops if isinstance(op, lisp.ConstantOp)]
+        self.assertEqual(len(constants), 1)
+        self.assertEqual(constants[0].get_value(), 2.0)
+
+    def test_signed_zero_constants_are_distinct(self):
+        module = ir_gen("(return (+ (/ 1 0) (/ 1 -0)))")
+        constants = [op.get_value() for op in module.body.block.ops if isinstance(op, lisp.ConstantOp)]
+        self.assertEqual([math.copysign(1.0, value) for value in constants if value == 0], [1.0, -1.0])
+
+    def test_free_variables_are_inputs(self):
+        module = ir_gen("(return (add W b))", {"W": TensorType(f64, [2, 3])})
+        module.verify()
+        W, b, add, _ = module.body.block.ops
+
+        self.assertEqual((W.var_name.data, b.var_name.data), ("W", "b"))
+        self.assertEqual(W.result.type, TensorType(f64, [2, 3]))
+        self.assertEqual(b.result.type, f64)
+        # Scalars broadcast against tensors
+        self.assertEqual(add.result.type, TensorType(f64, [2, 3]))
+
+    def test_tensor_types(self):
+        code = (
+            "(set A ([[1 2 3] [4 5 6]]))\n"
+            "(set B ([[1] [2] [3]]))\n"
+            "(set C (matmul A B))\n"
+            "(return (multiply C ([1])))"
+        )
+        module = ir_gen(code)
+        module.verify()
+        ops = list(module.body.block.ops)
+
+        self.assertTrue(np.array_equal(ops[0].get_value(), [[1, 2, 3], [4, 5, 6]]))
+        self.assertEqual(ops[4].name, "lisp.matmul")
+        self.assertEqual(ops[4].result.type, TensorType(f64, [2, 1]))
+        self.assertEqual(ops[7].result.type, TensorType(f64, [2, 1]))
+
+    def test_first_return_ends_the_program(self):
+        module = ir_gen("(return 1) (set x 2)")
+        self.assertEqual(op_names(module), ["lisp.constant", "lisp.return"])
+
+    def test_round_trip(self):
+        module = ir_gen("(set A ([[1 2] [3 4]])) (return (matmul A (+ A x)))")
+
+        ctx = Context()
+        ctx.load_dialect(Builtin)
+        ctx.load_dialect(lisp.LispDialect)
+        parsed = Parser(ctx, str(module)).parse_module()
+
+        parsed.verify()
+        self.assertTrue(parsed.is_structurally_equivalent(module))
+
+    def test_locations(self):
+        program = LispParser(LispLexer("(set x 5)\n(return (+ x y))"), "prog.lisp").parse_program()
+        ir_gen = IRGen()
+        module = ir_gen.ir_gen_module(program)
+        # Nothing is attached until asked for
+        self.assertTrue(all(lisp.get_location(op) is None for op in module.body.block.ops))
+
+        ir_gen.attach_locations(module)
+        self.assertEqual([lisp.get_location(op) for op in module.body.block.ops], [
+            "prog.lisp:1:8", "prog.lisp:1:2", "prog.lisp:2:14", "prog.lisp:2:10", "prog.lisp:2:2",
+        ])
+
+    def test_errors(self):
+        with self.assertRaisesRegex(IRGenError, r"<stdin>:1:\d+: matmul: matmul inner dimensions differ"):
+            ir_gen("(return (matmul ([[1 2]]) ([[1 2]])))")
+        with self.assertRaisesRegex(IRGenError, r"<stdin>:1:\d+: add: .*broadcast"):
+            ir_gen("(return (add ([1 2]) ([1 2 3])))")
+        with self.assertRaisesRegex(IRGenError, "only allowed at the top level"):
+            ir_gen("(set x (return 1))")
+
+    def test_verify_rejects_wrong_result_type(self):
+        lhs = lisp.ConstantOp(np.ones((2, 2)))
+        rhs = lisp.ConstantOp(np.ones((2, 3)))
+        bad = lisp.MatmulOp.create(operands=[lhs.result, rhs.result], result_types=[f64])
+        with self.assertRaises(Exception):
+            bad.verify()
+
+if __name__ == '__main__':
+    unittest.main()
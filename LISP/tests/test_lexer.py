@@ -1,4 +1,6 @@
 from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from concurrent.futures import ThreadPoolExecutor
 import unittest
 
 class TestLispLexer(unittest.TestCase):
@@ -230,3 +232,97 @@ class TestLispLexer(unittest.TestCase):
             "SQUARE_BRACKET_CLOSE", "PARENTHESE_CLOSE", "PARENTHESE_CLOSE", "EOF"
         ]
         self.assertEqual([token.type for token in tokens] + ["EOF"], expected_token_kinds)
+
+    def test_lexers_share_tables_but_not_state(self):
+        first = LispLexer("(set x 1)")
+        second = LispLexer("(return y)")
+
+        # Both instances are cloned from the same compiled master regex
+        self.assertIs(first.lexer.lexre[0][0], second.lexer.lexre[0][0])
+
+        # but every rule is bound to the LispLexer that owns the clone
+        rules = [rule for _, rules in first.lexer.lexre for rule in rules if rule and rule[0]]
+        self.assertTrue(rules)
+        for rule, _ in rules:
+            self.assertIs(rule.__self__, first)
+        self.assertIs(first.lexer.lexerrorf.__self__, first)
+
+        # Interleaved lexing must not leak position or input between instances
+        self.assertEqual(first.token().type, "PARENTHESE_OPEN")
+        self.assertEqual(second.token().type, "PARENTHESE_OPEN")
+        self.assertEqual(first.token().type, "SET")
+        self.assertEqual(second.token().type, "RETURN")
+
+    def test_lexer_thread_safety(self):
+        text = "(* (+ 1 2) (+ x y))"
+        expected = [token.type for token in LispLexer(text)]
+
+        def lex_types(_):
+            return [token.type for token in LispLexer(text)]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lex_types, range(200)))
+
+        for result in results:
+            self.assertEqual(result, expected)
+
+    def test_bulk_tensor_data(self):
+        rows = "\n".join("[" + " ".join(f"{i}.5 -{j}e-1" for j in range(8)) + "]" for i in range(64))
+        text = f"(set W ([{rows}]))"
+        lexer = LispLexer(text)
+        tokens = list(lexer)
+
+        # The whole numeric block comes back as one token carrying the array
+        self.assertEqual(
+            [token.type for token in tokens],
+            ["PARENTHESE_OPEN", "SET", "IDENTIFIER", "PARENTHESE_OPEN", "TENSOR_DATA", "PARENTHESE_CLOSE", "PARENTHESE_CLOSE"]
+        )
+        data = tokens[4].value
+        self.assertEqual(data.shape, (64, 16))
+        self.assertEqual(data[3, 0], 3.5)
+        self.assertEqual(data[3, 3], -0.1)
+
+    def test_bulk_tensor_data_fallback(self):
+        # A ragged block is left to the per-token rules
+        text = "([" + " ".join("[1 2 3]" for _ in range(1000)) + " [1 2]])"
+        lexer = LispLexer(text)
+        lexer.bulk_tensor_min_size = 64
+        types = [token.type for token in lexer]
+
+        self.assertNotIn("TENSOR_DATA", types)
+        self.assertEqual(types.count("NUMBER"), 3002)
+
+    def test_bulk_tensor_data_multiline_rows(self):
+        def parse(row):
+            return list(LispParser(LispLexer(f"(set x ([[{row}\n{row}] []]))")).parse_program())
+
+        # A row spanning two lines is still one row, so both sizes are ragged
+        for row in ("1 2", " ".join(["1"] * 1500)):
+            with self.subTest(size=len(row)):
+                with self.assertRaisesRegex(SyntaxError, "ragged tensor literal"):
+                    parse(row)
+
+        rows = " ".join("[" + "\n".join(["1 2"] * 500) + "]" for _ in range(3))
+        tokens = list(LispLexer(f"([{rows}])"))
+        self.assertEqual(tokens[1].type, "TENSOR_DATA")
+        self.assertEqual(tokens[1].value.shape, (3, 1000))
+
+    def test_bulk_tensor_data_matches_number_rule(self):
+        def lex(number):
+            text = "([" + " ".join("[1 2.5 -3e2]" for _ in range(1000)) + f" [1 2 {number}]])"
+            lexer = LispLexer(text)
+            lexer.bulk_tensor_min_size = 64
+            return list(lexer)
+
+        tokens = lex("1.e+5")
+        self.assertEqual(tokens[1].type, "TENSOR_DATA")
+        self.assertEqual(tokens[1].value[-1, 2], 1e5)
+
+        # loadtxt would read these, but NUMBER does not, so neither does the bulk path
+        for number in (".5", "+5", "nan", "1.5.5", "2-1"):
+            with self.subTest(number=number):
+                try:
+                    types = [token.type for token in lex(number)]
+                except SyntaxError:
+                    continue
+                self.assertNotIn("TENSOR_DATA", types)
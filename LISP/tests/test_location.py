@@ -0,0 +1,38 @@
+from xdsl.utils.lexer import Input, Span, Token
+from xdsl.utils.mlir_lexer import MLIRTokenKind
+
+from LISP.frontend.location import LineIndex, Location, loc
+import unittest
+
+class TestLocation(unittest.TestCase):
+
+    def test_line_index(self):
+        text = "(set x 1)\n(set y 2)\n\n(return y)"
+        index = LineIndex(text)
+
+        self.assertEqual(index.line_starts.tolist(), [0, 10, 20, 21])
+        self.assertEqual(index.line_starts.itemsize, 8)
+        self.assertEqual(index.line_col(0), (1, 1))
+        self.assertEqual(index.line_col(5), (1, 6))
+        # The newline itself belongs to the line it terminates
+        self.assertEqual(index.line_col(9), (1, 10))
+        self.assertEqual(index.line_col(10), (2, 1))
+        self.assertEqual(index.line_col(21), (4, 1))
+        self.assertEqual(index.location("<test_file>", 29), Location("<test_file>", 4, 9))
+
+    def test_parse(self):
+        location = Location("C:/src/prog.lisp", 12, 3)
+        self.assertEqual(Location.parse(repr(location)), location)
+
+    def test_loc_from_token(self):
+        source = Input("(set x 1)\n(return x)", "<test_file>")
+
+        # A token on the last line, which has no trailing newline
+        token = Token(MLIRTokenKind.BARE_IDENT, Span(18, 19, source))
+        self.assertEqual(loc(token), Location("<test_file>", 2, 9))
+
+        token = Token(MLIRTokenKind.BARE_IDENT, Span(5, 6, source))
+        self.assertEqual(loc(token), Location("<test_file>", 1, 6))
+
+if __name__ == "__main__":
+    unittest.main()
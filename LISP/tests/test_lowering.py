@@ -0,0 +1,153 @@
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.interpreter import run_source
+from LISP.passes.fusion import fuse
+from LISP.passes.lowering import LoweringError, lower
+from LISP.passes.optimization import optimize
+from xdsl.dialects import arith, func, memref, scf
+from xdsl.dialects.builtin import TensorType, f64
+from xdsl.interpreter import Interpreter, InterpreterFunctions, impl, register_impls
+from xdsl.interpreters.arith import ArithFunctions
+from xdsl.interpreters.builtin import BuiltinFunctions
+from xdsl.interpreters.func import FuncFunctions
+from xdsl.interpreters.memref import MemRefFunctions
+from xdsl.interpreters.scf import ScfFunctions
+from xdsl.interpreters.shaped_array import ShapedArray
+from xdsl.interpreters.utils.ptr import TypedPtr
+import numpy as np
+import unittest
+
+@register_impls
+class MissingArithFunctions(InterpreterFunctions):
+    # Ops the lowering emits that xDSL's interpreter does not implement
+
+    @impl(arith.DivfOp)
+    def run_divf(self, interpreter, op, args):
+        return (args[0] / args[1],)
+
+    @impl(arith.MinSIOp)
+    def run_minsi(self, interpreter, op, args):
+        return (min(args),)
+
+def lowered(code, tile_sizes=(2, 2, 2), passes=(optimize, fuse), accelerate=False, **input_shapes):
+    input_types = {name: TensorType(f64, list(shape)) for name, shape in input_shapes.items()}
+    module = IRGen(input_types).ir_gen_module(LispParser(LispLexer(code)).parse_program())
+    for apply in passes:
+        apply(module)
+    statistics = lower(module, tile_sizes, accelerate)
+    module.verify()
+    return module, statistics
+
+def execute(module, **values):
+    interpreter = Interpreter(module)
+    for functions in (ArithFunctions(), BuiltinFunctions(), FuncFunctions(),
+                      MemRefFunctions(), ScfFunctions(), MissingArithFunctions()):
+        interpreter.register_implementations(functions)
+
+    main = next(op for op in module.body.block.ops if isinstance(op, func.FuncOp))
+    args = []
+    for arg in main.body.block.args:
+        value = values[arg.name_hint]
+        if isinstance(value, np.ndarray):
+            value = ShapedArray(TypedPtr.new(value.ravel().tolist(), xtype=f64), list(value.shape))
+        args.append(value)
+
+    result, = interpreter.call_op("main", tuple(args))
+    if isinstance(result, ShapedArray):
+        return np.array(result.data).reshape(result.shape)
+    return result
+
+class TestLowering(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = {
+            "A": rng.standard_normal((5, 3)),
+            "B": rng.standard_normal((3, 4)),
+            "C": rng.standard_normal(4),
+            "v": rng.standard_normal(3),
+            "x": 1.5,
+        }
+
+    def check(self, code, module):
+        expected = run_source(code, self.values)
+        self.assertTrue(np.allclose(execute(module, **self.values), expected))
+
+    def test_scalar_program(self):
+        code = "(set y (* (+ x 1) 2)) (return (/ y 4))"
+        module, _ = lowered(code, passes=())
+
+        main, = module.body.block.ops
+        self.assertEqual([op.name for op in main.body.block.ops],
+                         ["arith.constant", "arith.addf", "arith.constant", "arith.mulf",
+                          "arith.constant", "arith.divf", "func.return"])
+        self.check(code, module)
+
+    def test_elementwise_broadcast(self):
+        for passes in ((), (optimize, fuse)):
+            code = "(return (subtract (multiply (matmul A B) C) ([[1] [2] [3] [4] [5]])))"
+            module, _ = lowered(code, passes=passes, A=(5, 3), B=(3, 4), C=(4,))
+            self.check(code, module)
+
+    def test_constants_are_globals(self):
+        code = "(set W ([[1 2] [3 4] [5 6]])) (return (matmul A W))"
+        module, _ = lowered(code, A=(5, 3))
+        ops = list(module.body.block.ops)
+
+        self.assertIsInstance(ops[0], memref.GlobalOp)
+        self.check(code, module)
+
+    def test_tiled_matmul(self):
+        code = "(return (matmul A B))"
+        for tile_sizes in ((2, 2, 2), (4, 3, 0), (0, 0, 0), (64, 64, 64)):
+            module, statistics = lowered(code, tile_sizes, A=(5, 3), B=(3, 4))
+            self.check(code, module)
+
+        module, statistics = lowered(code, (2, 3, 2), A=(5, 3), B=(3, 4))
+        self.assertEqual(statistics.matmuls, 1)
+        self.assertEqual(statistics.matmul_tiles, [((5, 4, 3), (2, 3, 2))])
+        # ceil(5 / 2) * ceil(4 / 3) * ceil(3 / 2) tiles, each with its own 3 element loops
+        self.assertEqual(statistics.tiles, 12)
+        self.assertEqual(statistics.max_depth, 6)
+        for_ops = [op for op in module.walk() if isinstance(op, scf.ForOp)]
+        self.assertEqual(len(for_ops), statistics.loops)
+
+    def test_untiled_matmul(self):
+        module, statistics = lowered("(return (matmul A B))", (0, 0, 0), A=(5, 3), B=(3, 4))
+        self.assertEqual(statistics.tiles, 1)
+        self.assertEqual(statistics.max_depth, 3)
+
+    def test_vector_matmul(self):
+        for code in ("(return (matmul A v))", "(return (matmul v B))", "(return (matmul v v))"):
+            module, _ = lowered(code, A=(5, 3), B=(3, 4), v=(3,))
+            self.check(code, module)
+
+    def test_fused_matmul_in_place(self):
+        code = "(return (add (matmul A B) C))"
+        module, statistics = lowered(code, A=(5, 3), B=(3, 4), C=(4,))
+
+        self.assertEqual(statistics.allocations, 1)
+        self.check(code, module)
+
+    def test_accelerator_calls(self):
+        code = "(return (subtract (multiply (matmul A B) D) C))"
+        module, statistics = lowered(code, passes=(), accelerate=True, A=(5, 3), B=(3, 4), C=(4,), D=(5, 4))
+
+        *declarations, main = module.body.block.ops
+        self.assertEqual([op.sym_name.data for op in declarations], ["lisp_accel_matmul", "lisp_accel_multiply"])
+        self.assertTrue(all(op.is_declaration for op in declarations))
+        calls = [op for op in main.walk() if isinstance(op, func.CallOp)]
+        self.assertEqual([op.callee.string_value() for op in calls], ["lisp_accel_matmul", "lisp_accel_multiply"])
+        self.assertEqual(statistics.accelerator_calls, 2)
+        # The subtract broadcasts C, which the accelerator does not
+        self.assertEqual(statistics.loop_nests, 1)
+
+    def test_unsupported(self):
+        with self.assertRaises(LoweringError):
+            lowered("(return (matmul A A))", A=(2, 2, 2))
+        with self.assertRaises(LoweringError):
+            lowered("(return 1)", (32, 32))
+
+if __name__ == '__main__':
+    unittest.main()
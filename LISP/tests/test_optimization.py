@@ -0,0 +1,68 @@
+from LISP.dialects import lisp
+from LISP.frontend.ir_gen import IRGen
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parser import LispParser
+from LISP.passes.optimization import optimize
+import numpy as np
+import unittest
+
+def optimized(code, **options):
+    module = IRGen().ir_gen_module(LispParser(LispLexer(code)).parse_program())
+    optimize(module, **options)
+    module.verify()
+    return list(module.body.block.ops)
+
+def returned(ops):
+    ret = ops[-1]
+    assert isinstance(ret, lisp.ReturnOp)
+    return ret.value.owner
+
+class TestOptimization(unittest.TestCase):
+
+    def test_fold_scalars(self):
+        ops = optimized("(set x 5) (set y (* (+ x 1) 2)) (return (/ y 4))")
+
+        self.assertEqual([op.name for op in ops], ["lisp.constant", "lisp.return"])
+        self.assertEqual(returned(ops).get_value(), 3.0)
+
+    def test_fold_matmul(self):
+        code = (
+            "(set A ([[1 2] [3 4]]))\n"
+            "(set B ([[5 6] [7 8]]))\n"
+            "(return (add (matmul A B) 1))"
+        )
+        ops = optimized(code)
+        A = np.array([[1.0, 2.0], [3.0, 4.0]])
+        B = np.array([[5.0, 6.0], [7.0, 8.0]])
+
+        self.assertEqual(len(ops), 2)
+        self.assertTrue(np.array_equal(returned(ops).get_value(), A @ B + 1))
+
+    def test_fold_size_limit(self):
+        ops = optimized("(return (matmul ([[1] [2]]) ([[1 2]])))", max_fold_elements=3)
+        self.assertIsInstance(returned(ops), lisp.MatmulOp)
+
+    def test_division_by_zero_is_not_folded(self):
+        ops = optimized("(return (/ 1 0))")
+        self.assertIsInstance(returned(ops), lisp.DivOp)
+
+    def test_common_subexpressions(self):
+        ops = optimized("(set a (+ x 1)) (set b (+ x 1)) (return (* a b))")
+        adds = [op for op in ops if isinstance(op, lisp.AddOp)]
+
+        self.assertEqual(len(adds), 1)
+        mul = returned(ops)
+        # Both names still bind the one remaining add
+        self.assertIs(mul.lhs.owner.value, adds[0].result)
+        self.assertIs(mul.rhs.owner.value, adds[0].result)
+
+    def test_dead_sets(self):
+        ops = optimized("(set unused (* x 3)) (set x (+ x 1)) (set x (* x x)) (return y)")
+        self.assertEqual([op.name for op in ops], ["lisp.var", "lisp.return"])
+
+    def test_implicit_return_is_kept(self):
+        ops = optimized("(set a (+ x 1)) (* a 2)")
+        self.assertIsInstance(returned(ops), lisp.MulOp)
+
+if __name__ == '__main__':
+    unittest.main()
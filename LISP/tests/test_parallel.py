@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.parallel import parse_parallel, split_top_level
+from LISP.frontend.parser import LispParser
+import unittest
+
+class TestParallelParser(unittest.TestCase):
+    def setUp(self):
+        self.file_name = "<test_file>"
+        forms = []
+        for i in range(200):
+            # Mix single-line and multi-line forms, some sharing a line
+            if i % 3 == 0:
+                forms.append(f"(set x{i}\n  (+ {i} (* y 2)))\n")
+            else:
+                forms.append(f"(set x{i} ([[{i} 2] [3 4]])) ")
+        self.code = "".join(forms) + "(return x0)"
+
+    def serial_parse(self, code):
+        parser = LispParser(LispLexer(code), self.file_name)
+        return list(parser.parse_program())
+
+    def test_split_top_level(self):
+        code = "(set a (+ 1 2)) (set b 3)\n(return (* a b))"
+        starts = split_top_level(code, 8)
+
+        self.assertEqual(starts[0], 0)
+        self.assertEqual(starts, sorted(set(starts)))
+        # Every chunk holds whole forms only
+        for start, end in zip(starts, starts[1:] + [len(code)]):
+            chunk = code[start:end]
+            self.assertEqual(chunk.count("("), chunk.count(")"))
+
+    def test_parse_parallel_matches_serial(self):
+        expected = self.serial_parse(self.code)
+
+        # Threads exercise the chunking and merging without process start-up cost
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            forms = parse_parallel(self.code, self.file_name, max_workers=4, executor=pool, min_chunk_size=64)
+
+        # Same forms, in the same order, with locations in the original file
+        self.assertEqual(forms, expected)
+
+    def test_parse_parallel_processes(self):
+        expected = self.serial_parse(self.code)
+        forms = parse_parallel(self.code, self.file_name, max_workers=2, min_chunk_size=64)
+        self.assertEqual(forms, expected)
+
+    def test_parse_parallel_error(self):
+        with self.assertRaises(SyntaxError):
+            parse_parallel(self.code + " (set", self.file_name, max_workers=2, min_chunk_size=64)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 from LISP.frontend.lexer import LispLexer
 from LISP.frontend.lisp_ast import *
 from LISP.frontend.parser import LispParser
+import numpy as np
 import unittest
 
 class TestLispParser(unittest.TestCase):
@@ -96,7 +97,7 @@ class TestLispParser(unittest.TestCase):
         ast = parser.parse()
         self.assertIsInstance(ast, TensorLiteralExprAST)
 
-        self.assertEqual(ast.elements, [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(ast.elements.tolist(), [[1.0, 2.0], [3.0, 4.0]])
         self.assertEqual(ast.tensor_type.shape, [2, 2])
 
     def test_tensor_var_decl(self):
@@ -109,7 +110,49 @@ class TestLispParser(unittest.TestCase):
         self.assertIsInstance(ast, VarDeclExprAST)
         self.assertEqual(ast.name, "A")
         self.assertIsInstance(ast.expr, TensorLiteralExprAST)
-        self.assertEqual(ast.expr.elements, [[1.0, 2.0], [3.0, 4.0]])
+        self.assertEqual(ast.expr.elements.tolist(), [[1.0, 2.0], [3.0, 4.0]])
+
+    def test_tensor_literal_any_rank(self):
+        # Vectors and higher-rank tensors are parsed as well as matrices
+        ast = LispParser(LispLexer("([1 -2 3.5])"), self.file_name).parse()
+        self.assertEqual(ast.tensor_type.shape, [3])
+        self.assertEqual(ast.elements.tolist(), [1.0, -2.0, 3.5])
+
+        code = "([[[1 2] [3 4] [5 6]] [[7 8] [9 10] [11 12]]])"
+        ast = LispParser(LispLexer(code), self.file_name).parse()
+        self.assertEqual(ast.tensor_type.shape, [2, 3, 2])
+        self.assertEqual(ast.elements.dtype, np.float64)
+        self.assertTrue(ast.elements.flags.c_contiguous)
+        self.assertEqual(ast.elements[1, 2, 0], 11.0)
+
+    def test_tensor_literal_ragged(self):
+        code = "(set A\n  ([[1 2] [3 4 5]]))"
+        parser = LispParser(LispLexer(code), self.file_name)
+
+        with self.assertRaises(SyntaxError) as cm:
+            parser.parse()
+        # The error points at the offending row
+        self.assertIn("<test_file>:2:11", str(cm.exception))
+        self.assertIn("ragged", str(cm.exception))
+
+        code = "([[1 2] [[3] [4]]])"
+        with self.assertRaises(SyntaxError):
+            LispParser(LispLexer(code), self.file_name).parse()
+
+    def test_bulk_tensor_literal(self):
+        data = np.arange(24, dtype=np.float64).reshape(2, 3, 4) - 5
+        code = "(set W (" + np.array2string(data, separator=" ", threshold=100).replace("\n", "") + "))"
+        lexer = LispLexer(code)
+        lexer.bulk_tensor_min_size = 16
+        ast = LispParser(lexer, self.file_name).parse()
+
+        # Same node as the token-by-token path would build
+        self.assertEqual(ast.expr.tensor_type.shape, [2, 3, 4])
+        self.assertTrue(np.array_equal(ast.expr.elements, data))
+        self.assertEqual(ast.expr.loc, Location(self.file_name, 1, 9))
+
+        expected = LispParser(LispLexer(code), self.file_name).parse()
+        self.assertEqual(ast, expected)
 
     def test_tensor_op_matmul(self):
         # Test tensor operation: (matmul A B)
@@ -148,5 +191,46 @@ class TestLispParser(unittest.TestCase):
         self.assertIsInstance(ast, NumberExprAST)
         self.assertEqual(ast.val, 5)
 
+    def test_locations(self):
+        code = "(set x\n  (+ y\n     2))"
+        lexer = LispLexer(code)
+        parser = LispParser(lexer, self.file_name)
+
+        ast = parser.parse()
+        # Nodes are located at their leading token
+        self.assertEqual(ast.loc, Location(self.file_name, 1, 2))
+        self.assertEqual(ast.expr.loc, Location(self.file_name, 2, 4))
+        self.assertEqual(ast.expr.lhs.loc, Location(self.file_name, 2, 6))
+        self.assertEqual(ast.expr.rhs.loc, Location(self.file_name, 3, 6))
+
+    def test_parse_program(self):
+        code = "(set x 5)\n(set y (+ x 2))\n(return y)"
+        lexer = LispLexer(code)
+        parser = LispParser(lexer, self.file_name)
+
+        forms = list(parser.parse_program())
+        self.assertEqual(len(forms), 3)
+        self.assertIsInstance(forms[0], VarDeclExprAST)
+        self.assertIsInstance(forms[1], VarDeclExprAST)
+        self.assertIsInstance(forms[2], ReturnExprAST)
+        self.assertEqual(forms[2].loc, Location(self.file_name, 3, 2))
+
+    def test_parse_program_is_lazy(self):
+        code = "(set x 5) (set y 6) (return"
+        lexer = LispLexer(code)
+        parser = LispParser(lexer, self.file_name)
+        forms = parser.parse_program()
+
+        # The first form is available before the rest of the input is lexed
+        first = next(forms)
+        self.assertEqual(first.name, "x")
+        self.assertLessEqual(lexer.lexer.lexpos, len("(set x 5) ("))
+
+        self.assertEqual(next(forms).name, "y")
+
+        # The truncated last form only fails once it is reached
+        with self.assertRaises(SyntaxError):
+            next(forms)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
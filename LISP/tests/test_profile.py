@@ -0,0 +1,90 @@
+from LISP.compiler import CompileOptions
+from LISP.emulator.assembler import assemble
+from LISP.emulator.emulator import Emulator
+from LISP.emulator.profile import CostModel, Profile
+from LISP.emulator.runner import build_program, new_emulator, run_program
+from LISP.frontend.location import Location
+import json
+import numpy as np
+import unittest
+
+LOOP = """
+main:
+    li t0, 1000
+    la t1, buffer
+loop:
+    sd t0, 0(t1)
+    ld t2, 0(t1)
+    addi t0, t0, -1
+    bnez t0, loop
+    ret
+    .data
+buffer:
+    .dword 0
+"""
+
+def run(source, profile):
+    program = assemble(source)
+    emulator = Emulator(1 << 20)
+    emulator.profile = profile
+    emulator.load(program)
+    emulator.call(program.symbols["main"])
+    return emulator
+
+class TestProfile(unittest.TestCase):
+
+    def test_counters(self):
+        profile = Profile()
+        emulator = run(LOOP, profile)
+
+        # li is one addi, la a lui and an addi
+        self.assertEqual(profile.histogram(), {"addi": 1002, "sd": 1000, "ld": 1000, "bne": 1000, "lui": 1, "jalr": 1})
+        counters = profile.counters()
+        self.assertEqual(counters["instructions"], emulator.instret)
+        self.assertEqual(counters["loads"], 1000)
+        self.assertEqual(counters["bytes_stored"], 8000)
+        self.assertEqual(counters["blocks"], 3)
+        self.assertEqual(counters["cycles"], 1002 + 1000 * 1 + 1000 * 3 + 1000 * 1 + 1 + 2)
+
+        # The first iteration runs in the entry block
+        hottest = profile.hot_blocks(1)[0]
+        self.assertEqual((hottest.executions, hottest.instructions), (999, 3996))
+
+    def test_cost_model(self):
+        profile = Profile(CostModel(load=100))
+        run(LOOP, profile)
+        self.assertEqual(profile.counters()["cycles"], 1002 + 1000 + 1000 * 100 + 1000 + 1 + 2)
+
+    def test_disabled(self):
+        profile = Profile()
+        emulator = run(LOOP, profile)
+        emulator.profile = None
+        emulator.call(assemble(LOOP).symbols["main"])
+        # Only the first run was counted
+        self.assertEqual(2 * profile.counters()["instructions"], emulator.instret)
+
+    def test_source_locations(self):
+        code = "(set x (* y 2))\n(return (matmul A (multiply B x)))"
+        options = CompileOptions.create({"A": (8, 8), "B": (8, 8)}, fuse=False)
+        machine = build_program(code, options, "prog.lisp")
+        emulator = new_emulator(machine)
+        emulator.profile = Profile()
+        A, B = np.eye(8), np.arange(64.0).reshape(8, 8)
+        self.assertTrue(np.allclose(run_program(machine, {"A": A, "B": B, "y": 0.5}, emulator), B))
+
+        # The matmul loop nest is the hottest code
+        hottest = emulator.profile.hot_blocks(1, machine)[0]
+        self.assertEqual(hottest.location, Location("prog.lisp", 2, 10))
+        locations = emulator.profile.by_location(machine)
+        self.assertEqual(locations[0][0], Location("prog.lisp", 2, 10))
+        self.assertEqual(locations[1][0], Location("prog.lisp", 2, 20))
+        self.assertEqual(sum(entry[1] for entry in locations), emulator.instret)
+
+        exported = json.loads(emulator.profile.to_json(machine, hot_blocks=3))
+        self.assertEqual(len(exported["hot_blocks"]), 3)
+        self.assertEqual(exported["hot_blocks"][0]["location"], "prog.lisp:2:10")
+        self.assertEqual(exported["counters"]["instructions"], emulator.instret)
+        self.assertAlmostEqual(sum(entry["share"] for entry in exported["locations"]), 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
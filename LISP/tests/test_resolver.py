@@ -0,0 +1,77 @@
+from LISP.frontend.lexer import LispLexer
+from LISP.frontend.location import Location
+from LISP.frontend.parser import LispParser
+from LISP.frontend.resolver import Resolver
+from LISP.interpreter import LispInterpreter, compile_expr, compile_program
+import numpy as np
+import unittest
+
+def parse(code):
+    return list(LispParser(LispLexer(code), "<test_file>").parse_program())
+
+class TestResolver(unittest.TestCase):
+
+    def test_slots(self):
+        forms = parse("(set y (+ x 1))\n(set z (* y x))\n(set y (- z y))\n(return y)")
+        resolver = Resolver()
+        self.assertEqual(resolver.resolve_program(forms), forms)
+
+        # One dense slot per name, in order of first appearance
+        self.assertEqual(resolver.names, ["x", "y", "z"])
+        self.assertEqual(resolver.slots, {"x": 0, "y": 1, "z": 2})
+        set_y, set_z, reset_y, ret = forms
+        self.assertEqual((set_y.slot, set_y.expr.lhs.slot), (1, 0))
+        self.assertEqual((set_z.slot, set_z.expr.lhs.slot, set_z.expr.rhs.slot), (2, 1, 0))
+        self.assertEqual(reset_y.slot, 1)
+        self.assertEqual(ret.expr.slot, 1)
+
+        # x is read before anything sets it, so it is an input
+        self.assertEqual(resolver.inputs, {"x": Location("<test_file>", 1, 11)})
+
+    def test_inputs(self):
+        # A name read before its (set ...) is an input too
+        resolver = Resolver()
+        resolver.resolve_program(parse("(set a (+ b 1)) (set b 2) (return (+ a b))"))
+        self.assertEqual(list(resolver.inputs), ["b"])
+
+        # The value of a (set ...) is evaluated before the name is bound
+        resolver = Resolver()
+        resolver.resolve_program(parse("(set n (+ n 1))"))
+        self.assertEqual(list(resolver.inputs), ["n"])
+
+    def test_stops_at_return(self):
+        forms = parse("(set a 1) (return a) (return undefined)")
+        resolver = Resolver(inputs=())
+        self.assertEqual(resolver.resolve_program(forms), forms[:2])
+        self.assertEqual(forms[2].expr.slot, -1)
+
+    def test_undefined(self):
+        resolver = Resolver(inputs=["x"])
+        with self.assertRaises(NameError) as cm:
+            resolver.resolve_program(parse("(set y x)\n(return (matmul y  w))"))
+        self.assertIn("<test_file>:2:20: undefined variable 'w'", str(cm.exception))
+
+        # Found when compiling, with the inputs known
+        with self.assertRaises(NameError) as cm:
+            compile_program(parse("(return (+ x q))"), inputs=["x"])
+        self.assertIn("<test_file>:1:14", str(cm.exception))
+
+    def test_compiled_frames(self):
+        code = "(set A ([[1 2] [3 4]])) (set y (* x 2)) (set y (+ y x)) (return (multiply A y))"
+        program = compile_program(parse(code), inputs=["x", "unused"])
+        self.assertEqual(program.frame_size, 3)
+        self.assertEqual([(name, slot) for name, slot, _ in program.inputs], [("x", 1)])
+        for x in (0.5, -2.0):
+            self.assertTrue(np.array_equal(program({"x": x}), LispInterpreter({"x": x}).run(parse(code))))
+
+        # Missing inputs are reported at their first reference
+        with self.assertRaises(NameError) as cm:
+            program({})
+        self.assertIn("<test_file>:1:35", str(cm.exception))
+
+    def test_unresolved(self):
+        with self.assertRaises(ValueError):
+            compile_expr(parse("(set y x)")[0])
+
+if __name__ == '__main__':
+    unittest.main()
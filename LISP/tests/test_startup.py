@@ -0,0 +1,50 @@
+from LISP.compiler import CompileCache, CompileOptions
+import LISP
+import LISP.frontend
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+
+HEAVY = ("numpy", "xdsl.dialects.builtin", "xdsl.ir")
+
+def loaded_after(code):
+    # The heavy modules a fresh interpreter has imported after running code
+    script = f"import sys\n{code}\nprint(__import__('json').dumps([name for name in {HEAVY!r} if name in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+class TestStartup(unittest.TestCase):
+
+    def test_trivial_parse(self):
+        self.assertEqual(loaded_after(
+            "import LISP, LISP.frontend\n"
+            "list(LISP.frontend.LispParser(LISP.frontend.LispLexer('(set x (+ 1 2))')).parse_program())"
+        ), [])
+        # The first tensor literal brings in NumPy, and nothing else
+        self.assertEqual(loaded_after(
+            "from LISP.frontend.ast_table import ASTTable\n"
+            "ASTTable.parse('(set W ([[1 2] [3 4]]))')"
+        ), ["numpy"])
+
+    def test_compile_cache_hit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            CompileCache(directory).compile("(return (* x 2))", CompileOptions())
+            self.assertEqual(loaded_after(
+                "from LISP.compiler import CompileCache, CompileOptions\n"
+                f"assert CompileCache({directory!r}).compile('(return (* x 2))', CompileOptions()).forms\n"
+            ), [])
+
+    def test_lazy_names(self):
+        from LISP.compiler import compile_source
+        from LISP.frontend.parser import LispParser
+
+        self.assertIs(LISP.compile_source, compile_source)
+        self.assertIs(LISP.frontend.LispParser, LispParser)
+        self.assertIn("Instrumentation", dir(LISP))
+        with self.assertRaises(AttributeError):
+            LISP.frontend.missing
+
+if __name__ == '__main__':
+    unittest.main()